@@ -2,18 +2,25 @@
 API routes for the German Language Teaching Chatbot
 """
 
+import asyncio
 import time
 import hashlib
+from functools import partial
 from typing import Dict, Any
 from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from datetime import datetime
 
 from app.api.schemas import (
     ChatRequest, ChatResponse, ModelStatusResponse, 
-    HealthResponse, ErrorResponse, CacheStatsResponse
+    HealthResponse, CacheStatsResponse,
+    JobSubmitRequest, JobResponse
 )
-from app.models.model_manager import model_manager
+from app.jobs.broker import FINISHED
+from app.jobs.service import job_service
+from app.models.cancellation import CancellationToken, GenerationCancelled
+from app.models.model_manager import model_manager, ModelOverloadedError
+from app.routing.overflow import overflow_policy
 from app.utils.logging import ChatbotLogger
 from app.utils.config import get_config
 
@@ -28,13 +35,25 @@ cache_stats = {
     "total_requests": 0
 }
 
+# Non-standard status (as in nginx) for requests whose client went away
+CLIENT_CLOSED_REQUEST = 499
+
 def get_request_id(request: Request) -> str:
     """Generate a unique request ID"""
     return hashlib.md5(f"{request.url}{time.time()}".encode()).hexdigest()[:8]
 
+async def watch_disconnect(request: Request, cancel_token: CancellationToken, interval: float):
+    """Cancel the generation as soon as the client disconnects"""
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            cancel_token.cancel("client disconnected")
+            return
+        await asyncio.sleep(interval)
+
 @router.post("/chat", response_model=ChatResponse, summary="Chat with the German language tutor")
 async def chat_endpoint(
     request: ChatRequest,
+    http_request: Request,
     req: Request = Depends(get_request_id)
 ):
     """
@@ -54,8 +73,23 @@ async def chat_endpoint(
         
         start_time = time.time()
         
-        # Generate response
-        response = model_manager.chat(request.message, request.max_tokens)
+        # Generate in a worker thread so the event loop can watch for a client disconnect;
+        # under load the request may overflow to the secondary backend instead
+        cancel_token = CancellationToken()
+        watcher = asyncio.create_task(watch_disconnect(
+            http_request, cancel_token, get_config().get("server.disconnect_check_interval", 0.25)
+        ))
+        try:
+            response, backend = await overflow_policy.chat(
+                partial(model_manager.chat, request.message, request.max_tokens, cancel_token),
+                model_manager.system_prompt,
+                request.message,
+                request.max_tokens,
+                overloaded_errors=(ModelOverloadedError,),
+                cancel_token=cancel_token
+            )
+        finally:
+            watcher.cancel()
         
         response_time = time.time() - start_time
         
@@ -75,23 +109,138 @@ async def chat_endpoint(
         
         logger.info("Chat response generated",
                    request_id=request_id,
+                   backend=backend,
                    response_time=response_time,
                    tokens_generated=tokens_generated)
         
         return ChatResponse(
             response=response,
             cached=False,  # No cache implementation yet
+            backend=backend,
             response_time=response_time,
             tokens_generated=tokens_generated,
             model_info=model_info
         )
         
+    except GenerationCancelled as e:
+        logger.info("Chat request cancelled",
+                   request_id=req,
+                   reason=e.reason,
+                   tokens_saved=e.tokens_saved)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except ModelOverloadedError as e:
+        logger.warning("Chat request shed",
+                      request_id=req,
+                      error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error("Error in chat endpoint", 
                     request_id=req,
                     error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def _job_response(job) -> JobResponse:
+    data = job.to_dict()
+    data["job_id"] = data.pop("id")
+    data.pop("payload")
+    return JobResponse(**data)
+
+@router.post("/jobs", response_model=JobResponse, status_code=202, summary="Submit a background generation job")
+async def submit_job_endpoint(request: JobSubmitRequest):
+    """
+    Queue a long generation instead of waiting for it inside the HTTP request.
+    Poll `/jobs/{job_id}` or stream `/jobs/{job_id}/stream` for the result.
+    
+    - **kind**: `chat` (one `message`) or `batch` (several `messages`)
+    - **max_tokens**: Maximum number of tokens per response (optional)
+    """
+    if request.kind == "chat" and not request.message:
+        raise HTTPException(status_code=422, detail="chat jobs need a message")
+    if request.kind == "batch" and not request.messages:
+        raise HTTPException(status_code=422, detail="batch jobs need messages")
+    
+    try:
+        payload = {"max_tokens": request.max_tokens}
+        if request.kind == "chat":
+            payload["message"] = request.message
+        else:
+            payload["messages"] = request.messages
+        job = job_service.submit(request.kind, payload)
+        return _job_response(job)
+        
+    except Exception as e:
+        logger.error("Error submitting job", error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/jobs/metrics", summary="Job queue metrics")
+async def job_metrics_endpoint():
+    """
+    Queue depth, job counts and p50/p95 queue wait, run time and end-to-end latency.
+    """
+    try:
+        return job_service.get_metrics()
+    except Exception as e:
+        logger.error("Error getting job metrics", error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, summary="Get job status and result")
+async def get_job_endpoint(job_id: str):
+    """
+    Current status of a job; `result` is set once the job is done.
+    """
+    job = job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/jobs/{job_id}/stream", summary="Stream job status updates")
+async def stream_job_endpoint(job_id: str):
+    """
+    Server-sent events with the job state on every status change; the last event
+    carries the result. The stream ends when the job finishes.
+    """
+    if job_service.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        last_status = None
+        while True:
+            job = job_service.get(job_id)
+            if job is None:
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: {job.status.value}\ndata: {_job_response(job).json()}\n\n"
+            if job.status in FINISHED:
+                return
+            await asyncio.sleep(job_service.poll_interval)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse, summary="Cancel a queued job")
+async def cancel_job_endpoint(job_id: str):
+    """
+    Cancel a job that has not started yet.
+    """
+    if not job_service.cancel(job_id):
+        job = job_service.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value} and cannot be cancelled")
+    return _job_response(job_service.get(job_id))
+
+@router.get("/backends/metrics", summary="Local and overflow backend metrics")
+async def backend_metrics_endpoint():
+    """
+    Requests and p50/p95 latency per serving backend, the local queue and its
+    estimated wait, and the overflow backend's concurrency and circuit state.
+    """
+    try:
+        return overflow_policy.get_metrics()
+    except Exception as e:
+        logger.error("Error getting backend metrics", error=str(e))
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.get("/model/status", response_model=ModelStatusResponse, summary="Get model status")
 async def model_status_endpoint():
     """
@@ -143,7 +292,7 @@ async def readiness_check():
     Readiness check endpoint to verify the service is ready to handle requests.
     """
     try:
-        if model_manager.model is None:
+        if not model_manager.is_available():
             raise HTTPException(status_code=503, detail="Model not loaded")
         
         return {"status": "ready", "timestamp": datetime.utcnow()}
@@ -230,23 +379,3 @@ async def get_config_endpoint():
     except Exception as e:
         logger.error("Error getting configuration", error=str(e))
         raise HTTPException(status_code=500, detail="Internal server error")
-
-@router.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    """Global exception handler"""
-    request_id = get_request_id(request)
-    
-    logger.error("Unhandled exception",
-                request_id=request_id,
-                error=str(exc),
-                path=request.url.path)
-    
-    return JSONResponse(
-        status_code=500,
-        content=ErrorResponse(
-            error="Internal server error",
-            error_type=type(exc).__name__,
-            timestamp=datetime.utcnow(),
-            request_id=request_id
-        ).dict()
-    ) 
\ No newline at end of file
@@ -2,8 +2,8 @@
 Pydantic schemas for the German Language Teaching Chatbot API
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 class ChatRequest(BaseModel):
@@ -12,6 +12,7 @@ class ChatRequest(BaseModel):
     max_tokens: Optional[int] = Field(256, description="Maximum tokens to generate", ge=1, le=1000)
     temperature: Optional[float] = Field(0.2, description="Sampling temperature", ge=0.0, le=2.0)
     top_p: Optional[float] = Field(0.9, description="Top-p sampling", ge=0.0, le=1.0)
+    session_id: Optional[str] = Field(None, description="Conversation ID; the router keeps a session on one replica", max_length=128)
     
     class Config:
         schema_extra = {
@@ -27,6 +28,7 @@ class ChatResponse(BaseModel):
     """Response schema for chat endpoint"""
     response: str = Field(..., description="Generated response")
     cached: bool = Field(False, description="Whether response was served from cache")
+    backend: str = Field("local", description="Backend that served the request: local or overflow")
     response_time: float = Field(..., description="Response generation time in seconds")
     tokens_generated: Optional[int] = Field(None, description="Number of tokens generated")
     model_info: Optional[Dict[str, Any]] = Field(None, description="Model information")
@@ -36,6 +38,7 @@ class ChatResponse(BaseModel):
             "example": {
                 "response": "Wissen и kennen - это два немецких глагола, которые переводятся как 'знать'...",
                 "cached": False,
+                "backend": "local",
                 "response_time": 2.5,
                 "tokens_generated": 45,
                 "model_info": {
@@ -52,10 +55,16 @@ class ModelStatusResponse(BaseModel):
     tokenizer_loaded: bool = Field(..., description="Whether tokenizer is loaded")
     device: str = Field(..., description="Device being used (cuda/cpu)")
     load_time: float = Field(..., description="Model load time in seconds")
+    weights_source: Optional[str] = Field(None, description="Where the weights came from: artifact (pre-quantized cache) or model (source weights)")
     total_inferences: int = Field(..., description="Total number of inferences")
     total_tokens_generated: int = Field(..., description="Total tokens generated")
     gpu_memory_gb: float = Field(..., description="GPU memory usage in GB")
     system_prompt: str = Field(..., description="System prompt being used")
+    idle_unloaded: bool = Field(False, description="Whether the model was unloaded while idle and will reload on the next request")
+    active_requests: int = Field(0, description="Requests currently being generated")
+    cancellation: Optional[Dict[str, Any]] = Field(None, description="Requests cancelled by client disconnects and decode tokens saved")
+    kv_cache: Optional[Dict[str, Any]] = Field(None, description="KV cache strategy and KV memory admission counters")
+    memory: Optional[Dict[str, Any]] = Field(None, description="Memory watchdog status and counters")
     
     class Config:
         schema_extra = {
@@ -67,7 +76,18 @@ class ModelStatusResponse(BaseModel):
                 "total_inferences": 42,
                 "total_tokens_generated": 1250,
                 "gpu_memory_gb": 3.2,
-                "system_prompt": "Ты — преподаватель немецкого языка для русскоязычных студентов уровня A2..."
+                "system_prompt": "Ты — преподаватель немецкого языка для русскоязычных студентов уровня A2...",
+                "idle_unloaded": False,
+                "active_requests": 1,
+                "memory": {
+                    "pressure_level": "normal",
+                    "rss_gb": 2.1,
+                    "usage_ratio": 0.41,
+                    "shedding": False,
+                    "shed_requests": 0,
+                    "idle_unloads": 0,
+                    "lazy_reloads": 0
+                }
             }
         }
 
@@ -124,4 +144,54 @@ class CacheStatsResponse(BaseModel):
                 "hit_rate": 0.25,
                 "total_requests": 100
             }
-        } 
\ No newline at end of file
+        }
+
+
+class JobSubmitRequest(BaseModel):
+    """Request schema for submitting a background job"""
+    kind: Literal["chat", "batch"] = Field("chat", description="chat: one message; batch: several messages")
+    message: Optional[str] = Field(None, description="User message (chat jobs)", min_length=1, max_length=8000)
+    messages: Optional[List[str]] = Field(None, description="User messages (batch jobs)", min_length=1, max_length=256)
+    max_tokens: Optional[int] = Field(None, description="Maximum tokens to generate per response", ge=1, le=1000)
+    
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "kind": "batch",
+            "messages": [
+                "Проверь упражнение: Ich habe gestern ins Kino gegangen.",
+                "Объясни порядок слов в придаточном предложении с weil"
+            ],
+            "max_tokens": 512
+        }
+    })
+
+
+class JobResponse(BaseModel):
+    """Response schema for job submission and status"""
+    job_id: str = Field(..., description="Job ID")
+    kind: str = Field(..., description="Job kind")
+    status: str = Field(..., description="queued, running, done, failed or cancelled")
+    submitted_at: float = Field(..., description="Submission time (unix seconds)")
+    started_at: Optional[float] = Field(None, description="Processing start time (unix seconds)")
+    finished_at: Optional[float] = Field(None, description="Completion time (unix seconds)")
+    queue_wait: Optional[float] = Field(None, description="Seconds spent in the queue")
+    run_time: Optional[float] = Field(None, description="Seconds spent processing")
+    result: Optional[Dict[str, Any]] = Field(None, description="response (chat) or responses (batch) and tokens_generated")
+    error: Optional[str] = Field(None, description="Error message for failed jobs (or why the last attempt was retried)")
+    attempts: int = Field(0, description="Retries after the model was too busy")
+    
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "job_id": "5f0c1e9a7b2d4c3e8a6f1b0d9c8e7a6b",
+            "kind": "chat",
+            "status": "done",
+            "submitted_at": 1705314600.0,
+            "started_at": 1705314600.4,
+            "finished_at": 1705314642.9,
+            "queue_wait": 0.4,
+            "run_time": 42.5,
+            "result": {"response": "Правильно: Ich bin gestern ins Kino gegangen...", "tokens_generated": 120},
+            "error": None,
+            "attempts": 0
+        }
+    })
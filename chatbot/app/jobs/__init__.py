@@ -0,0 +1,3 @@
+"""
+Background jobs for the German Language Teaching Chatbot
+"""
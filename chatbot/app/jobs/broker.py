@@ -0,0 +1,438 @@
+"""
+Job brokers for the German Language Teaching Chatbot
+
+A broker stores background jobs and hands queued jobs to workers. Two
+implementations run without external services: ``LocalBroker`` keeps jobs in
+process memory, ``SQLiteBroker`` persists them in a SQLite file so jobs survive
+restarts and can be shared by several server processes. Other brokers can be
+plugged in with ``register_broker``.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobStatus(str, Enum):
+    """Lifecycle of a background job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+@dataclass
+class Job:
+    """A chat or batch generation job"""
+    kind: str
+    payload: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    # A requeued job is not claimed before this time
+    available_at: Optional[float] = None
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        """Seconds between submission and the start of processing"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_time(self) -> Optional[float]:
+        """Seconds spent processing"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["status"] = self.status.value
+        data["queue_wait"] = self.queue_wait
+        data["run_time"] = self.run_time
+        return data
+
+
+class JobBroker:
+    """Interface every broker implements"""
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Job:
+        """Queue a new job"""
+        raise NotImplementedError
+
+    def claim(self, max_jobs: int, timeout: float) -> List[Job]:
+        """
+        Take up to ``max_jobs`` queued jobs (oldest first) and mark them running
+
+        Args:
+            max_jobs: Maximum number of jobs to return
+            timeout: Seconds to wait for the first job
+
+        Returns:
+            Claimed jobs, empty if none arrived within the timeout
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        raise NotImplementedError
+
+    def fail(self, job_id: str, error: str):
+        raise NotImplementedError
+
+    def requeue(self, job_id: str, delay: float, error: str):
+        """
+        Put a running job back in the queue for another attempt
+
+        Args:
+            job_id: Running job
+            delay: Seconds before the job can be claimed again
+            error: Why the attempt did not finish (kept on the job until it does)
+        """
+        raise NotImplementedError
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        raise NotImplementedError
+
+    def oldest_queued_age(self) -> float:
+        """Age in seconds of the oldest queued job (0 if the queue is empty)"""
+        raise NotImplementedError
+
+    def expire(self, time_limit: float) -> int:
+        """Fail running jobs older than ``time_limit`` (e.g. their worker died)"""
+        raise NotImplementedError
+
+    def prune(self, max_age: float) -> int:
+        """Delete finished jobs older than ``max_age`` seconds"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBroker(JobBroker):
+    """In-process broker; jobs are lost on restart"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: List[str] = []
+        self._condition = threading.Condition()
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Job:
+        job = Job(kind=kind, payload=payload)
+        with self._condition:
+            self._jobs[job.id] = job
+            self._queue.append(job.id)
+            self._condition.notify()
+        return job
+
+    def _available(self, now: float) -> List[str]:
+        return [job_id for job_id in self._queue
+                if (self._jobs[job_id].available_at or 0.0) <= now]
+
+    def claim(self, max_jobs: int, timeout: float) -> List[Job]:
+        deadline = time.time() + timeout
+        with self._condition:
+            now = time.time()
+            available = self._available(now)
+            while not available and now < deadline:
+                # Sleep until a submit, the deadline or the next delayed job, whichever comes first
+                delayed = [self._jobs[job_id].available_at for job_id in self._queue]
+                wake = min([deadline] + [t for t in delayed if t is not None])
+                self._condition.wait(max(0.0, wake - now))
+                now = time.time()
+                available = self._available(now)
+            claimed = []
+            for job_id in available[:max_jobs]:
+                self._queue.remove(job_id)
+                job = self._jobs[job_id]
+                job.status = JobStatus.RUNNING
+                job.started_at = now
+                claimed.append(job)
+            return claimed
+
+    def _finish(self, job_id: str, status: JobStatus, result: Optional[Dict[str, Any]], error: Optional[str]):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, JobStatus.DONE, result, None)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JobStatus.FAILED, None, error)
+
+    def requeue(self, job_id: str, delay: float, error: str):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.RUNNING:
+                return
+            job.status = JobStatus.QUEUED
+            job.started_at = None
+            job.attempts += 1
+            job.error = error
+            job.available_at = time.time() + delay
+            self._queue.append(job_id)
+            self._condition.notify()
+
+    def cancel(self, job_id: str) -> bool:
+        with self._condition:
+            if job_id not in self._queue:
+                return False
+            self._queue.remove(job_id)
+        self._finish(job_id, JobStatus.CANCELLED, None, None)
+        return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            # Snapshot, so callers never see a job change under them
+            return replace(job) if job else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._condition:
+            counts = {status.value: 0 for status in JobStatus}
+            for job in self._jobs.values():
+                counts[job.status.value] += 1
+            return counts
+
+    def oldest_queued_age(self) -> float:
+        with self._condition:
+            if not self._queue:
+                return 0.0
+            return time.time() - self._jobs[self._queue[0]].submitted_at
+
+    def expire(self, time_limit: float) -> int:
+        cutoff = time.time() - time_limit
+        with self._condition:
+            stale = [j.id for j in self._jobs.values() if j.status == JobStatus.RUNNING and j.started_at < cutoff]
+        for job_id in stale:
+            self.fail(job_id, "Task time limit exceeded")
+        return len(stale)
+
+    def prune(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._condition:
+            old = [j.id for j in self._jobs.values() if j.status in FINISHED and j.finished_at < cutoff]
+            for job_id in old:
+                del self._jobs[job_id]
+            return len(old)
+
+
+class SQLiteBroker(JobBroker):
+    """Persistent broker backed by a SQLite file (WAL mode, safe across processes)"""
+
+    def __init__(self, path: str, poll_interval: float = 0.1):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " submitted_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, submitted_at);"
+        )
+        # Job files created before retries were added
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "attempts" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        if "available_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        return Job(
+            id=row[0],
+            kind=row[1],
+            payload=json.loads(row[2]),
+            status=JobStatus(row[3]),
+            submitted_at=row[4],
+            started_at=row[5],
+            finished_at=row[6],
+            result=json.loads(row[7]) if row[7] else None,
+            error=row[8],
+            attempts=row[9],
+            available_at=row[10]
+        )
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Job:
+        job = Job(kind=kind, payload=payload)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, kind, json.dumps(payload, ensure_ascii=False), job.status.value, job.submitted_at)
+            )
+        return job
+
+    def _claim_once(self, max_jobs: int) -> List[Job]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes never claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND (available_at IS NULL OR available_at <= ?)"
+                    " ORDER BY submitted_at LIMIT ?",
+                    (JobStatus.QUEUED.value, now, max_jobs)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                    [(JobStatus.RUNNING.value, now, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        jobs = [self._row_to_job(row) for row in rows]
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.started_at = now
+        return jobs
+
+    def claim(self, max_jobs: int, timeout: float) -> List[Job]:
+        deadline = time.time() + timeout
+        while True:
+            jobs = self._claim_once(max_jobs)
+            if jobs or time.time() >= deadline:
+                return jobs
+            time.sleep(self.poll_interval)
+
+    def _finish(self, job_id: str, status: JobStatus, result: Optional[Dict[str, Any]], error: Optional[str],
+                from_status: JobStatus) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (status.value, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job_id, from_status.value)
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, JobStatus.DONE, result, None, JobStatus.RUNNING)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JobStatus.FAILED, None, error, JobStatus.RUNNING)
+
+    def requeue(self, job_id: str, delay: float, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, attempts = attempts + 1, error = ?, available_at = ?"
+                " WHERE id = ? AND status = ?",
+                (JobStatus.QUEUED.value, error, time.time() + delay, job_id, JobStatus.RUNNING.value)
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        return self._finish(job_id, JobStatus.CANCELLED, None, None, JobStatus.QUEUED)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        counts = {status.value: 0 for status in JobStatus}
+        with self._lock:
+            for status, count in self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+    def oldest_queued_age(self) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(submitted_at) FROM jobs WHERE status = ?", (JobStatus.QUEUED.value,)
+            ).fetchone()
+        return time.time() - row[0] if row[0] is not None else 0.0
+
+    def expire(self, time_limit: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND started_at < ?",
+                (JobStatus.FAILED.value, "Task time limit exceeded", time.time(), JobStatus.RUNNING.value,
+                 time.time() - time_limit)
+            )
+            return cursor.rowcount
+
+    def prune(self, max_age: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+                (*[s.value for s in FINISHED], time.time() - max_age)
+            )
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+BrokerFactory = Callable[[str], JobBroker]
+
+_BROKERS: Dict[str, BrokerFactory] = {
+    "local": lambda url: LocalBroker(),
+    "sqlite": lambda url: SQLiteBroker(url[len("sqlite:///"):])
+}
+
+
+def register_broker(scheme: str, factory: BrokerFactory):
+    """
+    Register a broker implementation for a URL scheme
+
+    Args:
+        scheme: URL scheme, e.g. "redis"
+        factory: Callable creating the broker from the full URL
+    """
+    _BROKERS[scheme] = factory
+
+
+def create_broker(url: str) -> JobBroker:
+    """
+    Create a broker from ``queue.broker``: "local", "sqlite:///relative.db" or "sqlite:////absolute.db"
+
+    Raises:
+        ValueError: If no broker is registered for the URL scheme
+    """
+    scheme = url.split("://", 1)[0] if "://" in url else url
+    if scheme not in _BROKERS:
+        raise ValueError(f"No job broker registered for '{scheme}' (available: {', '.join(sorted(_BROKERS))})")
+    return _BROKERS[scheme](url)
@@ -0,0 +1,271 @@
+"""
+Background job service for the German Language Teaching Chatbot
+
+Long generations (worksheet analyses, batches of messages) do not fit into the
+HTTP request timeout. Clients submit them as jobs and poll or stream the
+result; worker threads claim queued jobs from the broker in batches and run
+them through the model manager's batched generation.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.jobs.broker import Job, JobBroker, create_broker
+from app.models.model_manager import BatchResult, ModelManager, ModelOverloadedError, model_manager
+from app.utils.config import get_config
+from app.utils.logging import ChatbotLogger
+
+logger = ChatbotLogger("Jobs")
+
+JOB_KINDS = ("chat", "batch")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class JobWorker(threading.Thread):
+    """Claims jobs from the broker and processes them in batches"""
+
+    def __init__(self, service: "JobService", name: str):
+        super().__init__(name=name, daemon=True)
+        self.service = service
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        service = self.service
+        while not self._stop_event.is_set():
+            try:
+                jobs = service.broker.claim(service.batch_size, timeout=service.poll_interval)
+                if not jobs:
+                    continue
+                # Give concurrent submissions a moment to join the batch
+                if len(jobs) < service.batch_size and service.batch_wait > 0:
+                    time.sleep(service.batch_wait)
+                    jobs += service.broker.claim(service.batch_size - len(jobs), timeout=0)
+                service.process(jobs)
+            except Exception as e:
+                logger.error("Job worker error", worker=self.name, error=str(e))
+                time.sleep(service.poll_interval)
+
+
+class JobService:
+    """Job submission, worker pool and job/queue metrics"""
+
+    def __init__(self, manager: ModelManager = model_manager):
+        self.model_manager = manager
+        self.broker: Optional[JobBroker] = None
+        self.workers: List[JobWorker] = []
+        self._housekeeping_thread: Optional[threading.Thread] = None
+        self._housekeeping_stop = threading.Event()
+        self._configure()
+        # Batch size, waits and limits follow config reloads; the broker is fixed at start
+        get_config().subscribe("queue", lambda snapshot, changed: self._configure())
+
+        self._lock = threading.Lock()
+        self._samples: deque = deque(maxlen=1000)
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "batches": 0,
+            "batched_messages": 0,
+            "retried": 0,
+            "expired": 0
+        }
+
+    def _configure(self):
+        config = get_config()
+        self.broker_url = config.get("queue.broker", "local")
+        self.num_workers = config.get("queue.workers", 1)
+        self.batch_size = config.get("queue.batch_size", 8)
+        self.batch_wait = config.get("queue.batch_wait", 0.05)
+        self.poll_interval = config.get("queue.poll_interval", 0.5)
+        self.time_limit = config.get("queue.task_time_limit", 1800)
+        self.result_ttl = config.get("queue.result_ttl", 86400)
+        self.max_retries = config.get("queue.max_retries", 3)
+        self.retry_delay = config.get("queue.retry_delay", 5.0)
+        self.housekeeping_interval = config.get("queue.housekeeping_interval", 60)
+
+    def start(self):
+        """Create the broker and start the worker and housekeeping threads"""
+        if self.workers:
+            return
+        if self.broker is None:
+            self.broker = create_broker(self.broker_url)
+        for i in range(self.num_workers):
+            worker = JobWorker(self, name=f"job-worker-{i}")
+            worker.start()
+            self.workers.append(worker)
+        # Expiry runs on its own timer: busy workers never see an empty queue
+        self._housekeeping_stop.clear()
+        self._housekeeping_thread = threading.Thread(target=self._run_housekeeping, name="job-housekeeping",
+                                                     daemon=True)
+        self._housekeeping_thread.start()
+        logger.info("Job workers started", broker=self.broker_url, workers=self.num_workers,
+                    batch_size=self.batch_size)
+
+    def stop(self):
+        """Stop the workers (running batches finish) and close the broker"""
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join(timeout=self.poll_interval + 5)
+        self.workers = []
+        self._housekeeping_stop.set()
+        if self._housekeeping_thread is not None:
+            self._housekeeping_thread.join(timeout=5)
+            self._housekeeping_thread = None
+        if self.broker is not None:
+            self.broker.close()
+            self.broker = None
+
+    # Client side
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Job:
+        """
+        Queue a job
+
+        Args:
+            kind: "chat" (payload: message, max_tokens) or "batch" (payload: messages, max_tokens)
+            payload: Job arguments
+
+        Returns:
+            The queued job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job = self.broker.submit(kind, payload)
+        with self._lock:
+            self.stats["submitted"] += 1
+        logger.info("Job submitted", job_id=job.id, kind=kind)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.broker.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        cancelled = self.broker.cancel(job_id)
+        if cancelled:
+            with self._lock:
+                self.stats["cancelled"] += 1
+        return cancelled
+
+    # Worker side
+
+    def process(self, jobs: List[Job]):
+        """Run claimed jobs; messages with the same max_tokens share generate() batches"""
+        groups: Dict[Optional[int], List[tuple]] = {}
+        for job in jobs:
+            messages = [job.payload["message"]] if job.kind == "chat" else list(job.payload["messages"])
+            groups.setdefault(job.payload.get("max_tokens"), []).append((job, messages))
+
+        for max_tokens, entries in groups.items():
+            flat = [m for _, messages in entries for m in messages]
+            try:
+                results = self.model_manager.chat_batch(flat, max_tokens, batch_size=self.batch_size)
+            except ModelOverloadedError as e:
+                for job, _ in entries:
+                    self._retry(job, str(e))
+                continue
+            except Exception as e:
+                for job, _ in entries:
+                    self._finish(job, error=str(e))
+                continue
+
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["batched_messages"] += len(flat)
+            offset = 0
+            for job, messages in entries:
+                chunk: List[BatchResult] = results[offset:offset + len(messages)]
+                offset += len(messages)
+                failed = [r for r in chunk if not r.ok]
+                if failed and all(r.retryable for r in failed):
+                    self._retry(job, failed[0].error)
+                elif failed:
+                    self._finish(job, error=next(r.error for r in failed if not r.retryable))
+                elif job.kind == "chat":
+                    self._finish(job, result={"response": chunk[0].response,
+                                              "tokens_generated": chunk[0].tokens_generated})
+                else:
+                    self._finish(job, result={"responses": [r.response for r in chunk],
+                                              "tokens_generated": sum(r.tokens_generated for r in chunk)})
+
+    def _retry(self, job: Job, reason: str):
+        """Requeue a job the model was too busy for, with exponential backoff, or fail it"""
+        if job.attempts >= self.max_retries:
+            self._finish(job, error=f"{reason} (gave up after {job.attempts + 1} attempts)")
+            return
+        delay = self.retry_delay * 2 ** job.attempts
+        self.broker.requeue(job.id, delay, reason)
+        with self._lock:
+            self.stats["retried"] += 1
+        logger.warning("Job requeued", job_id=job.id, attempt=job.attempts + 1, delay=delay, reason=reason)
+
+    def _finish(self, job: Job, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        finished_at = time.time()
+        if error is None:
+            self.broker.complete(job.id, result)
+        else:
+            self.broker.fail(job.id, error)
+            logger.error("Job failed", job_id=job.id, error=error)
+        with self._lock:
+            self.stats["completed" if error is None else "failed"] += 1
+            self._samples.append((job.started_at - job.submitted_at, finished_at - job.started_at,
+                                  finished_at - job.submitted_at))
+
+    def _run_housekeeping(self):
+        while not self._housekeeping_stop.wait(self.housekeeping_interval):
+            try:
+                self.housekeeping()
+            except Exception as e:
+                logger.error("Job housekeeping failed", error=str(e))
+
+    def housekeeping(self):
+        """Fail jobs over task_time_limit and prune old results"""
+        expired = self.broker.expire(self.time_limit)
+        self.broker.prune(self.result_ttl)
+        if expired:
+            with self._lock:
+                self.stats["expired"] += expired
+            logger.warning("Expired jobs over the time limit", count=expired)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Queue depth and job-level latency percentiles"""
+        with self._lock:
+            samples = list(self._samples)
+            stats = dict(self.stats)
+        waits = [s[0] for s in samples]
+        runs = [s[1] for s in samples]
+        latencies = [s[2] for s in samples]
+        counts = self.broker.counts() if self.broker else {}
+        return {
+            "broker": self.broker_url,
+            "workers": len(self.workers),
+            "queue_depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "oldest_queued_age": self.broker.oldest_queued_age() if self.broker else 0.0,
+            "jobs_by_status": counts,
+            **stats,
+            "avg_batch_size": stats["batched_messages"] / stats["batches"] if stats["batches"] else 0.0,
+            "queue_wait_p50": _percentile(waits, 50),
+            "queue_wait_p95": _percentile(waits, 95),
+            "run_time_p50": _percentile(runs, 50),
+            "run_time_p95": _percentile(runs, 95),
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p95": _percentile(latencies, 95)
+        }
+
+
+# Global job service instance
+job_service = JobService()
@@ -7,10 +7,14 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from contextlib import asynccontextmanager
 
 from app.api.routes import router
+from app.jobs.service import job_service
 from app.models.model_manager import model_manager
+from app.routing.overflow import overflow_policy
 from app.utils.config import get_config
 from app.utils.logging import setup_logging, ChatbotLogger
 
@@ -37,12 +41,26 @@ async def lifespan(app: FastAPI):
         logger.error("Failed to load model during startup")
         raise RuntimeError("Model loading failed")
     
+    # Start memory watchdog (cache shrinking, load shedding, idle unload)
+    model_manager.start_watchdog()
+    
+    # Background job workers (long generations outside the request timeout)
+    job_service.start()
+    
+    # Hot-reload chatbot/config/*.yaml; subscribers pick up the new snapshot
+    if config.get("config.watch", True):
+        config.start_watcher(config.get("config.watch_interval", 2.0))
+    
     logger.info("Application startup complete")
     
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    config.stop_watcher()
+    job_service.stop()
+    await overflow_policy.close()
+    model_manager.stop_watchdog()
     model_manager.unload_model()
     logger.info("Application shutdown complete")
 
@@ -75,23 +93,45 @@ if trusted_hosts:
     )
 
 # Request timing middleware
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """Add processing time to response headers"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
+class ProcessTimeMiddleware:
+    """
+    Add processing time to response headers and log the request
     
-    # Log request
-    logger.log_request(
-        method=request.method,
-        path=str(request.url.path),
-        status_code=response.status_code,
-        duration=process_time
-    )
+    Plain ASGI rather than ``@app.middleware("http")``: BaseHTTPMiddleware wraps
+    ``receive``, so ``request.is_disconnected()`` never sees the client leave
+    and /chat could not cancel its generation.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
     
-    return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.time()
+        status_code = 500
+        
+        async def send_with_process_time(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Process-Time", str(time.time() - start_time))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_process_time)
+        finally:
+            # Log request
+            logger.log_request(
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                duration=time.time() - start_time
+            )
+
+app.add_middleware(ProcessTimeMiddleware)
 
 # Include API routes
 app.include_router(router, prefix="/api/v1", tags=["chatbot"])
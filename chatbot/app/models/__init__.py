@@ -0,0 +1,3 @@
+"""
+Model management for the German Language Teaching Chatbot
+"""
@@ -0,0 +1,74 @@
+"""
+Generation cancellation for the German Language Teaching Chatbot
+
+A ``CancellationToken`` is created per request and set when the client goes
+away. ``CancellationCriteria`` checks it after every decoding step, so
+``generate()`` returns within one token and the request's KV memory is
+released immediately instead of after ``max_new_tokens``. Requests served by
+the overflow backend register a callback that cancels the backend call.
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised when a generation was stopped because its request was cancelled"""
+
+    def __init__(self, reason: str, tokens_generated: int = 0, tokens_saved: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.tokens_generated = tokens_generated
+        self.tokens_saved = tokens_saved
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag shared by the route and the generating thread"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Call ``callback`` on cancellation (right away if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class CancellationCriteria(StoppingCriteria):
+    """Stops every sequence of the batch once the token is cancelled"""
+
+    def __init__(self, token: CancellationToken):
+        self.token = token
+        self.steps = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        self.steps += 1
+        return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,243 @@
+"""
+KV-cache strategies and memory accounting for the German Language Teaching Chatbot
+
+Long conversations and long generations make the KV cache the largest
+per-request allocation. ``KVCachePolicy`` selects how the cache is kept during
+``generate()``:
+
+- ``dynamic``: the default full-precision cache
+- ``quantized``: keys/values quantized to ``nbits`` (the most recent
+  ``residual_length`` tokens stay in full precision)
+- ``offloaded``: layers not being computed live in CPU memory (CUDA only)
+- ``sliding_window``: only the last ``window_length`` tokens are cached and
+  attended to, so the cache stops growing once a conversation is longer
+
+A strategy that cannot run here (no quantization backend, no CUDA) falls back
+to ``dynamic`` when the policy is bound to the model, so memory estimates
+always describe the cache ``generate()`` really uses. It also estimates the
+accelerator memory a request's cache needs, and ``KVMemoryBudget`` admits
+requests while their estimates fit the budget.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import torch
+
+from app.models.memory_watchdog import parse_memory_size
+from app.utils.logging import ChatbotLogger
+
+logger = ChatbotLogger("KVCache")
+
+STRATEGIES = ("dynamic", "quantized", "offloaded", "sliding_window")
+
+
+class KVBudgetExceeded(RuntimeError):
+    """Raised when a request's KV cache cannot be admitted within the budget"""
+
+
+class KVCachePolicy:
+    """KV-cache strategy and per-token memory model of the loaded model"""
+
+    def __init__(
+        self,
+        strategy: str = "dynamic",
+        nbits: int = 4,
+        backend: str = "quanto",
+        residual_length: int = 128,
+        window_length: int = 1024
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown KV cache strategy '{strategy}' (expected one of {', '.join(STRATEGIES)})")
+        self.strategy = strategy
+        self.nbits = nbits
+        self.backend = backend
+        self.residual_length = residual_length
+        self.window_length = window_length
+
+        self.num_layers = 0
+        self.element_bytes = 2
+        self.bytes_per_token_full = 0
+
+    @classmethod
+    def from_config(cls, kv_config: Dict[str, Any]) -> "KVCachePolicy":
+        """Create a policy from the ``kv_cache`` config section"""
+        return cls(
+            strategy=kv_config.get("strategy", "dynamic"),
+            nbits=kv_config.get("nbits", 4),
+            backend=kv_config.get("backend", "quanto"),
+            residual_length=kv_config.get("residual_length", 128),
+            window_length=kv_config.get("window_length", 1024)
+        )
+
+    def bind(self, model, device: str):
+        """
+        Read the cache geometry from the loaded model and check the strategy is usable
+
+        Args:
+            model: Loaded (possibly PEFT-wrapped) causal LM
+            device: "cuda" or "cpu"
+        """
+        config = model.config
+        heads = config.num_attention_heads
+        kv_heads = getattr(config, "num_key_value_heads", None) or heads
+        head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+        self.num_layers = config.num_hidden_layers
+        # Quantized weights report int8/uint8; the cache uses the compute dtype
+        dtype = next((p.dtype for p in model.parameters() if p.is_floating_point()), torch.float16)
+        self.element_bytes = torch.tensor([], dtype=dtype).element_size()
+        # Keys and values for every layer
+        self.bytes_per_token_full = 2 * self.num_layers * kv_heads * head_dim * self.element_bytes
+
+        # The sliding-window cache takes its window from the model config; start from the model's own
+        # window so a previous policy's window does not stay in effect
+        if not hasattr(model, "_native_sliding_window"):
+            model._native_sliding_window = getattr(config, "sliding_window", None)
+        native_window = model._native_sliding_window
+        config.sliding_window = native_window
+        if self.strategy == "sliding_window":
+            self.window_length = min(self.window_length, native_window or self.window_length)
+            config.sliding_window = self.window_length
+
+        if self.strategy == "offloaded" and device != "cuda":
+            logger.warning("Offloaded KV cache needs CUDA, using the dynamic cache")
+            self.strategy = "dynamic"
+        if self.strategy != "dynamic":
+            # Cache construction checks the backend package, nbits and model support; fail here, not per request
+            error = self._probe(model)
+            if error is not None:
+                logger.warning("KV cache strategy is not usable, using the dynamic cache",
+                               strategy=self.strategy, error=error)
+                self.strategy = "dynamic"
+                config.sliding_window = native_window
+
+        logger.info("KV cache configured",
+                    strategy=self.strategy,
+                    window_length=self.window_length if self.strategy == "sliding_window" else None,
+                    kv_bytes_per_token=self.bytes_per_token_full,
+                    layers=self.num_layers)
+
+    def _probe(self, model) -> Optional[str]:
+        """Generate one token with the strategy; returns the error if it cannot run"""
+        input_ids = torch.tensor([[model.config.bos_token_id or 0]], device=model.device)
+        try:
+            with torch.inference_mode():
+                model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                               max_new_tokens=1, do_sample=False, pad_token_id=0, **self.generation_kwargs())
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    def generation_kwargs(self) -> Dict[str, Any]:
+        """Extra ``generate()`` arguments for the strategy (a fresh cache object per call)"""
+        if self.strategy == "quantized":
+            return {
+                "cache_implementation": "quantized",
+                "cache_config": {"backend": self.backend, "nbits": self.nbits,
+                                 "residual_length": self.residual_length}
+            }
+        if self.strategy == "offloaded":
+            return {"cache_implementation": "offloaded"}
+        if self.strategy == "sliding_window":
+            return {"cache_implementation": "sliding_window"}
+        return {}
+
+    def estimate_bytes(self, prompt_tokens: int, max_new_tokens: int, batch_size: int = 1) -> int:
+        """
+        Upper bound of the accelerator memory the KV cache of a request needs
+
+        Args:
+            prompt_tokens: Prompt length (padded length for batches)
+            max_new_tokens: Generation limit
+            batch_size: Sequences generated together
+
+        Returns:
+            Bytes
+        """
+        tokens = prompt_tokens + max_new_tokens
+        full = self.bytes_per_token_full
+        if self.strategy == "quantized":
+            recent = min(tokens, self.residual_length)
+            quantized = full * self.nbits / (8 * self.element_bytes)
+            per_sequence = recent * full + (tokens - recent) * quantized
+        elif self.strategy == "offloaded":
+            # Only the layer being computed and the one being prefetched stay on the device
+            per_sequence = tokens * full * min(2, self.num_layers) / max(1, self.num_layers)
+        elif self.strategy == "sliding_window":
+            per_sequence = min(tokens, self.window_length) * full
+        else:
+            per_sequence = tokens * full
+        return int(per_sequence * batch_size)
+
+
+class KVMemoryBudget:
+    """Admission control for concurrent KV-cache memory"""
+
+    def __init__(self, total_bytes: Optional[int] = None, admission_timeout: float = 10.0):
+        self.total_bytes = total_bytes
+        self.admission_timeout = admission_timeout
+        self.reserved_bytes = 0
+        self.peak_reserved_bytes = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.waited = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, kv_config: Dict[str, Any]) -> "KVMemoryBudget":
+        budget = kv_config.get("memory_budget")
+        return cls(
+            total_bytes=parse_memory_size(budget) if budget else None,
+            admission_timeout=kv_config.get("admission_timeout", 10.0)
+        )
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[None]:
+        """
+        Hold ``nbytes`` of the budget while the block runs
+
+        Raises:
+            KVBudgetExceeded: If the request is larger than the whole budget or
+                does not fit within ``admission_timeout``
+        """
+        with self._condition:
+            if self.total_bytes is not None:
+                if nbytes > self.total_bytes:
+                    self.rejected += 1
+                    raise KVBudgetExceeded(f"Request needs {nbytes / 1024 ** 2:.0f} MiB of KV cache, "
+                                           f"budget is {self.total_bytes / 1024 ** 2:.0f} MiB")
+                deadline = time.time() + self.admission_timeout
+                if self.reserved_bytes + nbytes > self.total_bytes:
+                    self.waited += 1
+                while self.reserved_bytes + nbytes > self.total_bytes:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise KVBudgetExceeded("KV cache budget exhausted, retry later")
+                    self._condition.wait(remaining)
+            self.reserved_bytes += nbytes
+            self.peak_reserved_bytes = max(self.peak_reserved_bytes, self.reserved_bytes)
+            self.active += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved_bytes -= nbytes
+                self.active -= 1
+                self._condition.notify_all()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "budget_mb": self.total_bytes / 1024 ** 2 if self.total_bytes else None,
+                "reserved_mb": self.reserved_bytes / 1024 ** 2,
+                "peak_reserved_mb": self.peak_reserved_bytes / 1024 ** 2,
+                "active_requests": self.active,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,235 @@
+"""
+Memory-pressure watchdog for the German Language Teaching Chatbot
+
+Periodically samples the process RSS and accelerator memory and compares them
+against watermarks derived from the configured ``max_memory`` budget.
+Listeners (the model manager) are notified on every sample so they can release
+allocator caches, shed load or offload idle weights.
+"""
+
+import threading
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+import torch
+
+from app.utils.logging import ChatbotLogger
+
+logger = ChatbotLogger("MemoryWatchdog")
+
+_SIZE_UNITS = {
+    "TIB": 1024 ** 4,
+    "GIB": 1024 ** 3,
+    "MIB": 1024 ** 2,
+    "KIB": 1024,
+    "TB": 10 ** 12,
+    "GB": 10 ** 9,
+    "MB": 10 ** 6,
+    "KB": 10 ** 3,
+    "B": 1,
+}
+
+
+def parse_memory_size(value: Any) -> int:
+    """
+    Parse an accelerate-style memory size ("12GiB", "16GB", 1024) into bytes
+
+    Args:
+        value: Size as a number of bytes or a string with a unit suffix
+
+    Returns:
+        Size in bytes
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    text = str(value).strip().upper()
+    for unit, factor in _SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(float(text))
+
+
+class PressureLevel(str, Enum):
+    """Memory pressure levels reported by the watchdog"""
+    NORMAL = "normal"
+    SOFT = "soft"
+    HARD = "hard"
+
+
+MemoryListener = Callable[[PressureLevel, Dict[str, Any]], None]
+
+
+class MemoryWatchdog:
+    """Background sampler of process and accelerator memory"""
+
+    def __init__(
+        self,
+        max_memory: Optional[Dict[Any, Any]] = None,
+        soft_watermark: float = 0.80,
+        hard_watermark: float = 0.92,
+        sample_interval: float = 5.0
+    ):
+        max_memory = max_memory or {}
+        self.cpu_budget = parse_memory_size(max_memory["cpu"]) if "cpu" in max_memory else None
+        self.gpu_budgets = {
+            int(device): parse_memory_size(size)
+            for device, size in max_memory.items()
+            if str(device).isdigit()
+        }
+        self.soft_watermark = soft_watermark
+        self.hard_watermark = hard_watermark
+        self.sample_interval = sample_interval
+
+        self.level = PressureLevel.NORMAL
+        self.last_sample: Dict[str, Any] = {}
+        self.peak_rss_bytes = 0
+        self.peak_gpu_bytes = 0
+        self.samples_taken = 0
+        self.soft_events = 0
+        self.hard_events = 0
+
+        self._process = psutil.Process()
+        self._listeners: List[MemoryListener] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, memory_config: Dict[str, Any], max_memory: Optional[Dict[Any, Any]]) -> "MemoryWatchdog":
+        """Create a watchdog from the ``memory`` config section and the ``max_memory`` budget"""
+        return cls(
+            max_memory=max_memory,
+            soft_watermark=memory_config.get("soft_watermark", 0.80),
+            hard_watermark=memory_config.get("hard_watermark", 0.92),
+            sample_interval=memory_config.get("sample_interval", 5.0)
+        )
+
+    def add_listener(self, listener: MemoryListener):
+        """Register a callback invoked with (level, sample) after every sample"""
+        self._listeners.append(listener)
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a single memory sample without notifying listeners"""
+        rss = self._process.memory_info().rss
+        sample: Dict[str, Any] = {
+            "timestamp": time.time(),
+            "rss_bytes": rss,
+            "rss_ratio": rss / self.cpu_budget if self.cpu_budget else 0.0,
+            "gpu": {}
+        }
+
+        gpu_ratio = 0.0
+        if torch.cuda.is_available():
+            for device in range(torch.cuda.device_count()):
+                reserved = torch.cuda.memory_reserved(device)
+                budget = self.gpu_budgets.get(device)
+                ratio = reserved / budget if budget else 0.0
+                gpu_ratio = max(gpu_ratio, ratio)
+                sample["gpu"][device] = {
+                    "allocated_bytes": torch.cuda.memory_allocated(device),
+                    "reserved_bytes": reserved,
+                    "ratio": ratio
+                }
+                self.peak_gpu_bytes = max(self.peak_gpu_bytes, reserved)
+
+        sample["gpu_ratio"] = gpu_ratio
+        sample["ratio"] = max(sample["rss_ratio"], gpu_ratio)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        return sample
+
+    def classify(self, ratio: float) -> PressureLevel:
+        """Map a budget usage ratio to a pressure level"""
+        if ratio >= self.hard_watermark:
+            return PressureLevel.HARD
+        if ratio >= self.soft_watermark:
+            return PressureLevel.SOFT
+        return PressureLevel.NORMAL
+
+    def check(self) -> PressureLevel:
+        """Sample memory, update the pressure level and notify listeners"""
+        sample = self.sample()
+        level = self.classify(sample["ratio"])
+
+        if level != self.level:
+            logger.warning(
+                "Memory pressure level changed",
+                previous=self.level.value,
+                level=level.value,
+                rss_gb=round(sample["rss_bytes"] / 1024 ** 3, 2),
+                ratio=round(sample["ratio"], 3)
+            )
+            if level == PressureLevel.SOFT:
+                self.soft_events += 1
+            elif level == PressureLevel.HARD:
+                self.hard_events += 1
+
+        self.level = level
+        self.last_sample = sample
+        self.samples_taken += 1
+
+        for listener in self._listeners:
+            try:
+                listener(level, sample)
+            except Exception as e:
+                logger.error("Memory listener failed", error=str(e))
+
+        return level
+
+    def start(self):
+        """Start the background sampling thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Memory watchdog started",
+            sample_interval=self.sample_interval,
+            soft_watermark=self.soft_watermark,
+            hard_watermark=self.hard_watermark
+        )
+
+    def stop(self):
+        """Stop the background sampling thread"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.sample_interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.sample_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Memory watchdog sample failed", error=str(e))
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get watchdog status for the model status endpoint"""
+        sample = self.last_sample
+        return {
+            "watchdog_running": self.running,
+            "pressure_level": self.level.value,
+            "rss_gb": round(sample.get("rss_bytes", 0) / 1024 ** 3, 3),
+            "rss_budget_gb": round(self.cpu_budget / 1024 ** 3, 3) if self.cpu_budget else None,
+            "gpu_reserved_gb": {
+                device: round(info["reserved_bytes"] / 1024 ** 3, 3)
+                for device, info in sample.get("gpu", {}).items()
+            },
+            "gpu_budget_gb": {
+                device: round(budget / 1024 ** 3, 3) for device, budget in self.gpu_budgets.items()
+            },
+            "usage_ratio": round(sample.get("ratio", 0.0), 4),
+            "peak_rss_gb": round(self.peak_rss_bytes / 1024 ** 3, 3),
+            "peak_gpu_reserved_gb": round(self.peak_gpu_bytes / 1024 ** 3, 3),
+            "soft_watermark": self.soft_watermark,
+            "hard_watermark": self.hard_watermark,
+            "samples_taken": self.samples_taken,
+            "soft_events": self.soft_events,
+            "hard_events": self.hard_events
+        }
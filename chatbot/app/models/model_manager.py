@@ -0,0 +1,559 @@
+"""
+Model manager for the German Language Teaching Chatbot
+
+Loads the base model with the LoRA adapter, runs generation and keeps
+performance metrics. A memory watchdog keeps the process inside its
+``max_memory`` budget: caches are shrunk at the soft watermark, new requests
+are shed and idle weights offloaded at the hard watermark, and the model can
+optionally be unloaded after a period of inactivity and reloaded lazily.
+"""
+
+import gc
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+from transformers import AutoTokenizer, BitsAndBytesConfig, StoppingCriteriaList
+
+from app.models.cancellation import CancellationCriteria, CancellationToken, GenerationCancelled
+from app.models.kv_cache import KVBudgetExceeded, KVCachePolicy, KVMemoryBudget
+from app.models.memory_watchdog import MemoryWatchdog, PressureLevel
+from app.utils.config import get_config
+from app.utils.logging import ChatbotLogger
+
+# The chat template engine is shared with training and data preparation
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from utils.batched_generation import left_pad, length_buckets
+from utils.chat_template import ChatTemplate
+from utils.model_cache import load_cached_model
+
+logger = ChatbotLogger("ModelManager")
+
+ERROR_RESPONSE = "Извините, произошла ошибка при генерации ответа. Попробуйте ещё раз."
+
+
+class ModelOverloadedError(RuntimeError):
+    """Raised when a request is shed because of memory pressure"""
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one message of a ``chat_batch()`` call"""
+    response: Optional[str] = None
+    tokens_generated: int = 0
+    error: Optional[str] = None
+    # The model was overloaded before this message was generated; it can be retried later
+    retryable: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ModelManager:
+    """Model manager with 8-bit quantization, metrics and memory management"""
+
+    def __init__(self):
+        self.config = get_config()
+        self.model = None
+        self.tokenizer = None
+        self.chat_template = None
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.system_prompt = self.config.get_system_prompt()
+
+        # Performance metrics
+        self.load_time = 0.0
+        self.load_report: Dict[str, Any] = {}
+        self.total_inferences = 0
+        self.total_tokens_generated = 0
+        self.total_parameters = 0
+
+        # Memory management
+        memory_config = self.config.get("memory", {}) or {}
+        self.watchdog_enabled = memory_config.get("watchdog_enabled", True)
+        self.idle_unload = memory_config.get("idle_unload", False)
+        self.idle_timeout = memory_config.get("idle_timeout", 900)
+        self.pressure_offload_after = memory_config.get("pressure_offload_after", 60)
+        self.watchdog = MemoryWatchdog.from_config(
+            memory_config,
+            self.config.get("optimization.max_memory")
+        )
+        self.watchdog.add_listener(self._on_memory_sample)
+
+        self.shedding = False
+        self.idle_unloaded = False
+        self.last_used = time.time()
+        self.active_requests = 0
+        self.memory_stats = {
+            "shed_requests": 0,
+            "cache_shrinks": 0,
+            "idle_unloads": 0,
+            "pressure_offloads": 0,
+            "lazy_reloads": 0
+        }
+        self.cancellation_stats = {
+            "cancelled_requests": 0,
+            "cancelled_before_decode": 0,
+            "tokens_saved": 0
+        }
+
+        self._load_lock = threading.RLock()
+
+        # KV cache strategy and memory-based admission
+        kv_config = self.config.get("kv_cache", {}) or {}
+        self.kv_policy = KVCachePolicy.from_config(kv_config)
+        self.kv_budget = KVMemoryBudget.from_config(kv_config)
+
+        # Hot-reloadable settings; model/optimization changes apply on the next load
+        self.config.subscribe("system_prompt", self._on_system_prompt_change)
+        self.config.subscribe("memory", self._on_memory_config_change)
+        self.config.subscribe("kv_cache", self._on_kv_config_change)
+
+    def load_model(self) -> bool:
+        """
+        Load the tokenizer, the base model and the LoRA adapter
+
+        Returns:
+            True if the model is loaded
+        """
+        with self._load_lock:
+            if self.model is not None:
+                return True
+
+            try:
+                start = time.time()
+                model_config = self.config.get_model_config()
+                optimization = self.config.get_optimization_config()
+                base_model = model_config.get("base_model")
+                adapter_path = model_config.get("model_path")
+
+                logger.info("Loading tokenizer", base_model=base_model)
+                if self.tokenizer is None:
+                    self.tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+                    if self.tokenizer.pad_token is None:
+                        self.tokenizer.pad_token = self.tokenizer.eos_token
+                    self.chat_template = ChatTemplate(self.tokenizer)
+
+                load_kwargs: Dict[str, Any] = {
+                    "device_map": optimization.get("device_map", "auto"),
+                    "low_cpu_mem_usage": True,
+                    "trust_remote_code": True
+                }
+                if self.device == "cuda":
+                    if optimization.get("max_memory"):
+                        load_kwargs["max_memory"] = dict(optimization["max_memory"])
+                    if optimization.get("offload_folder"):
+                        load_kwargs["offload_folder"] = optimization["offload_folder"]
+                    if optimization.get("load_in_8bit"):
+                        load_kwargs["quantization_config"] = BitsAndBytesConfig(
+                            load_in_8bit=True,
+                            llm_int8_threshold=optimization.get("llm_int8_threshold", 6.0),
+                            llm_int8_has_fp16_weight=optimization.get("llm_int8_has_fp16_weight", False)
+                        )
+                    else:
+                        load_kwargs["torch_dtype"] = getattr(torch, optimization.get("torch_dtype", "float16"))
+                else:
+                    load_kwargs["torch_dtype"] = torch.float32
+
+                logger.info("Loading base model", base_model=base_model, device=self.device)
+                # Quantized weights are saved once and memory-mapped on later starts.
+                # No in-process reuse: the LoRA adapter is injected into the base model
+                model = load_cached_model(
+                    base_model,
+                    optimization.get("artifact_cache_dir", "../models/cache"),
+                    use_cache=optimization.get("artifact_cache", True),
+                    reuse=False,
+                    **load_kwargs
+                )
+                self.load_report = model.load_report
+
+                if adapter_path and Path(adapter_path).exists():
+                    from peft import PeftModel
+
+                    logger.info("Loading LoRA adapter", adapter_path=adapter_path)
+                    model = PeftModel.from_pretrained(model, adapter_path)
+                else:
+                    logger.warning("LoRA adapter not found, using base model", adapter_path=adapter_path)
+
+                model.eval()
+                self.kv_policy.bind(model, self.device)
+                self.model = model
+                self.total_parameters = sum(p.numel() for p in model.parameters())
+                self.load_time = time.time() - start
+                self.idle_unloaded = False
+                self.last_used = time.time()
+
+                logger.info("Model loaded",
+                            load_time=self.load_time,
+                            weights_source=self.load_report.get("source"),
+                            total_parameters=self.total_parameters,
+                            gpu_memory_gb=self._gpu_memory_gb())
+                return True
+
+            except Exception as e:
+                logger.error("Failed to load model", error=str(e))
+                self.model = None
+                return False
+
+    def unload_model(self, keep_tokenizer: bool = False):
+        """
+        Release the model (and optionally the tokenizer) and free accelerator memory
+
+        Args:
+            keep_tokenizer: Keep the tokenizer so a lazy reload only loads weights
+        """
+        with self._load_lock:
+            if self.model is not None:
+                del self.model
+                self.model = None
+            if not keep_tokenizer:
+                self.tokenizer = None
+                self.chat_template = None
+            self._release_memory()
+            logger.info("Model unloaded", keep_tokenizer=keep_tokenizer)
+
+    def ensure_loaded(self):
+        """Reload the model if it was unloaded because of idleness or memory pressure"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            if not self.idle_unloaded:
+                raise RuntimeError("Model is not loaded")
+            logger.info("Reloading model after idle unload")
+            if not self.load_model():
+                raise RuntimeError("Model reload failed")
+            self.memory_stats["lazy_reloads"] += 1
+
+    def chat(self, message: str, max_tokens: Optional[int] = None,
+             cancel_token: Optional[CancellationToken] = None) -> str:
+        """
+        Generate a tutor response for a user message
+
+        Args:
+            message: User message
+            max_tokens: Maximum number of new tokens (defaults to model.max_tokens)
+            cancel_token: Checked after every decoding step; set it to stop early
+
+        Returns:
+            Generated response text
+
+        Raises:
+            GenerationCancelled: If ``cancel_token`` was set before the response finished
+        """
+        if self.shedding:
+            self.memory_stats["shed_requests"] += 1
+            raise ModelOverloadedError("Request shed because of memory pressure, retry later")
+
+        # Taken under the load lock so an idle offload cannot race with a new request
+        with self._load_lock:
+            self.active_requests += 1
+            self.last_used = time.time()
+
+        try:
+            self.ensure_loaded()
+            return self._generate(message, max_tokens, cancel_token)
+        finally:
+            with self._load_lock:
+                self.active_requests -= 1
+                self.last_used = time.time()
+
+    def chat_batch(self, messages: List[str], max_tokens: Optional[int] = None,
+                   batch_size: int = 8) -> List[BatchResult]:
+        """
+        Generate tutor responses for several messages in length-sorted, left-padded batches
+
+        Args:
+            messages: User messages
+            max_tokens: Maximum number of new tokens per response (defaults to model.max_tokens)
+            batch_size: Maximum number of sequences per generate() call
+
+        Returns:
+            One result per message, in input order. A failed generate() call only
+            fails the messages of its own batch.
+
+        Raises:
+            ModelOverloadedError: If the whole call is shed because of memory pressure
+        """
+        if self.shedding:
+            self.memory_stats["shed_requests"] += len(messages)
+            raise ModelOverloadedError("Request shed because of memory pressure, retry later")
+
+        with self._load_lock:
+            self.active_requests += len(messages)
+            self.last_used = time.time()
+
+        try:
+            self.ensure_loaded()
+            return self._generate_batch(messages, max_tokens, batch_size)
+        finally:
+            with self._load_lock:
+                self.active_requests -= len(messages)
+                self.last_used = time.time()
+
+    def _generate_batch(self, messages: List[str], max_tokens: Optional[int], batch_size: int) -> List[BatchResult]:
+        prompt_ids = [self.chat_template.encode_prompt(self.system_prompt, m) for m in messages]
+        results = [BatchResult(error="Not generated") for _ in messages]
+        pad_token_id = self.tokenizer.pad_token_id
+        generation_kwargs = self._generation_kwargs(max_tokens)
+        max_new_tokens = generation_kwargs["max_new_tokens"]
+
+        buckets = self._kv_buckets(prompt_ids, max_new_tokens, batch_size)
+        for n, bucket in enumerate(buckets):
+            try:
+                start = time.time()
+                input_ids, attention_mask = left_pad([prompt_ids[i] for i in bucket], pad_token_id)
+                kv_bytes = self.kv_policy.estimate_bytes(input_ids.shape[1], max_new_tokens, len(bucket))
+                with self._kv_admission(kv_bytes), torch.inference_mode():
+                    output_ids = self.model.generate(
+                        input_ids=input_ids.to(self.model.device),
+                        attention_mask=attention_mask.to(self.model.device),
+                        **generation_kwargs,
+                        **self.kv_policy.generation_kwargs()
+                    )
+
+                new_tokens = output_ids[:, input_ids.shape[1]:]
+                texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+                # Finished rows are padded up to the longest one
+                counts = (new_tokens != pad_token_id).sum(dim=1).tolist()
+                for i, text, count in zip(bucket, texts, counts):
+                    results[i] = BatchResult(response=text.strip(), tokens_generated=count)
+
+                self.total_inferences += len(bucket)
+                self.total_tokens_generated += sum(counts)
+                logger.log_model_inference(
+                    prompt_length=input_ids.shape[1],
+                    response_length=new_tokens.shape[1],
+                    duration=time.time() - start
+                )
+            except ModelOverloadedError as e:
+                # Later batches would wait for the same KV memory; leave them to a retry
+                for i in (i for rest in buckets[n:] for i in rest):
+                    results[i] = BatchResult(error=str(e), retryable=True)
+                break
+            except Exception as e:
+                logger.error("Batch generation failed", error=str(e), batch_size=len(bucket))
+                for i in bucket:
+                    results[i] = BatchResult(error=f"Generation failed: {e}")
+        return results
+
+    def _kv_buckets(self, prompt_ids: List[List[int]], max_new_tokens: int, batch_size: int) -> List[List[int]]:
+        """Length buckets of at most ``batch_size`` whose KV estimate also fits the KV budget"""
+        buckets = []
+        for bucket in length_buckets([len(ids) for ids in prompt_ids], batch_size):
+            fit = len(bucket)
+            if self.kv_budget.total_bytes:
+                # Longest prompt first, so the first sequence sets the padded width
+                per_sequence = self.kv_policy.estimate_bytes(len(prompt_ids[bucket[0]]), max_new_tokens)
+                fit = max(1, self.kv_budget.total_bytes // max(1, per_sequence))
+            buckets += [bucket[i:i + fit] for i in range(0, len(bucket), fit)]
+        return buckets
+
+    @contextmanager
+    def _kv_admission(self, kv_bytes: int) -> Iterator[None]:
+        """Reserve KV memory for a generate() call; an exhausted budget sheds the request"""
+        try:
+            with self.kv_budget.reserve(kv_bytes):
+                yield
+        except KVBudgetExceeded as e:
+            self.memory_stats["shed_requests"] += 1
+            raise ModelOverloadedError(str(e))
+
+    def _generate(self, message: str, max_tokens: Optional[int],
+                  cancel_token: Optional[CancellationToken] = None) -> str:
+        try:
+            start = time.time()
+            prompt_ids = self.chat_template.encode_prompt(self.system_prompt, message)
+            input_ids = torch.tensor([prompt_ids], device=self.model.device)
+            generation_kwargs = self._generation_kwargs(max_tokens)
+            kv_bytes = self.kv_policy.estimate_bytes(len(prompt_ids), generation_kwargs["max_new_tokens"])
+            if cancel_token is not None:
+                generation_kwargs["stopping_criteria"] = StoppingCriteriaList([CancellationCriteria(cancel_token)])
+
+            with self._kv_admission(kv_bytes), torch.inference_mode():
+                # The client may have left while the request waited for KV memory
+                if cancel_token is not None and cancel_token.cancelled:
+                    self._record_cancellation(cancel_token, generation_kwargs["max_new_tokens"], 0)
+                output_ids = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    **generation_kwargs,
+                    **self.kv_policy.generation_kwargs()
+                )
+
+            new_tokens = output_ids[0][len(prompt_ids):]
+            if cancel_token is not None and cancel_token.cancelled:
+                self.total_tokens_generated += len(new_tokens)
+                self._record_cancellation(cancel_token, generation_kwargs["max_new_tokens"], len(new_tokens))
+            response = self.tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+
+            self.total_inferences += 1
+            self.total_tokens_generated += len(new_tokens)
+            logger.log_model_inference(
+                prompt_length=len(prompt_ids),
+                response_length=len(new_tokens),
+                duration=time.time() - start
+            )
+            return response
+
+        except (ModelOverloadedError, GenerationCancelled):
+            raise
+        except Exception as e:
+            logger.error("Generation failed", error=str(e))
+            return ERROR_RESPONSE
+
+    def _record_cancellation(self, cancel_token: CancellationToken, max_new_tokens: int, generated: int):
+        """Count the decode work skipped by a cancelled request and stop it"""
+        tokens_saved = max(0, max_new_tokens - generated)
+        self.cancellation_stats["cancelled_requests"] += 1
+        if generated == 0:
+            self.cancellation_stats["cancelled_before_decode"] += 1
+        self.cancellation_stats["tokens_saved"] += tokens_saved
+        logger.info("Generation cancelled",
+                    reason=cancel_token.reason,
+                    tokens_generated=generated,
+                    tokens_saved=tokens_saved)
+        raise GenerationCancelled(cancel_token.reason, generated, tokens_saved)
+
+    def _generation_kwargs(self, max_tokens: Optional[int]) -> Dict[str, Any]:
+        model_config = self.config.get_model_config()
+        do_sample = model_config.get("do_sample", False)
+        kwargs: Dict[str, Any] = {
+            "max_new_tokens": max_tokens or model_config.get("max_tokens", 256),
+            "do_sample": do_sample,
+            "repetition_penalty": model_config.get("repetition_penalty", 1.0),
+            "pad_token_id": self.tokenizer.pad_token_id
+        }
+        if do_sample:
+            kwargs["temperature"] = model_config.get("temperature", 0.2)
+            kwargs["top_p"] = model_config.get("top_p", 0.9)
+        return kwargs
+
+    # Memory management
+
+    def shrink_caches(self):
+        """Release Python garbage and the CUDA caching allocator's unused blocks"""
+        self._release_memory()
+        self.memory_stats["cache_shrinks"] += 1
+
+    def start_watchdog(self):
+        """Start the memory watchdog if it is enabled in the config"""
+        if self.watchdog_enabled or self.idle_unload:
+            self.watchdog.start()
+
+    def stop_watchdog(self):
+        """Stop the memory watchdog"""
+        self.watchdog.stop()
+
+    def _on_system_prompt_change(self, snapshot, changed: List[str]):
+        self.system_prompt = self.config.get_system_prompt()
+        logger.info("System prompt reloaded", config_version=snapshot.version)
+
+    def _on_memory_config_change(self, snapshot, changed: List[str]):
+        memory_config = snapshot.get("memory", {}) or {}
+        self.idle_unload = memory_config.get("idle_unload", False)
+        self.idle_timeout = memory_config.get("idle_timeout", 900)
+        self.pressure_offload_after = memory_config.get("pressure_offload_after", 60)
+        self.watchdog.soft_watermark = memory_config.get("soft_watermark", 0.80)
+        self.watchdog.hard_watermark = memory_config.get("hard_watermark", 0.92)
+        self.watchdog.sample_interval = memory_config.get("sample_interval", 5.0)
+        logger.info("Memory settings reloaded", config_version=snapshot.version, changed=changed)
+
+    def _on_kv_config_change(self, snapshot, changed: List[str]):
+        kv_config = snapshot.get("kv_cache", {}) or {}
+        policy = KVCachePolicy.from_config(kv_config)
+        with self._load_lock:
+            if self.model is not None:
+                policy.bind(self.model, self.device)
+            self.kv_policy = policy
+        self.kv_budget.total_bytes = KVMemoryBudget.from_config(kv_config).total_bytes
+        self.kv_budget.admission_timeout = kv_config.get("admission_timeout", 10.0)
+        logger.info("KV cache settings reloaded", config_version=snapshot.version, changed=changed)
+
+    def _on_memory_sample(self, level: PressureLevel, sample: Dict[str, Any]):
+        """Watchdog listener: shrink caches, shed load and offload idle weights"""
+        self.shedding = level == PressureLevel.HARD
+
+        if level != PressureLevel.NORMAL:
+            self.shrink_caches()
+
+        if self.model is None or self.active_requests > 0:
+            return
+
+        idle_seconds = time.time() - self.last_used
+        if level == PressureLevel.HARD and idle_seconds >= self.pressure_offload_after:
+            logger.warning("Offloading idle model under memory pressure", idle_seconds=idle_seconds)
+            self._offload_idle()
+            self.memory_stats["pressure_offloads"] += 1
+        elif self.idle_unload and idle_seconds >= self.idle_timeout:
+            logger.info("Unloading idle model", idle_seconds=idle_seconds)
+            self._offload_idle()
+            self.memory_stats["idle_unloads"] += 1
+
+    def _offload_idle(self):
+        with self._load_lock:
+            if self.model is None or self.active_requests > 0:
+                return
+            self.unload_model(keep_tokenizer=True)
+            self.idle_unloaded = True
+            self.shedding = False
+
+    def _release_memory(self):
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _gpu_memory_gb(self) -> float:
+        if torch.cuda.is_available():
+            return torch.cuda.memory_allocated() / 1024 ** 3
+        return 0.0
+
+    def is_available(self) -> bool:
+        """Whether the manager can serve requests (loaded or lazily reloadable)"""
+        return self.model is not None or self.idle_unloaded
+
+    def get_model_status(self) -> Dict[str, Any]:
+        """Get model status, performance and memory metrics"""
+        memory = self.watchdog.get_status()
+        memory.update(self.memory_stats)
+        memory.update({
+            "shedding": self.shedding,
+            "idle_unload": self.idle_unload,
+            "idle_timeout": self.idle_timeout,
+            "idle_seconds": round(time.time() - self.last_used, 1)
+        })
+
+        return {
+            "model_loaded": self.model is not None,
+            "tokenizer_loaded": self.tokenizer is not None,
+            "device": self.device,
+            "load_time": self.load_time,
+            "weights_source": self.load_report.get("source"),
+            "total_inferences": self.total_inferences,
+            "total_tokens_generated": self.total_tokens_generated,
+            "gpu_memory_gb": self._gpu_memory_gb(),
+            "system_prompt": self.system_prompt,
+            "total_parameters": self.total_parameters,
+            "idle_unloaded": self.idle_unloaded,
+            "active_requests": self.active_requests,
+            "cancellation": dict(self.cancellation_stats),
+            "kv_cache": {
+                "strategy": self.kv_policy.strategy,
+                "kv_bytes_per_token": self.kv_policy.bytes_per_token_full,
+                **self.kv_budget.get_status()
+            },
+            "memory": memory
+        }
+
+
+# Global model manager instance
+model_manager = ModelManager()
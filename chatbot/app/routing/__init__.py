@@ -0,0 +1,3 @@
+"""
+Request routing across chatbot replicas and overflow backends
+"""
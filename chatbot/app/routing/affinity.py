@@ -0,0 +1,208 @@
+"""
+Cache-affinity routing for the German Language Teaching Chatbot
+
+Requests of one session (or with the same prompt prefix) should keep landing on
+the same replica so its prefix and KV caches stay warm. Replicas are placed on a
+consistent-hash ring with virtual nodes; adding or ejecting a replica only moves
+the keys next to it. Bounded loads keep a hot key from overloading its replica:
+a replica is skipped while it has more than ``load_factor`` times the average
+number of in-flight requests, and the key falls through to the next replica on
+the ring.
+"""
+
+import bisect
+import hashlib
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Replica:
+    """Routing state and statistics of one backend replica"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.affinity_hits = 0
+        self.fallbacks = 0
+        self.latencies: deque = deque(maxlen=1000)
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and time.time() >= self.ejected_until
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        return {
+            "url": self.url,
+            "available": self.available,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "affinity_hits": self.affinity_hits,
+            "fallbacks": self.fallbacks,
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p95": _percentile(latencies, 95),
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0
+        }
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    def __init__(self, replicas: List[Replica], virtual_nodes: int = 100):
+        self.replicas = replicas
+        points = []
+        for replica in replicas:
+            for i in range(virtual_nodes):
+                points.append((_hash(f"{replica.url}#{i}"), replica))
+        points.sort(key=lambda p: p[0])
+        self._hashes = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def walk(self, key: str) -> Iterator[Replica]:
+        """Distinct replicas in ring order starting at the key's position"""
+        if not self._nodes:
+            return
+        start = bisect.bisect(self._hashes, _hash(key)) % len(self._nodes)
+        seen = set()
+        for i in range(len(self._nodes)):
+            replica = self._nodes[(start + i) % len(self._nodes)]
+            if replica.url not in seen:
+                seen.add(replica.url)
+                yield replica
+                if len(seen) == len(self.replicas):
+                    return
+
+
+class AffinityRouter:
+    """
+    Picks a replica per request: consistent hashing with bounded loads,
+    skipping unhealthy or ejected replicas
+    """
+
+    def __init__(
+        self,
+        replica_urls: List[str],
+        virtual_nodes: int = 100,
+        load_factor: float = 1.25,
+        prefix_chars: int = 256,
+        eject_after_failures: int = 3,
+        eject_cooldown: float = 30.0
+    ):
+        if not replica_urls:
+            raise ValueError("At least one replica URL is required")
+        self.replicas = [Replica(url) for url in replica_urls]
+        self.ring = HashRing(self.replicas, virtual_nodes)
+        self.load_factor = load_factor
+        self.prefix_chars = prefix_chars
+        self.eject_after_failures = eject_after_failures
+        self.eject_cooldown = eject_cooldown
+        self.unroutable = 0
+
+    def routing_key(self, body: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        """
+        Session id when the client sends one, otherwise the message prefix
+        (requests sharing a prefix share cached prompt state)
+        """
+        session_id = session_id or body.get("session_id")
+        if session_id:
+            return f"session:{session_id}"
+        return f"prefix:{str(body.get('message', ''))[:self.prefix_chars]}"
+
+    def capacity(self) -> int:
+        """Maximum in-flight requests per replica under the bounded-load rule"""
+        available = [r for r in self.replicas if r.available]
+        if not available:
+            return 0
+        total = sum(r.in_flight for r in available) + 1
+        return max(1, math.ceil(self.load_factor * total / len(available)))
+
+    def candidates(self, key: str) -> List[Replica]:
+        """
+        Replicas to try for a key, best first: the first one on the ring with spare
+        capacity, then the remaining available replicas in ring order (for retries)
+        """
+        available = [r for r in self.ring.walk(key) if r.available]
+        if not available:
+            return []
+        capacity = self.capacity()
+        for i, replica in enumerate(available):
+            if replica.in_flight < capacity:
+                return [replica] + available[:i] + available[i + 1:]
+        return available
+
+    def pick(self, key: str) -> Optional[Replica]:
+        candidates = self.candidates(key)
+        return candidates[0] if candidates else None
+
+    def is_preferred(self, key: str, replica: Replica) -> bool:
+        """Whether the replica is the key's first available replica on the ring"""
+        for candidate in self.ring.walk(key):
+            if candidate.available:
+                return candidate is replica
+        return False
+
+    # Request accounting
+
+    def begin(self, replica: Replica, key: str):
+        replica.in_flight += 1
+        replica.requests += 1
+        if self.is_preferred(key, replica):
+            replica.affinity_hits += 1
+        else:
+            replica.fallbacks += 1
+
+    def end(self, replica: Replica, latency: Optional[float], ok: bool):
+        replica.in_flight -= 1
+        if ok:
+            replica.consecutive_failures = 0
+            if latency is not None:
+                replica.latencies.append(latency)
+        else:
+            self.record_failure(replica)
+
+    def record_failure(self, replica: Replica):
+        """Passive ejection: too many consecutive failures take the replica out for a cooldown"""
+        replica.errors += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.eject_after_failures:
+            replica.ejected_until = time.time() + self.eject_cooldown
+
+    def record_health(self, replica: Replica, healthy: bool):
+        """Active health check result; a passing check re-admits an ejected replica"""
+        replica.healthy = healthy
+        if healthy:
+            replica.consecutive_failures = 0
+            replica.ejected_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        replicas = [r.stats() for r in self.replicas]
+        requests = sum(r["requests"] for r in replicas)
+        hits = sum(r["affinity_hits"] for r in replicas)
+        return {
+            "replicas": replicas,
+            "available_replicas": sum(r["available"] for r in replicas),
+            "requests": requests,
+            "affinity_hit_rate": hits / requests if requests else 0.0,
+            "unroutable": self.unroutable,
+            "capacity_per_replica": self.capacity()
+        }
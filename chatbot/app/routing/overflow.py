@@ -0,0 +1,464 @@
+"""
+Overflow routing for the German Language Teaching Chatbot
+
+At lesson start many students ask at once and requests queue up in front of the
+local model. With an overflow backend configured, ``LocalQueue`` gates the
+local model and estimates how long a new request would wait from the queue
+depth and the recent service time. When that estimate exceeds
+``queue_wait_threshold`` (or the local model sheds the request),
+``OverflowPolicy`` sends the request to a secondary OpenAI-compatible backend
+instead. The overflow backend has its own concurrency limit and a
+circuit breaker, so a slow or failing provider falls back to the local queue
+rather than failing requests. Like local generation, an overflow call is
+cancelled when its client disconnects.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+
+from openai import AsyncOpenAI
+
+from app.models.cancellation import CancellationToken, GenerationCancelled
+from app.utils.config import get_config
+from app.utils.logging import ChatbotLogger
+
+logger = ChatbotLogger("Overflow")
+
+LOCAL = "local"
+OVERFLOW = "overflow"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class OverflowUnavailable(RuntimeError):
+    """Raised when the overflow backend cannot take a request"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing backend for a while
+
+    ``closed``: requests pass, consecutive failures are counted.
+    ``open``: requests are refused until ``reset_timeout`` has passed.
+    ``half_open``: one probe request passes; success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (claims the probe slot when half-open)"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("Overflow circuit closed")
+        self._state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Give back a probe slot without an outcome (the request was cancelled)"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.times_opened += 1
+                logger.warning("Overflow circuit opened",
+                               consecutive_failures=self.consecutive_failures,
+                               reset_timeout=self.reset_timeout)
+            self._state = self.OPEN
+            self.opened_at = time.time()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "times_opened": self.times_opened
+        }
+
+
+class LocalQueue:
+    """Concurrency gate in front of the local model with a queue-wait estimate"""
+
+    def __init__(self, concurrency: int = 1, expected_latency: float = 5.0, smoothing: float = 0.2):
+        self.concurrency = concurrency
+        self.service_time = expected_latency
+        self.smoothing = smoothing
+        self.in_service = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def estimated_wait(self) -> float:
+        """Seconds a request arriving now would wait before the local model starts on it"""
+        ahead = self.in_service + self.waiting - self.concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return ahead * self.service_time / self.concurrency
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free local slot and hold it while the block runs"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_service += 1
+        start = time.time()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            self.in_service -= 1
+            self._semaphore.release()
+            # Exponential moving average of the service time; shed or cancelled requests would skew it
+            if completed:
+                self.service_time += self.smoothing * (time.time() - start - self.service_time)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "in_service": self.in_service,
+            "waiting": self.waiting,
+            "service_time_avg": self.service_time,
+            "estimated_wait": self.estimated_wait()
+        }
+
+
+class OverflowBackend:
+    """OpenAI-compatible chat backend with a concurrency limit and a circuit breaker"""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 8,
+        timeout: float = 60.0,
+        temperature: float = 0.7,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.temperature = temperature
+        self.breaker = breaker or CircuitBreaker()
+        # Failures go to the breaker instead of being retried against a struggling backend
+        self.client = AsyncOpenAI(api_key=(api_key or "local").strip(), base_url=base_url,
+                                  timeout=timeout, max_retries=0)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.rejected_concurrency = 0
+        self.rejected_circuit = 0
+        self.latencies: deque = deque(maxlen=1000)
+        self.retired = False
+        self._closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def available(self) -> bool:
+        """Whether a request can be sent now; counts the reason when it cannot"""
+        if self.in_flight >= self.max_concurrency:
+            self.rejected_concurrency += 1
+            return False
+        if not self.breaker.allow():
+            self.rejected_circuit += 1
+            return False
+        return True
+
+    async def chat(self, system_prompt: str, message: str, max_tokens: Optional[int] = None) -> str:
+        """
+        Generate a tutor response on the overflow backend
+
+        Call ``available()`` first; it claims the half-open probe of the breaker.
+
+        Raises:
+            OverflowUnavailable: If the backend failed or returned no answer
+        """
+        # The client's connections belong to this loop; it is closed there as well
+        self._loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        self.requests += 1
+        start = time.time()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                max_tokens=max_tokens,
+                temperature=self.temperature
+            )
+            text = response.choices[0].message.content if response.choices else None
+            if not text:
+                raise OverflowUnavailable("Overflow backend returned an empty answer")
+        except asyncio.CancelledError:
+            # Caller went away; says nothing about the backend's health
+            self.breaker.release()
+            raise
+        except Exception as e:
+            # Connection/status errors, timeouts and malformed answers all count against the
+            # backend, and every outcome gives back the half-open probe
+            self.errors += 1
+            self.breaker.record_failure()
+            if isinstance(e, OverflowUnavailable):
+                raise
+            raise OverflowUnavailable(f"{type(e).__name__}: {e}") from e
+        finally:
+            self.in_flight -= 1
+            if self.retired and self.in_flight == 0:
+                self._schedule_close()
+
+        self.breaker.record_success()
+        self.latencies.append(time.time() - start)
+        return text
+
+    def retire(self):
+        """Close the client once the requests still using it have finished (called on config reload)"""
+        self.retired = True
+        if self.in_flight == 0:
+            self._schedule_close()
+
+    def _schedule_close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop)
+            return
+        # Never used: no connections to drain
+        try:
+            asyncio.get_running_loop().create_task(self.client.close())
+        except RuntimeError:
+            asyncio.run(self.client.close())
+
+    async def close(self):
+        self._closed = True
+        await self.client.close()
+
+    def get_status(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected_concurrency": self.rejected_concurrency,
+            "rejected_circuit": self.rejected_circuit,
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p95": _percentile(latencies, 95),
+            "circuit": self.breaker.get_status()
+        }
+
+
+class OverflowPolicy:
+    """Chooses the local model or the overflow backend for each chat request"""
+
+    def __init__(self, local: Optional[LocalQueue] = None, backend: Optional[OverflowBackend] = None,
+                 queue_wait_threshold: float = 10.0, watch_config: bool = False):
+        self.local = local or LocalQueue()
+        self.backend = backend
+        self.queue_wait_threshold = queue_wait_threshold
+        self.served = {LOCAL: 0, OVERFLOW: 0}
+        self.overflow_reasons = {"queue_wait": 0, "local_overloaded": 0}
+        self.fallbacks = 0
+        self.cancelled = 0
+        self.latencies = {LOCAL: deque(maxlen=1000), OVERFLOW: deque(maxlen=1000)}
+        if watch_config:
+            self._configure()
+            get_config().subscribe("overflow", lambda snapshot, changed: self._configure())
+
+    def _configure(self):
+        config = get_config()
+        concurrency = config.get("overflow.local_concurrency", 4)
+        if concurrency != self.local.concurrency:
+            if self.local.in_service or self.local.waiting:
+                logger.warning("overflow.local_concurrency changes take effect after a restart")
+            else:
+                self.local = LocalQueue(concurrency, self.local.service_time)
+        self.queue_wait_threshold = config.get("overflow.queue_wait_threshold", 10.0)
+
+        if not config.get("overflow.enabled", False) or not config.get("overflow.base_url"):
+            if self.backend is not None:
+                self.backend.retire()
+            self.backend = None
+            return
+        backend = self.backend
+        settings = (config.get("overflow.base_url"), config.get("overflow.model"),
+                    config.get("overflow.timeout", 60))
+        if backend is None or (backend.base_url, backend.model, backend.timeout) != settings:
+            # Requests in flight keep their reference to the previous backend
+            backend = OverflowBackend(
+                base_url=settings[0],
+                model=settings[1],
+                api_key=os.getenv(config.get("overflow.api_key_env", "OVERFLOW_API_KEY")),
+                timeout=settings[2],
+                breaker=CircuitBreaker(config.get("overflow.failure_threshold", 5),
+                                       config.get("overflow.reset_timeout", 30))
+            )
+            logger.info("Overflow backend configured", base_url=backend.base_url, model=backend.model)
+            if self.backend is not None:
+                self.backend.retire()
+        backend.max_concurrency = config.get("overflow.max_concurrency", 8)
+        backend.temperature = config.get("overflow.temperature", 0.7)
+        backend.breaker.failure_threshold = config.get("overflow.failure_threshold", 5)
+        backend.breaker.reset_timeout = config.get("overflow.reset_timeout", 30)
+        self.backend = backend
+
+    async def _overflow(self, reason: str, system_prompt: str, message: str, max_tokens: Optional[int],
+                        cancel_token: Optional[CancellationToken] = None) -> Optional[str]:
+        if cancel_token is not None and cancel_token.cancelled:
+            raise GenerationCancelled(cancel_token.reason)
+        backend = self.backend
+        if backend is None or not backend.available():
+            return None
+        self.overflow_reasons[reason] += 1
+        task = asyncio.ensure_future(backend.chat(system_prompt, message, max_tokens))
+        # The token may be set from another thread; call_soon also lets the call start first,
+        # so the backend sees the cancellation and gives back a claimed half-open probe
+        cancel = partial(asyncio.get_running_loop().call_soon_threadsafe, task.cancel)
+        if cancel_token is not None:
+            cancel_token.add_callback(cancel)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if cancel_token is None or not cancel_token.cancelled or asyncio.current_task().cancelling():
+                task.cancel()
+                raise
+            self.cancelled += 1
+            raise GenerationCancelled(cancel_token.reason) from None
+        except OverflowUnavailable as e:
+            self.fallbacks += 1
+            logger.warning("Overflow request failed, using the local model", reason=reason, error=str(e))
+            return None
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(cancel)
+
+    async def _local(self, generate: Callable[[], str]) -> str:
+        loop = asyncio.get_running_loop()
+        if self.backend is None:
+            # Nothing to overflow to: no gate, KV-budget admission alone limits local concurrency
+            return await loop.run_in_executor(None, generate)
+        async with self.local.slot():
+            return await loop.run_in_executor(None, generate)
+
+    async def chat(
+        self,
+        generate: Callable[[], str],
+        system_prompt: str,
+        message: str,
+        max_tokens: Optional[int] = None,
+        overloaded_errors: Tuple[Type[BaseException], ...] = (),
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[str, str]:
+        """
+        Serve a chat request on the local model or the overflow backend
+
+        Args:
+            generate: Blocking local generation of this request, run in a worker thread
+            system_prompt: System prompt sent to the overflow backend
+            message: User message
+            max_tokens: Maximum number of new tokens
+            overloaded_errors: Local errors that mean "shed", retried on the overflow backend
+            cancel_token: The request's token (also passed to ``generate``); cancels an overflow call
+
+        Returns:
+            (response text, backend that served it: "local" or "overflow")
+
+        Raises:
+            GenerationCancelled: If ``cancel_token`` was set while the overflow backend was answering
+        """
+        start = time.time()
+        text = None
+        if self.backend is not None and self.local.estimated_wait() > self.queue_wait_threshold:
+            text = await self._overflow("queue_wait", system_prompt, message, max_tokens, cancel_token)
+        if text is None:
+            try:
+                text = await self._local(generate)
+                served_by = LOCAL
+            except overloaded_errors:
+                text = await self._overflow("local_overloaded", system_prompt, message, max_tokens, cancel_token)
+                if text is None:
+                    raise
+                served_by = OVERFLOW
+        else:
+            served_by = OVERFLOW
+
+        self.served[served_by] += 1
+        self.latencies[served_by].append(time.time() - start)
+        return text, served_by
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Requests and latency per backend, local queue state and overflow backend health"""
+        backends = {}
+        for name, samples in self.latencies.items():
+            latencies = list(samples)
+            backends[name] = {
+                "served": self.served[name],
+                "latency_p50": _percentile(latencies, 50),
+                "latency_p95": _percentile(latencies, 95)
+            }
+        return {
+            "overflow_enabled": self.backend is not None,
+            "queue_wait_threshold": self.queue_wait_threshold,
+            "backends": backends,
+            "overflow_reasons": dict(self.overflow_reasons),
+            "overflow_fallbacks": self.fallbacks,
+            "overflow_cancelled": self.cancelled,
+            "local": self.local.get_status(),
+            "overflow": self.backend.get_status() if self.backend is not None else None
+        }
+
+
+# Global overflow policy for the chat endpoint
+overflow_policy = OverflowPolicy(watch_config=True)
@@ -0,0 +1,141 @@
+"""
+Cache-affinity router application for the German Language Teaching Chatbot
+
+Forwards ``/api/v1/chat`` to one of several chatbot replicas chosen by
+``AffinityRouter``, probes the replicas' readiness endpoint in the background
+(a replica still loading its model gets no traffic) and exposes per-replica
+statistics on ``/router/stats``. Replica answers are passed through unchanged.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.routing.affinity import AffinityRouter
+from app.utils.logging import ChatbotLogger
+
+logger = ChatbotLogger("Router")
+
+CHAT_PATH = "/api/v1/chat"
+
+
+async def _health_loop(router: AffinityRouter, client: httpx.AsyncClient, path: str, interval: float,
+                       timeout: float):
+    while True:
+        async def check(replica):
+            try:
+                response = await client.get(f"{replica.url}{path}", timeout=timeout)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != replica.healthy:
+                logger.warning("Replica health changed", replica=replica.url, healthy=healthy)
+            router.record_health(replica, healthy)
+
+        await asyncio.gather(*(check(r) for r in router.replicas))
+        await asyncio.sleep(interval)
+
+
+def create_router_app(
+    router: AffinityRouter,
+    request_timeout: float = 120.0,
+    health_path: str = "/api/v1/ready",
+    health_interval: float = 5.0,
+    health_timeout: float = 2.0
+) -> FastAPI:
+    """
+    Build the router FastAPI application
+
+    Args:
+        router: Replica selection policy and state
+        request_timeout: Timeout for a forwarded chat request
+        health_path: Replica readiness check path (200 once the model is loaded)
+        health_interval: Seconds between health check rounds
+        health_timeout: Timeout of one health check
+
+    Returns:
+        FastAPI application
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.client = httpx.AsyncClient(timeout=request_timeout)
+        health_task = asyncio.create_task(
+            _health_loop(router, app.state.client, health_path, health_interval, health_timeout)
+        )
+        logger.info("Router started", replicas=[r.url for r in router.replicas])
+        yield
+        health_task.cancel()
+        await app.state.client.aclose()
+
+    app = FastAPI(title="German Language Teaching Chatbot router", lifespan=lifespan)
+    app.state.router = router
+
+    @app.post(CHAT_PATH)
+    async def chat(request: Request):
+        body: Dict[str, Any] = await request.json()
+        key = router.routing_key(body, request.headers.get("X-Session-ID"))
+        candidates = router.candidates(key)
+        if not candidates:
+            router.unroutable += 1
+            return JSONResponse(status_code=503, content={"detail": "No healthy replicas"})
+
+        last_error = "No healthy replicas"
+        for replica in candidates:
+            router.begin(replica, key)
+            start = time.time()
+            try:
+                response = await request.app.state.client.post(f"{replica.url}{CHAT_PATH}", json=body)
+            except httpx.HTTPError as e:
+                router.end(replica, None, ok=False)
+                last_error = f"{replica.url}: {e}"
+                logger.warning("Replica request failed", replica=replica.url, error=str(e))
+                continue
+
+            latency = time.time() - start
+            if response.status_code == 503:
+                # Replica is shedding load: not a failure, but try the next one
+                router.end(replica, None, ok=True)
+                last_error = f"{replica.url}: overloaded"
+                continue
+            router.end(replica, latency, ok=response.status_code < 500)
+            if response.status_code >= 500:
+                last_error = f"{replica.url}: HTTP {response.status_code}"
+                continue
+            # Pass the body through as is: error pages of a proxy in front of a replica need not be JSON
+            return Response(content=response.content, status_code=response.status_code,
+                            media_type=response.headers.get("content-type"),
+                            headers={"X-Routed-To": replica.url, "X-Route-Key": key.split(":", 1)[0]})
+
+        router.unroutable += 1
+        return JSONResponse(status_code=503, content={"detail": last_error})
+
+    @app.get("/router/stats")
+    async def stats():
+        return router.stats()
+
+    @app.get("/health")
+    async def health():
+        available = sum(r.available for r in router.replicas)
+        return JSONResponse(status_code=200 if available else 503,
+                            content={"status": "healthy" if available else "unavailable",
+                                     "available_replicas": available})
+
+    return app
+
+
+def router_from_config(config, replica_urls: List[str] = None) -> AffinityRouter:
+    """Create an ``AffinityRouter`` from the ``router`` config section"""
+    return AffinityRouter(
+        list(replica_urls or config.get("router.replicas", [])),
+        virtual_nodes=config.get("router.virtual_nodes", 100),
+        load_factor=config.get("router.load_factor", 1.25),
+        prefix_chars=config.get("router.prefix_chars", 256),
+        eject_after_failures=config.get("router.eject_after_failures", 3),
+        eject_cooldown=config.get("router.eject_cooldown", 30)
+    )
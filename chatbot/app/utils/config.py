@@ -2,47 +2,144 @@
 Configuration management for the German Language Teaching Chatbot
 """
 
-import os
+import threading
+import time
 import yaml
 from pathlib import Path
-from typing import Dict, Any, Optional, Union
+from types import MappingProxyType
+from typing import Dict, Any, Callable, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+CONFIG_FILES = ("model_config.yaml", "app_config.yaml")
+
+_MISSING = object()
+
+
+def _freeze(value: Any) -> Any:
+    """Recursively convert dicts to read-only mappings and lists to tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """Mutable deep copy of a frozen value"""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _flatten(tree: Any, prefix: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Map every dotted path (sections and leaves) to its frozen value"""
+    out = {} if out is None else out
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        out[path] = value
+        if isinstance(value, MappingProxyType):
+            _flatten(value, f"{path}.", out)
+    return out
+
+
+class ConfigSnapshot:
+    """
+    Immutable, precompiled view of the configuration.
+
+    Every dotted key (including whole sections) is resolved once when the
+    snapshot is built, so lookups are a single dict access. Nested values are
+    read-only mappings/tuples; use ``ConfigSnapshot.thaw`` for a mutable copy.
+    """
+
+    __slots__ = ("version", "loaded_at", "tree", "_flat")
+
+    def __init__(self, config: Dict[str, Any], version: int = 0):
+        self.version = version
+        self.loaded_at = time.time()
+        self.tree = _freeze(config)
+        self._flat = MappingProxyType(_flatten(self.tree))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get configuration value by dotted key in O(1)"""
+        value = self._flat.get(key, _MISSING)
+        return default if value is _MISSING else value
+
+    def keys(self) -> List[str]:
+        return list(self._flat.keys())
+
+    def diff(self, other: Optional["ConfigSnapshot"]) -> List[str]:
+        """Dotted keys whose values differ from another snapshot"""
+        if other is None:
+            return self.keys()
+        keys = set(self._flat) | set(other._flat)
+        return sorted(k for k in keys if self._flat.get(k, _MISSING) != other._flat.get(k, _MISSING))
+
+    @staticmethod
+    def thaw(value: Any) -> Any:
+        return _thaw(value)
+
+
+Subscriber = Callable[[ConfigSnapshot, List[str]], None]
+
+
 class ConfigManager:
-    """Configuration manager for the chatbot application"""
-    
+    """
+    Configuration manager for the chatbot application.
+
+    Holds the current ``ConfigSnapshot`` and swaps it atomically when the YAML
+    files change (``start_watcher``) or ``update`` is called. Subscribers
+    registered for a key prefix are notified with the new snapshot and the
+    changed keys, so components can reconfigure without a restart.
+    """
+
     def __init__(self, config_dir: str = "config"):
         self.config_dir = Path(config_dir)
-        self._config: Dict[str, Any] = {}
+        self._snapshot = ConfigSnapshot({})
+        self._subscribers: List[Tuple[str, Subscriber]] = []
+        self._lock = threading.RLock()
+        self._mtimes: Dict[str, float] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
         self._load_config()
-    
+
+    # Loading
+
+    def _file_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in CONFIG_FILES:
+            path = self.config_dir / name
+            if path.exists():
+                mtimes[name] = path.stat().st_mtime_ns
+        return mtimes
+
+    def _read_files(self) -> Dict[str, Any]:
+        config: Dict[str, Any] = {}
+        for name in CONFIG_FILES:
+            path = self.config_dir / name
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    config.update(yaml.safe_load(f) or {})
+        return config
+
     def _load_config(self):
         """Load configuration from YAML files"""
         try:
-            # Load model configuration
-            model_config_path = self.config_dir / "model_config.yaml"
-            if model_config_path.exists():
-                with open(model_config_path, 'r', encoding='utf-8') as f:
-                    self._config.update(yaml.safe_load(f))
-            
-            # Load app configuration
-            app_config_path = self.config_dir / "app_config.yaml"
-            if app_config_path.exists():
-                with open(app_config_path, 'r', encoding='utf-8') as f:
-                    self._config.update(yaml.safe_load(f))
-            
+            self._mtimes = self._file_mtimes()
+            self._swap(self._read_files())
             logger.info("Configuration loaded successfully")
-            
+
         except Exception as e:
             logger.error(f"Error loading configuration: {e}")
             # Set default configuration
             self._set_default_config()
-    
+
     def _set_default_config(self):
         """Set default configuration if loading fails"""
-        self._config = {
+        self._swap({
             "model": {
                 "base_model": "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B",
                 "model_path": "../models/checkpoint-3",
@@ -63,55 +160,141 @@ class ConfigManager:
                 "redis_url": "redis://localhost:6379",
                 "ttl": 3600
             }
-        }
+        })
         logger.warning("Using default configuration")
-    
+
+    def _swap(self, config: Dict[str, Any]) -> List[str]:
+        """Build a new snapshot, publish it atomically and notify subscribers"""
+        with self._lock:
+            old = self._snapshot
+            new = ConfigSnapshot(config, version=old.version + 1)
+            changed = new.diff(old)
+            if not changed:
+                return []
+            self._snapshot = new
+            subscribers = list(self._subscribers)
+
+        for prefix, callback in subscribers:
+            relevant = [k for k in changed if k == prefix or k.startswith(f"{prefix}.")] if prefix else changed
+            if relevant:
+                try:
+                    callback(new, relevant)
+                except Exception as e:
+                    logger.error(f"Config subscriber for '{prefix}' failed: {e}")
+        return changed
+
+    def reload(self) -> List[str]:
+        """
+        Re-read the YAML files; a file that fails to parse keeps the current snapshot
+
+        Returns:
+            Changed dotted keys
+        """
+        try:
+            config = self._read_files()
+        except Exception as e:
+            logger.error(f"Config reload failed, keeping version {self._snapshot.version}: {e}")
+            return []
+        changed = self._swap(config)
+        if changed:
+            logger.info(f"Configuration reloaded (version {self._snapshot.version}): {len(changed)} keys changed")
+        return changed
+
+    # Watching
+
+    def _watch(self, interval: float):
+        while not self._stop_event.wait(interval):
+            mtimes = self._file_mtimes()
+            if mtimes != self._mtimes:
+                self._mtimes = mtimes
+                self.reload()
+
+    def start_watcher(self, interval: float = 2.0):
+        """Poll the YAML files and hot-swap the snapshot when they change"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="config-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Config watcher started for {self.config_dir} (every {interval}s)")
+
+    def stop_watcher(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def subscribe(self, prefix: str, callback: Subscriber) -> Callable[[], None]:
+        """
+        Call ``callback(snapshot, changed_keys)`` when keys under ``prefix`` change
+
+        Args:
+            prefix: Dotted key prefix ("model", "security.rate_limit"); "" for every change
+            callback: Receives the new snapshot and the changed keys under the prefix
+
+        Returns:
+            Function that removes the subscription
+        """
+        entry = (prefix, callback)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    # Access
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """Current immutable snapshot; hold on to it for consistent reads within a request"""
+        return self._snapshot
+
+    @property
+    def _config(self) -> Any:
+        return self._snapshot.tree
+
     def get(self, key: str, default: Any = None) -> Any:
         """Get configuration value by key"""
-        keys = key.split('.')
-        value = self._config
-        
-        try:
-            for k in keys:
-                value = value[k]
-            return value
-        except (KeyError, TypeError):
-            return default
-    
+        return self._snapshot.get(key, default)
+
     def get_model_config(self) -> Dict[str, Any]:
         """Get model configuration"""
-        return self._config.get("model", {})
-    
+        return self._snapshot.get("model", {})
+
     def get_optimization_config(self) -> Dict[str, Any]:
         """Get optimization configuration"""
-        return self._config.get("optimization", {})
-    
+        return self._snapshot.get("optimization", {})
+
     def get_api_config(self) -> Dict[str, Any]:
         """Get API configuration"""
-        return self._config.get("api", {})
-    
+        return self._snapshot.get("api", {})
+
     def get_cache_config(self) -> Dict[str, Any]:
         """Get cache configuration"""
-        return self._config.get("cache", {})
-    
+        return self._snapshot.get("cache", {})
+
     def get_system_prompt(self) -> str:
         """Get system prompt"""
-        prompt = self._config.get("system_prompt")
+        prompt = self._snapshot.get("system_prompt")
         if isinstance(prompt, str):
             return prompt
         return "Ты — преподаватель немецкого языка для русскоязычных студентов уровня A2. Объясняй грамотно, понятно, без лишней воды."
-    
+
     def update(self, key: str, value: Any):
-        """Update configuration value"""
+        """Update configuration value (copy-on-write: publishes a new snapshot)"""
         keys = key.split('.')
-        config = self._config
-        
-        for k in keys[:-1]:
-            if k not in config:
-                config[k] = {}
-            config = config[k]
-        
-        config[keys[-1]] = value
+        with self._lock:
+            config = _thaw(self._snapshot.tree)
+            node = config
+            for k in keys[:-1]:
+                if k not in node:
+                    node[k] = {}
+                node = node[k]
+            node[keys[-1]] = value
+            self._swap(config)
         logger.info(f"Configuration updated: {key} = {value}")
 
 # Global configuration instance
@@ -119,8 +302,8 @@ config_manager = ConfigManager()
 
 def load_config() -> Dict[str, Any]:
     """Load configuration and return as dictionary"""
-    return config_manager._config
+    return _thaw(config_manager.snapshot.tree)
 
 def get_config() -> ConfigManager:
     """Get configuration manager instance"""
-    return config_manager 
\ No newline at end of file
+    return config_manager
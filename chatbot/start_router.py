@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Startup script for the cache-affinity router
+
+Forwards /api/v1/chat to several chatbot replicas, keeping each session (or
+prompt prefix) on the same replica so its caches stay warm.
+
+Usage:
+    uvicorn app.main:app --port 8001 &   # one per replica (or GPU)
+    uvicorn app.main:app --port 8002 &
+    python start_router.py --replicas http://127.0.0.1:8001 http://127.0.0.1:8002
+
+    # Local test against stub replicas
+    python ../scripts/openai_stub_server.py --port 8001 &
+    python ../scripts/openai_stub_server.py --port 8002 &
+    python start_router.py --replicas http://127.0.0.1:8001 http://127.0.0.1:8002 --port 8100
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    """Start the router"""
+    from app.routing.server import create_router_app, router_from_config
+    from app.utils.config import get_config
+
+    config = get_config()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", nargs="+", default=None, help="Replica base URLs (default: router.replicas)")
+    parser.add_argument("--host", default=config.get("router.host", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=config.get("router.port", 8100))
+    args = parser.parse_args()
+
+    router = router_from_config(config, args.replicas)
+    app = create_router_app(
+        router,
+        request_timeout=config.get("router.request_timeout", 120),
+        health_path=config.get("router.health_path", "/api/v1/ready"),
+        health_interval=config.get("router.health_interval", 5),
+        health_timeout=config.get("router.health_timeout", 2)
+    )
+
+    print(f"🔀 Routing http://{args.host}:{args.port}/api/v1/chat to {len(router.replicas)} replicas:")
+    for replica in router.replicas:
+        print(f"   {replica.url}")
+    print(f"📊 Replica stats at http://{args.host}:{args.port}/router/stats")
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+if __name__ == "__main__":
+    main()
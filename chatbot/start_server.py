@@ -8,8 +8,9 @@ import os
 import uvicorn
 from pathlib import Path
 
-# Add the app directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+# Add the chatbot directory to the Python path (imported as the `app` package;
+# the app directory itself is not added so it doesn't shadow the repository `utils`)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 def main():
     """Start the chatbot server"""
@@ -8,8 +8,9 @@ import sys
 import os
 import time
 
-# Add the app directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+# Add the chatbot directory to the Python path (imported as the `app` package;
+# the app directory itself is not added so it doesn't shadow the repository `utils`)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 def test_config_loading():
     """Test configuration loading"""
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Cancellation tests for the German Language Teaching Chatbot
+Drops the client in the middle of a /chat generation and checks that decoding stops
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Add the chatbot directory to the Python path (imported as the `app` package)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.main import app
+from app.models import model_manager as model_manager_module
+from app.models.cancellation import CancellationCriteria
+from app.models.model_manager import model_manager
+
+MAX_TOKENS = 1000
+
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(str(int(i)) for i in ids)
+
+
+class FakeChatTemplate:
+    def encode_prompt(self, system_prompt, message):
+        return [1, 5, 6, 7]
+
+
+class RecordingCriteria(CancellationCriteria):
+    """CancellationCriteria that remembers the decoding step it stopped at"""
+    fired_at = []
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = super().__call__(input_ids, scores, **kwargs)
+        if bool(stop.all()):
+            RecordingCriteria.fired_at.append(self.steps)
+        return stop
+
+
+@pytest.fixture
+def tiny_model(monkeypatch):
+    """Random two-layer Llama: slow enough on CPU that 1000 tokens take several seconds"""
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=128, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=2048,
+                         bos_token_id=1, eos_token_id=None, pad_token_id=0)
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+
+    monkeypatch.setattr(model_manager, "model", model)
+    monkeypatch.setattr(model_manager, "tokenizer", FakeTokenizer())
+    monkeypatch.setattr(model_manager, "chat_template", FakeChatTemplate())
+    monkeypatch.setattr(model_manager, "device", "cpu")
+    monkeypatch.setattr(model_manager, "cancellation_stats",
+                        {"cancelled_requests": 0, "cancelled_before_decode": 0, "tokens_saved": 0})
+    monkeypatch.setattr(model_manager_module, "CancellationCriteria", RecordingCriteria)
+    model_manager.kv_policy.bind(model, "cpu")
+    RecordingCriteria.fired_at = []
+    return model
+
+
+async def _chat_then_disconnect(disconnect_after: float):
+    """Send POST /api/v1/chat through the full middleware stack and hang up mid-generation"""
+    body = json.dumps({"message": "Объясни разницу между wissen и kennen", "max_tokens": MAX_TOKENS}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/v1/chat", "raw_path": b"/api/v1/chat", "query_string": b"",
+        "root_path": "", "server": ("testserver", 80), "client": ("127.0.0.1", 50000),
+        "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())]
+    }
+    body_sent = False
+    sent = []
+    disconnect_at = time.time() + disconnect_after
+
+    async def receive():
+        # Like uvicorn: once the peer is gone, http.disconnect is returned without waiting
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        if time.time() < disconnect_at:
+            await asyncio.sleep(disconnect_at - time.time())
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=60)
+    return sent
+
+
+def test_disconnect_stops_generation(tiny_model):
+    sent = asyncio.run(_chat_then_disconnect(disconnect_after=0.5))
+
+    # The stopping criterion fired well before max_new_tokens
+    assert RecordingCriteria.fired_at, "CancellationCriteria never stopped generate()"
+    assert RecordingCriteria.fired_at[0] < MAX_TOKENS
+
+    stats = model_manager.cancellation_stats
+    assert stats["cancelled_requests"] == 1
+    assert stats["tokens_saved"] > 0
+
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    assert start["status"] == 499
+    assert any(name == b"x-process-time" for name, _ in start["headers"])
+
+
+def test_connected_client_gets_full_answer(tiny_model):
+    sent = asyncio.run(_chat_then_disconnect(disconnect_after=60))
+
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    assert start["status"] == 200
+    assert not RecordingCriteria.fired_at
+    assert model_manager.cancellation_stats["cancelled_requests"] == 0
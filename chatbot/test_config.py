@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Configuration tests for the German Language Teaching Chatbot
+Read-only snapshots with dotted-key lookups, copy-on-write updates,
+prefix subscriptions and hot reload of the YAML files
+"""
+
+import os
+import sys
+import time
+from types import MappingProxyType
+
+import pytest
+import yaml
+
+# Add the chatbot directory to the Python path (imported as the `app` package)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.config import ConfigManager, ConfigSnapshot
+
+MODEL_CONFIG = {"model": {"max_tokens": 256, "temperature": 0.2}, "optimization": {"torch_dtype": "float16"}}
+APP_CONFIG = {"api": {"port": 8000, "cors_origins": ["*"]}, "system_prompt": "Sei freundlich."}
+
+
+def write_config(config_dir, name, config):
+    path = config_dir / name
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    # Make the change visible to mtime polling even on coarse filesystem clocks
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def manager(tmp_path):
+    write_config(tmp_path, "model_config.yaml", MODEL_CONFIG)
+    write_config(tmp_path, "app_config.yaml", APP_CONFIG)
+    manager = ConfigManager(str(tmp_path))
+    yield manager
+    manager.stop_watcher()
+
+
+def test_snapshot_lookups_and_freezing():
+    snapshot = ConfigSnapshot({**MODEL_CONFIG, **APP_CONFIG})
+    assert snapshot.get("model.max_tokens") == 256
+    assert snapshot.get("model.missing", 1) == 1
+    assert snapshot.get("api.cors_origins") == ("*",)
+    assert isinstance(snapshot.get("model"), MappingProxyType)
+    with pytest.raises(TypeError):
+        snapshot.get("model")["max_tokens"] = 1
+    assert "optimization.torch_dtype" in snapshot.keys()
+
+    thawed = ConfigSnapshot.thaw(snapshot.tree)
+    assert thawed == {**MODEL_CONFIG, **APP_CONFIG}
+
+    changed = ConfigSnapshot({**MODEL_CONFIG, "api": {"port": 8001, "cors_origins": ["*"]}}).diff(snapshot)
+    assert changed == ["api", "api.port", "system_prompt"]
+
+
+def test_update_is_copy_on_write_and_notifies_subscribers(manager):
+    model_changes, all_changes = [], []
+    manager.subscribe("model", lambda snapshot, keys: model_changes.append((snapshot.version, keys)))
+    unsubscribe = manager.subscribe("", lambda snapshot, keys: all_changes.append(keys))
+
+    before = manager.snapshot
+    manager.update("model.temperature", 0.7)
+    assert manager.get("model.temperature") == 0.7
+    assert before.get("model.temperature") == 0.2
+    assert model_changes == [(before.version + 1, ["model", "model.temperature"])]
+
+    # Unrelated keys only reach the catch-all subscriber; unchanged values notify nobody
+    manager.update("api.port", 9000)
+    manager.update("api.port", 9000)
+    assert len(model_changes) == 1 and all_changes[-1] == ["api", "api.port"] and len(all_changes) == 2
+
+    unsubscribe()
+    manager.update("api.port", 9001)
+    assert len(all_changes) == 2
+
+
+def test_reload_keeps_the_snapshot_on_broken_yaml(manager, tmp_path):
+    version = manager.snapshot.version
+    (tmp_path / "model_config.yaml").write_text("model: [unclosed", encoding="utf-8")
+    assert manager.reload() == []
+    assert manager.snapshot.version == version and manager.get("model.max_tokens") == 256
+
+    write_config(tmp_path, "model_config.yaml", {**MODEL_CONFIG, "model": {"max_tokens": 128, "temperature": 0.2}})
+    assert manager.reload() == ["model", "model.max_tokens"]
+    assert manager.get("model.max_tokens") == 128
+
+
+def test_watcher_hot_swaps_changed_files(manager, tmp_path):
+    changes = []
+    manager.subscribe("system_prompt", lambda snapshot, keys: changes.append(snapshot.get("system_prompt")))
+    manager.start_watcher(interval=0.05)
+
+    write_config(tmp_path, "app_config.yaml", {**APP_CONFIG, "system_prompt": "Sei geduldig."})
+    deadline = time.time() + 5
+    while not changes and time.time() < deadline:
+        time.sleep(0.05)
+    assert changes == ["Sei geduldig."]
+    assert manager.get_system_prompt() == "Sei geduldig."
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Background job tests for the German Language Teaching Chatbot
+Broker state transitions, retries and partial failures in the job service,
+and per-message results of batched generation
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Add the chatbot directory to the Python path (imported as the `app` package)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.jobs.broker import JobStatus, LocalBroker, SQLiteBroker, create_broker
+from app.jobs.service import JobService
+from app.models.kv_cache import KVMemoryBudget
+from app.models.model_manager import BatchResult, ModelOverloadedError, model_manager
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def broker(request, tmp_path):
+    broker = LocalBroker() if request.param == "local" else SQLiteBroker(str(tmp_path / "jobs.sqlite"))
+    yield broker
+    broker.close()
+
+
+# Brokers
+
+def test_job_lifecycle(broker):
+    job = broker.submit("chat", {"message": "Hallo", "max_tokens": 16})
+    assert broker.get(job.id).status == JobStatus.QUEUED
+
+    claimed = broker.claim(8, timeout=0)
+    assert [j.id for j in claimed] == [job.id]
+    assert broker.get(job.id).status == JobStatus.RUNNING
+    assert broker.claim(8, timeout=0) == []
+
+    broker.complete(job.id, {"response": "Guten Tag", "tokens_generated": 3})
+    done = broker.get(job.id)
+    assert done.status == JobStatus.DONE
+    assert done.result == {"response": "Guten Tag", "tokens_generated": 3}
+    assert done.queue_wait is not None and done.run_time is not None
+
+    # Finished jobs cannot change any more
+    broker.fail(job.id, "late failure")
+    assert broker.get(job.id).status == JobStatus.DONE
+
+
+def test_claim_is_oldest_first_and_bounded(broker):
+    ids = [broker.submit("chat", {"message": str(i)}).id for i in range(5)]
+    assert [j.id for j in broker.claim(3, timeout=0)] == ids[:3]
+    assert [j.id for j in broker.claim(3, timeout=0)] == ids[3:]
+    assert broker.counts()["running"] == 5
+
+
+def test_only_queued_jobs_can_be_cancelled(broker):
+    running = broker.submit("chat", {"message": "a"})
+    queued = broker.submit("chat", {"message": "b"})
+    broker.claim(1, timeout=0)
+
+    assert broker.cancel(running.id) is False
+    assert broker.get(running.id).status == JobStatus.RUNNING
+    assert broker.cancel(queued.id) is True
+    assert broker.get(queued.id).status == JobStatus.CANCELLED
+    assert broker.claim(8, timeout=0) == []
+
+
+def test_requeued_job_waits_for_its_delay(broker):
+    job = broker.submit("chat", {"message": "Hallo"})
+    broker.claim(1, timeout=0)
+    broker.requeue(job.id, delay=0.3, error="overloaded")
+
+    requeued = broker.get(job.id)
+    assert requeued.status == JobStatus.QUEUED
+    assert requeued.attempts == 1
+    assert requeued.error == "overloaded"
+    assert broker.claim(1, timeout=0) == []
+
+    start = time.time()
+    claimed = broker.claim(1, timeout=2)
+    assert [j.id for j in claimed] == [job.id]
+    assert 0.2 <= time.time() - start < 1.5
+    assert claimed[0].attempts == 1
+
+    broker.complete(job.id, {"response": "ok"})
+    assert broker.get(job.id).error is None
+
+
+def test_expire_and_prune(broker):
+    job = broker.submit("chat", {"message": "Hallo"})
+    broker.claim(1, timeout=0)
+    time.sleep(0.05)
+    assert broker.expire(time_limit=0.01) == 1
+    assert broker.get(job.id).status == JobStatus.FAILED
+    assert broker.prune(max_age=0) == 1
+    assert broker.get(job.id) is None
+
+
+def test_sqlite_jobs_survive_restart_and_old_files_are_migrated(tmp_path):
+    path = tmp_path / "jobs.sqlite"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+                 " status TEXT NOT NULL, submitted_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                 " result TEXT, error TEXT)")
+    conn.execute("INSERT INTO jobs (id, kind, payload, status, submitted_at) VALUES"
+                 " ('old', 'chat', '{\"message\": \"Hallo\"}', 'queued', 1.0)")
+    conn.commit()
+    conn.close()
+
+    broker = create_broker(f"sqlite:///{path}")
+    try:
+        job = broker.get("old")
+        assert job.status == JobStatus.QUEUED and job.attempts == 0
+        assert [j.id for j in broker.claim(1, timeout=0)] == ["old"]
+    finally:
+        broker.close()
+
+
+# Job service
+
+class FakeManager:
+    """chat_batch() answering from a function of the messages"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    def chat_batch(self, messages, max_tokens=None, batch_size=8):
+        self.calls.append(list(messages))
+        return self.answer(messages)
+
+
+def make_service(answer, max_retries=2):
+    service = JobService(FakeManager(answer))
+    service.broker = LocalBroker()
+    service.max_retries = max_retries
+    service.retry_delay = 0.0
+    return service
+
+
+def run_queued(service):
+    jobs = service.broker.claim(16, timeout=0)
+    service.process(jobs)
+    return jobs
+
+
+def test_results_carry_generated_token_counts():
+    service = make_service(lambda messages: [BatchResult(f"Antwort {i}", tokens_generated=7) for i in range(len(messages))])
+    chat = service.submit("chat", {"message": "a", "max_tokens": 16})
+    batch = service.submit("batch", {"messages": ["b", "c"], "max_tokens": 16})
+    run_queued(service)
+
+    assert service.get(chat.id).result == {"response": "Antwort 0", "tokens_generated": 7}
+    assert service.get(batch.id).result == {"responses": ["Antwort 1", "Antwort 2"], "tokens_generated": 14}
+    assert service.model_manager.calls == [["a", "b", "c"]]
+
+
+def test_failed_bucket_only_fails_its_own_jobs():
+    def answer(messages):
+        return [BatchResult(error="Generation failed: CUDA error") if m == "bad" else BatchResult(m.upper(), 1)
+                for m in messages]
+
+    service = make_service(answer)
+    ok = service.submit("chat", {"message": "gut"})
+    bad = service.submit("batch", {"messages": ["auch gut", "bad"]})
+    run_queued(service)
+
+    assert service.get(ok.id).status == JobStatus.DONE
+    failed = service.get(bad.id)
+    assert failed.status == JobStatus.FAILED
+    assert "CUDA error" in failed.error
+    assert service.stats["completed"] == 1 and service.stats["failed"] == 1
+
+
+def test_overloaded_call_requeues_then_gives_up():
+    def answer(messages):
+        raise ModelOverloadedError("Request shed because of memory pressure, retry later")
+
+    service = make_service(answer, max_retries=2)
+    job = service.submit("chat", {"message": "Hallo"})
+
+    for attempt in range(1, 3):
+        run_queued(service)
+        requeued = service.get(job.id)
+        assert requeued.status == JobStatus.QUEUED
+        assert requeued.attempts == attempt
+
+    run_queued(service)
+    failed = service.get(job.id)
+    assert failed.status == JobStatus.FAILED
+    assert "gave up after 3 attempts" in failed.error
+    assert service.stats["retried"] == 2
+
+
+def test_overload_mid_batch_keeps_finished_buckets():
+    def answer(messages):
+        return [BatchResult("fertig", 3)] + [BatchResult(error="KV cache budget exhausted", retryable=True)] * (len(messages) - 1)
+
+    service = make_service(answer)
+    first = service.submit("chat", {"message": "eins"})
+    second = service.submit("chat", {"message": "zwei"})
+    run_queued(service)
+
+    assert service.get(first.id).status == JobStatus.DONE
+    assert service.get(second.id).status == JobStatus.QUEUED
+    assert service.get(second.id).attempts == 1
+
+
+def test_housekeeping_runs_while_the_queue_is_busy():
+    def answer(messages):
+        time.sleep(0.05)
+        return [BatchResult("ok", 1) for _ in messages]
+
+    service = make_service(answer)
+    service.num_workers, service.batch_size, service.batch_wait = 1, 1, 0
+    service.time_limit, service.housekeeping_interval = 0.1, 0.05
+    stuck = service.submit("chat", {"message": "hängt"})
+    service.broker.claim(1, timeout=0)
+    for i in range(40):
+        service.submit("chat", {"message": str(i)})
+
+    service.start()
+    try:
+        time.sleep(0.5)
+        assert service.get(stuck.id).status == JobStatus.FAILED
+        # The worker never ran out of jobs in the meantime
+        assert service.broker.counts()["queued"] > 0
+        assert service.stats["expired"] == 1
+    finally:
+        service.stop()
+
+
+# Batched generation
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+    def batch_decode(self, ids, skip_special_tokens=True):
+        return [" ".join(str(int(i)) for i in row if int(i) != self.pad_token_id) for row in ids]
+
+
+class FakeChatTemplate:
+    def encode_prompt(self, system_prompt, message):
+        return [1] + [5 + len(message) % 50] * len(message)
+
+
+@pytest.fixture
+def tiny_manager(monkeypatch):
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=128, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, bos_token_id=1, eos_token_id=None,
+                         pad_token_id=0)
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    monkeypatch.setattr(model_manager, "model", model)
+    monkeypatch.setattr(model_manager, "tokenizer", FakeTokenizer())
+    monkeypatch.setattr(model_manager, "chat_template", FakeChatTemplate())
+    monkeypatch.setattr(model_manager, "kv_budget", KVMemoryBudget(total_bytes=None))
+    model_manager.kv_policy.bind(model, "cpu")
+    return model_manager
+
+
+def test_batch_counts_generated_token_ids(tiny_manager):
+    results = tiny_manager.chat_batch(["kurz", "eine deutlich längere Frage"], max_tokens=6, batch_size=2)
+    assert all(r.ok for r in results)
+    # Token ids, not words: no eos, so every row generates max_tokens ids
+    assert [r.tokens_generated for r in results] == [6, 6]
+
+
+def test_batch_overload_marks_remaining_buckets_retryable(tiny_manager, monkeypatch):
+    admitted = []
+    original = tiny_manager._kv_admission
+
+    def admission(kv_bytes):
+        if admitted:
+            raise ModelOverloadedError("KV cache budget exhausted, retry later")
+        admitted.append(kv_bytes)
+        return original(kv_bytes)
+
+    monkeypatch.setattr(tiny_manager, "_kv_admission", admission)
+    results = tiny_manager.chat_batch(["a" * 30, "b" * 20, "c" * 10, "d"], max_tokens=4, batch_size=2)
+
+    done = [r for r in results if r.ok]
+    retry = [r for r in results if not r.ok]
+    assert len(done) == 2 and all(r.tokens_generated == 4 for r in done)
+    assert len(retry) == 2 and all(r.retryable for r in retry)
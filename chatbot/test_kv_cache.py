@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+KV-cache tests for the German Language Teaching Chatbot
+Strategy fallback, the sliding window, memory estimates and KV-memory admission
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Add the chatbot directory to the Python path (imported as the `app` package)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.kv_cache import KVBudgetExceeded, KVCachePolicy, KVMemoryBudget
+from app.models.model_manager import ModelOverloadedError, model_manager
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=128, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, bos_token_id=1, pad_token_id=0)
+    return LlamaForCausalLM(config).eval()
+
+
+def test_bind_reads_cache_geometry(tiny_model):
+    policy = KVCachePolicy("dynamic")
+    policy.bind(tiny_model, "cpu")
+    # keys + values x layers x kv heads x head dim x fp32
+    assert policy.bytes_per_token_full == 2 * 2 * 2 * 16 * 4
+    assert policy.estimate_bytes(100, 28) == 128 * policy.bytes_per_token_full
+    assert policy.estimate_bytes(100, 28, batch_size=3) == 3 * 128 * policy.bytes_per_token_full
+
+
+def test_unusable_quantized_backend_falls_back_to_dynamic(tiny_model):
+    policy = KVCachePolicy("quantized", backend="not-a-backend")
+    policy.bind(tiny_model, "cpu")
+    assert policy.strategy == "dynamic"
+    assert policy.generation_kwargs() == {}
+    # Estimates follow the cache generate() really uses
+    assert policy.estimate_bytes(100, 28) == 128 * policy.bytes_per_token_full
+
+
+def test_offloaded_needs_cuda(tiny_model):
+    policy = KVCachePolicy("offloaded")
+    policy.bind(tiny_model, "cpu")
+    assert policy.strategy == "dynamic"
+
+
+def test_sliding_window_caps_the_cache(tiny_model):
+    policy = KVCachePolicy("sliding_window", window_length=8)
+    policy.bind(tiny_model, "cpu")
+    assert policy.strategy == "sliding_window"
+
+    input_ids = torch.randint(2, 128, (1, 12))
+    with torch.inference_mode():
+        output = tiny_model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                     max_new_tokens=20, min_new_tokens=20, do_sample=False, pad_token_id=0,
+                                     return_dict_in_generate=True, **policy.generation_kwargs())
+    assert output.sequences.shape[1] == 32
+    # Every layer keeps only the window
+    assert all(layer.keys.shape[-2] == 8 for layer in output.past_key_values.layers)
+    assert policy.estimate_bytes(12, 20) == 8 * policy.bytes_per_token_full
+    assert policy.estimate_bytes(3, 2) == 5 * policy.bytes_per_token_full
+
+    # Switching back to another strategy restores full attention
+    KVCachePolicy("dynamic").bind(tiny_model, "cpu")
+    assert tiny_model.config.sliding_window is None
+
+
+def test_quantized_estimate_is_smaller():
+    policy = KVCachePolicy("quantized", nbits=4, residual_length=128)
+    policy.bytes_per_token_full, policy.element_bytes = 1024, 2
+    full = KVCachePolicy("dynamic")
+    full.bytes_per_token_full = 1024
+    assert policy.estimate_bytes(128, 0) == full.estimate_bytes(128, 0)
+    assert policy.estimate_bytes(1000, 1000) < full.estimate_bytes(1000, 1000) / 2
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        KVCachePolicy("sink")
+
+
+def test_budget_rejects_request_larger_than_budget():
+    budget = KVMemoryBudget(total_bytes=1000)
+    with pytest.raises(KVBudgetExceeded):
+        with budget.reserve(1001):
+            pass
+    assert budget.rejected == 1
+    assert budget.reserved_bytes == 0
+
+
+def test_budget_waits_for_memory_to_be_released():
+    budget = KVMemoryBudget(total_bytes=1000, admission_timeout=5)
+    admitted_at = []
+
+    with budget.reserve(800):
+        def second():
+            with budget.reserve(500):
+                admitted_at.append(time.time())
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        time.sleep(0.2)
+        assert not admitted_at
+        released_at = time.time()
+    thread.join(timeout=5)
+
+    assert admitted_at and admitted_at[0] >= released_at
+    assert budget.waited == 1
+    assert budget.admitted == 2
+    assert budget.peak_reserved_bytes == 800
+    assert budget.reserved_bytes == 0 and budget.active == 0
+
+
+def test_budget_times_out():
+    budget = KVMemoryBudget(total_bytes=1000, admission_timeout=0.1)
+    with budget.reserve(800):
+        with pytest.raises(KVBudgetExceeded):
+            with budget.reserve(500):
+                pass
+    assert budget.rejected == 1
+
+
+def test_model_manager_sheds_when_budget_is_exhausted(monkeypatch):
+    monkeypatch.setattr(model_manager, "kv_budget", KVMemoryBudget(total_bytes=1000, admission_timeout=0.05))
+    shed_before = model_manager.memory_stats["shed_requests"]
+    with model_manager._kv_admission(900):
+        with pytest.raises(ModelOverloadedError):
+            with model_manager._kv_admission(200):
+                pass
+    assert model_manager.memory_stats["shed_requests"] == shed_before + 1
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Overflow routing tests for the German Language Teaching Chatbot
+Circuit breaker transitions, the overflow backend against the local OpenAI stub,
+the local/overflow decision, cancellation and config reloads
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Add the chatbot directory (the `app` package) and the repository root (scripts) to the Python path
+CHATBOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, CHATBOT_DIR)
+sys.path.append(os.path.dirname(CHATBOT_DIR))
+
+import app.routing.overflow as overflow
+from app.models.cancellation import CancellationToken, GenerationCancelled
+from app.routing.overflow import (
+    LOCAL, OVERFLOW, CircuitBreaker, LocalQueue, OverflowBackend, OverflowPolicy, OverflowUnavailable
+)
+from scripts.openai_stub_server import serve
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server = serve(port=0, latency=0.05)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def healthy_stub(stub):
+    stub.RequestHandlerClass.fail_rate = 0.0
+
+
+def make_backend(stub, **kwargs) -> OverflowBackend:
+    return OverflowBackend(base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1", model="stub", **kwargs)
+
+
+def local_model(latency: float = 0.0, answer: str = "local answer"):
+    def generate():
+        time.sleep(latency)
+        return answer
+    return generate
+
+
+# Circuit breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.times_opened == 1
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+# Overflow backend
+
+def test_backend_answers_from_stub(stub):
+    async def run():
+        backend = make_backend(stub)
+        try:
+            assert backend.available()
+            return await backend.chat("Du bist ein Deutschlehrer.", "Hallo", 16), backend
+        finally:
+            await backend.close()
+
+    text, backend = asyncio.run(run())
+    assert text.startswith("stub answer")
+    assert backend.requests == 1 and backend.errors == 0 and backend.in_flight == 0
+
+
+def test_backend_failures_open_the_circuit(stub):
+    stub.RequestHandlerClass.fail_rate = 1.0
+
+    async def run():
+        backend = make_backend(stub, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        try:
+            for _ in range(2):
+                assert backend.available()
+                with pytest.raises(OverflowUnavailable):
+                    await backend.chat("system", "Hallo")
+            assert not backend.available()
+            return backend
+        finally:
+            await backend.close()
+
+    backend = asyncio.run(run())
+    assert backend.errors == 2
+    assert backend.rejected_circuit == 1
+    assert backend.breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("error", [KeyError("choices"), ValueError("malformed answer")])
+def test_unexpected_errors_release_the_half_open_probe(stub, error):
+    async def run():
+        backend = make_backend(stub, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+        backend.breaker.record_failure()
+        await asyncio.sleep(0.06)
+
+        async def broken(**kwargs):
+            raise error
+        original = backend.client.chat.completions.create
+        backend.client.chat.completions.create = broken
+        try:
+            assert backend.available()
+            with pytest.raises(OverflowUnavailable):
+                await backend.chat("system", "Hallo")
+            assert backend.breaker.state == CircuitBreaker.OPEN
+
+            # The next probe after reset_timeout closes the circuit again
+            backend.client.chat.completions.create = original
+            await asyncio.sleep(0.06)
+            assert backend.available()
+            await backend.chat("system", "Hallo")
+            return backend
+        finally:
+            await backend.close()
+
+    backend = asyncio.run(run())
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+    assert backend.in_flight == 0
+
+
+def test_cancelled_request_releases_the_probe(stub):
+    stub.RequestHandlerClass.latency = 1.0
+
+    async def run():
+        backend = make_backend(stub, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+        backend.breaker.record_failure()
+        await asyncio.sleep(0.06)
+        try:
+            assert backend.available()
+            task = asyncio.create_task(backend.chat("system", "Hallo"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return backend
+        finally:
+            await backend.close()
+
+    try:
+        backend = asyncio.run(run())
+    finally:
+        stub.RequestHandlerClass.latency = 0.05
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    assert backend.breaker.allow()
+    assert backend.errors == 0
+
+
+# Overflow policy
+
+def test_without_backend_local_requests_are_not_gated():
+    policy = OverflowPolicy(LocalQueue(concurrency=1))
+
+    async def run():
+        start = time.time()
+        results = await asyncio.gather(*(policy.chat(local_model(0.3), "system", "Hallo") for _ in range(4)))
+        return results, time.time() - start
+
+    results, elapsed = asyncio.run(run())
+    assert all(backend == LOCAL for _, backend in results)
+    assert elapsed < 0.9
+    assert policy.served == {LOCAL: 4, OVERFLOW: 0}
+
+
+def test_long_queue_overflows(stub):
+    async def run():
+        policy = OverflowPolicy(LocalQueue(concurrency=1, expected_latency=0.2), make_backend(stub),
+                                queue_wait_threshold=0.3)
+        try:
+            results = await asyncio.gather(*(policy.chat(local_model(0.2), "system", f"Frage {i}")
+                                             for i in range(6)))
+            return policy, [backend for _, backend in results]
+        finally:
+            await policy.close()
+
+    policy, backends = asyncio.run(run())
+    # Requests 1 and 2 wait at most 0.2 s; the rest would wait longer than the threshold
+    assert backends[:2] == [LOCAL, LOCAL]
+    assert backends[2:] == [OVERFLOW] * 4
+    metrics = policy.get_metrics()
+    assert metrics["backends"][OVERFLOW]["served"] == 4
+    assert metrics["overflow_reasons"]["queue_wait"] == 4
+
+
+def test_shed_request_overflows(stub):
+    def shed():
+        raise Overloaded("shed")
+
+    async def run():
+        policy = OverflowPolicy(LocalQueue(), make_backend(stub))
+        try:
+            return policy, await policy.chat(shed, "system", "Hallo", overloaded_errors=(Overloaded,))
+        finally:
+            await policy.close()
+
+    policy, (text, backend) = asyncio.run(run())
+    assert backend == OVERFLOW and text.startswith("stub answer")
+    assert policy.overflow_reasons["local_overloaded"] == 1
+
+
+def test_shed_request_without_backend_raises():
+    def shed():
+        raise Overloaded("shed")
+
+    with pytest.raises(Overloaded):
+        asyncio.run(OverflowPolicy().chat(shed, "system", "Hallo", overloaded_errors=(Overloaded,)))
+
+
+def test_failing_backend_falls_back_to_local(stub):
+    stub.RequestHandlerClass.fail_rate = 1.0
+
+    async def run():
+        policy = OverflowPolicy(LocalQueue(concurrency=1, expected_latency=10), make_backend(stub),
+                                queue_wait_threshold=0.0)
+        try:
+            async with policy.local.slot():
+                # The local slot is busy, so this request tries the backend first
+                task = asyncio.create_task(policy.chat(local_model(), "system", "Hallo"))
+                await asyncio.sleep(0.2)
+            return policy, await task
+        finally:
+            await policy.close()
+
+    policy, (text, backend) = asyncio.run(run())
+    assert backend == LOCAL and text == "local answer"
+    assert policy.fallbacks == 1
+    assert policy.backend.errors == 1
+
+
+def test_disconnect_cancels_overflow_call(stub):
+    stub.RequestHandlerClass.latency = 1.0
+    generated = []
+
+    async def run():
+        policy = OverflowPolicy(LocalQueue(concurrency=1, expected_latency=10), make_backend(stub),
+                                queue_wait_threshold=0.0)
+        token = CancellationToken()
+        try:
+            async with policy.local.slot():
+                task = asyncio.create_task(policy.chat(lambda: generated.append(1), "system", "Hallo",
+                                                       cancel_token=token))
+                await asyncio.sleep(0.1)
+                start = time.time()
+                token.cancel("client disconnected")
+                with pytest.raises(GenerationCancelled):
+                    await task
+                return policy, time.time() - start
+        finally:
+            await policy.close()
+
+    try:
+        policy, elapsed = asyncio.run(run())
+    finally:
+        stub.RequestHandlerClass.latency = 0.05
+    assert elapsed < 0.5
+    assert policy.backend.in_flight == 0 and policy.backend.errors == 0
+    assert policy.get_metrics()["overflow_cancelled"] == 1
+    # Neither served nor retried locally
+    assert generated == [] and policy.fallbacks == 0
+
+
+class FakeConfig:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+def test_reload_closes_the_previous_client(stub, monkeypatch):
+    url = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+    config = FakeConfig({"overflow.enabled": True, "overflow.base_url": url, "overflow.model": "stub"})
+    monkeypatch.setattr(overflow, "get_config", lambda: config)
+    stub.RequestHandlerClass.latency = 0.5
+
+    async def run():
+        policy = OverflowPolicy()
+        policy._configure()
+        old = policy.backend
+        assert old.available()
+        task = asyncio.create_task(old.chat("system", "Hallo"))
+        await asyncio.sleep(0.1)
+
+        # Reloads run on the config watcher thread
+        config.values["overflow.model"] = "other"
+        await asyncio.get_running_loop().run_in_executor(None, policy._configure)
+        assert policy.backend is not old
+        # The request in flight finishes on the old client, which is closed afterwards
+        assert not old.client.is_closed()
+        assert (await task).startswith("stub answer")
+        await asyncio.sleep(0.05)
+        assert old.client.is_closed()
+        await policy.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stub.RequestHandlerClass.latency = 0.05
+
+
+def test_unused_client_is_closed_on_reload(stub, monkeypatch):
+    url = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+    config = FakeConfig({"overflow.enabled": True, "overflow.base_url": url, "overflow.model": "stub"})
+    monkeypatch.setattr(overflow, "get_config", lambda: config)
+
+    policy = OverflowPolicy()
+    policy._configure()
+    old = policy.backend
+    config.values["overflow.enabled"] = False
+    policy._configure()
+    assert policy.backend is None
+    assert old.client.is_closed()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Replica routing tests for the German Language Teaching Chatbot
+Failover between stub replicas, readiness-based health checks and pass-through
+of replica answers
+"""
+
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the chatbot directory (the `app` package) and the repository root (scripts) to the Python path
+CHATBOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, CHATBOT_DIR)
+sys.path.append(os.path.dirname(CHATBOT_DIR))
+
+from app.routing.affinity import AffinityRouter
+from app.routing.server import create_router_app
+from scripts.openai_stub_server import serve
+
+SESSION = {"X-Session-ID": "session-1"}
+
+
+@pytest.fixture
+def replicas():
+    stubs = [serve(port=0, name=f"replica-{i}") for i in range(2)]
+    yield stubs
+    for stub in stubs:
+        stub.shutdown()
+        stub.server_close()
+
+
+def url(stub) -> str:
+    return f"http://127.0.0.1:{stub.server_address[1]}"
+
+
+def make_client(urls, health_interval=0.05) -> TestClient:
+    router = AffinityRouter(urls, eject_after_failures=1, eject_cooldown=60)
+    return TestClient(create_router_app(router, health_interval=health_interval, health_timeout=1))
+
+
+def preferred(client, stubs):
+    """The stub the session's key maps to, and the other one"""
+    router = client.app.state.router
+    first = router.pick(router.routing_key({"message": "Hallo"}, SESSION["X-Session-ID"])).url
+    return sorted(stubs, key=lambda s: url(s) != first)
+
+
+def chat(client, message="Hallo"):
+    return client.post("/api/v1/chat", json={"message": message}, headers=SESSION)
+
+
+def test_session_sticks_to_one_replica(replicas):
+    with make_client([url(s) for s in replicas]) as client:
+        routed = {chat(client).headers["X-Routed-To"] for _ in range(5)}
+    assert len(routed) == 1
+
+
+def test_unreachable_replica_fails_over(replicas):
+    with make_client([url(s) for s in replicas], health_interval=60) as client:
+        first, second = preferred(client, replicas)
+        # Let the first health check round pass while both replicas are up
+        time.sleep(0.3)
+        first.shutdown()
+        first.server_close()
+
+        response = chat(client)
+        assert response.status_code == 200
+        assert response.headers["X-Routed-To"] == url(second)
+        assert response.json()["response"].startswith("replica-")
+
+        stats = {r["url"]: r for r in client.get("/router/stats").json()["replicas"]}
+        assert stats[url(first)]["errors"] == 1
+        assert not stats[url(first)]["available"]
+
+
+def test_replica_not_ready_gets_no_traffic(replicas):
+    with make_client([url(s) for s in replicas]) as client:
+        first, second = preferred(client, replicas)
+        # Still loading its model: /api/v1/health answers 200, /api/v1/ready 503
+        first.RequestHandlerClass.healthy = False
+        time.sleep(0.3)
+        assert chat(client).headers["X-Routed-To"] == url(second)
+        stats = {r["url"]: r for r in client.get("/router/stats").json()["replicas"]}
+        assert stats[url(first)]["requests"] == 0 and stats[url(first)]["errors"] == 0
+
+        first.RequestHandlerClass.healthy = True
+        time.sleep(0.3)
+        assert chat(client).headers["X-Routed-To"] == url(first)
+
+
+def test_no_ready_replica_answers_503(replicas):
+    with make_client([url(s) for s in replicas]) as client:
+        for stub in replicas:
+            stub.RequestHandlerClass.healthy = False
+        time.sleep(0.3)
+        response = chat(client)
+        assert response.status_code == 503
+        assert client.get("/health").status_code == 503
+
+
+def test_non_json_answers_are_passed_through(replicas):
+    def plain_text(self, request, request_no):
+        body = b"Not Found"
+        self.send_response(404)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    for stub in replicas:
+        stub.RequestHandlerClass._chatbot_chat = plain_text
+    with make_client([url(s) for s in replicas]) as client:
+        response = chat(client)
+    assert response.status_code == 404
+    assert response.text == "Not Found"
+    assert response.headers["content-type"].startswith("text/plain")
@@ -13,6 +13,9 @@ CHECKPOINT_PATH = MODELS_PATH / "checkpoint-3"
 # Model
 MODEL_ID = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"
 TRUST_REMOTE_CODE = True
+# Quantized model artifacts (utils/model_cache.py), keyed by model id, quantization and library versions
+USE_MODEL_CACHE = True
+MODEL_CACHE_PATH = MODELS_PATH / "cache"
 
 # Finetune
 USE_4BIT = True
@@ -47,6 +50,41 @@ TRAINING_ARGS = {
     "learning_rate": 2e-4,
     "fp16": True
 }
+TRAIN_DATASET_PATH = DATA_PATH / "Samples ChatGPT" / "train_teacher_deduplicated.jsonl"
+MAX_SEQ_LENGTH = 1024
+ADAPTER_NAME = "qwen-lora-finetuned"
+
+# Micro-batch search (scripts/train_lora.py); the effective batch
+# per_device_train_batch_size * gradient_accumulation_steps is preserved
+BATCH_SIZE_SEARCH = {
+    "enabled": True,
+    "candidates": [1, 2, 4, 8, 16, 32],
+    "gradient_checkpointing": [False, True],
+    "probe_steps": 3,            # measured steps per candidate (after one warm-up step)
+    "memory_headroom": 0.9       # use at most this share of the MAX_MEMORY budget
+}
+
+# Checkpointing (utils/async_checkpoint.py): adapter-only saves on a background thread
+CHECKPOINTING = {
+    "async": True,
+    "max_pending": 1             # snapshots queued before the training loop waits for the writer
+}
+
+# Load-option matrix benchmarked by scripts/benchmark_load_matrix.py
+# (nf4 = BNB_4BIT_CONFIG, int8 = optimization section of chatbot/config/model_config.yaml)
+LOAD_MATRIX = {
+    "quantization": ["fp32", "fp16", "bf16", "nf4", "int8"],
+    "adapter": ["none", "unmerged", "merged"],
+    "device": ["cpu", "cuda"]
+}
+
+# Training profiler (utils/training_profiler.py)
+TRAINING_PROFILER = {
+    "enabled": False,
+    "profile_steps": None,       # e.g. (10, 13): capture a torch.profiler trace for these steps
+    "warmup_steps": 2,           # steps excluded from the summary
+    "sync_cuda": True            # synchronize CUDA at phase boundaries for accurate timings
+}
 
 # System prompt
 SYSTEM_PROMPT = (
@@ -64,3 +102,33 @@ MAX_TOKENS = 512
 TEMPERATURE = 0.2
 DO_SAMPLE = False
 MAX_MEMORY = {0: "12GiB", "cpu": "16GiB"}
+GENERATION_BATCH_SIZE = 8
+USE_GENERATION_CACHE = True
+GENERATION_CACHE_PATH = DATA_PATH / "cache" / "generations.sqlite"
+
+# Dataset storage (Arrow shards)
+DATASET_STORAGE = {
+    "shard_rows": 10000,
+    "compression": None          # "zstd" trades zero-copy loading for smaller files
+}
+
+# Annotation (OpenAI-compatible API)
+OPENAI_MODEL = "gpt-4"
+OPENAI_BASE_URL = None          # e.g. "http://localhost:8080/v1" for a local compatible server
+ANNOTATION_CONFIG = {
+    "max_concurrency": 8,
+    "requests_per_minute": 500,
+    "tokens_per_minute": 80000,
+    "max_retries": 6,
+    "backoff_base": 1.0,
+    "backoff_max": 60.0,
+    "request_timeout": 120,
+    "temperature": 0.7,
+    "max_tokens": 768
+}
+# USD per 1K tokens
+OPENAI_PRICING = {
+    "gpt-4": {"prompt": 0.03, "completion": 0.06},
+    "gpt-4o": {"prompt": 0.0025, "completion": 0.01},
+    "gpt-4o-mini": {"prompt": 0.00015, "completion": 0.0006}
+}
@@ -0,0 +1,93 @@
+"""
+Benchmark sequential pipeline generation vs batched, length-bucketed generation on CPU.
+
+Uses a tiny causal LM so it runs anywhere; pass --docx to use real dialog blocks
+instead of synthetic ones.
+
+Usage:
+    python scripts/benchmark_batched_generation.py --model sshleifer/tiny-gpt2 --samples 64
+
+Reference run (random 2-layer Llama, hidden size 64, ChatML BPE tokenizer with 600
+tokens; 64 synthetic samples, 32 new tokens each; one CPU core, torch 2.14,
+transformers 5.19; two runs):
+    sequential pipeline   9.2 - 9.4 samples/s
+    batched bs=1         10.6 - 12.6 samples/s  (1.1 - 1.4x)
+    batched bs=4         15.7 - 18.2 samples/s  (1.7 - 2.0x)
+    batched bs=8         18.9 - 21.4 samples/s  (2.0 - 2.3x)
+    batched bs=16        20.9 - 21.3 samples/s  (2.3x)
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+from utils.batched_generation import generate_batched
+from utils.chat_template import render_prompt
+from utils.data_preparation_utils import block_to_sample, extract_blocks_from_docx, is_valid_block
+
+WORDS = ["Kunde", "Verkäufer", "Ich", "möchte", "ein", "Brot", "bitte", "Was", "kostet", "das",
+         "Danke", "Guten", "Tag", "Haben", "Sie", "Milch", "Äpfel", "Euro", "noch", "etwas"]
+
+
+def synthetic_blocks(n, seed=0):
+    rng = random.Random(seed)
+    blocks = []
+    for _ in range(n):
+        lines = [f"{rng.choice(['Kunde', 'Verkäufer'])}: " + " ".join(rng.choices(WORDS, k=rng.randint(4, 14)))
+                 for _ in range(rng.randint(2, 20))]
+        blocks.append("\n".join(lines))
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--docx", default=None)
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32).eval()
+
+    if args.docx:
+        blocks = [b for b in extract_blocks_from_docx(args.docx) if is_valid_block(b)][:args.samples]
+    else:
+        blocks = synthetic_blocks(args.samples)
+    samples = [block_to_sample(b) for b in blocks]
+    # Fixed output length so every configuration decodes the same number of tokens
+    fixed = {"min_new_tokens": args.max_new_tokens, "do_sample": False}
+    print(f"📄 {len(samples)} samples, model {args.model}, {args.max_new_tokens} new tokens each")
+
+    generator = pipeline("text-generation", model=model, tokenizer=tokenizer, pad_token_id=tokenizer.eos_token_id)
+    start = time.perf_counter()
+    for s in samples:
+        prompt = render_prompt(s["system"], s["instruction"])
+        generator(prompt, max_new_tokens=args.max_new_tokens, return_full_text=False, **fixed)
+    baseline = time.perf_counter() - start
+    print(f"⏱ sequential pipeline: {baseline:.2f}s ({len(samples) / baseline:.2f} samples/s)")
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        start = time.perf_counter()
+        done = 0
+        for indices, _ in generate_batched(model, tokenizer, samples, batch_size=batch_size,
+                                           max_new_tokens=args.max_new_tokens, use_cache=False, **fixed):
+            done += len(indices)
+        elapsed = time.perf_counter() - start
+        print(f"⏱ batched bs={batch_size:<3}: {elapsed:.2f}s ({done / elapsed:.2f} samples/s, "
+              f"{baseline / elapsed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
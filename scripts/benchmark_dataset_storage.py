@@ -0,0 +1,92 @@
+"""
+Benchmark dataset loading: JSONL (json.loads, datasets.load_dataset) vs memory-mapped Arrow shards.
+
+Each loader runs in a fresh subprocess so load time and RSS growth are measured in isolation.
+
+Usage:
+    python scripts/benchmark_dataset_storage.py data/train_sft.jsonl [--tokenizer <model id>] [--compression zstd]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+LOADERS = {
+    "jsonl_json_loads": """
+with open(PATH, "r", encoding="utf-8") as f:
+    data = [json.loads(line) for line in f if line.strip()]
+rows = len(data)
+""",
+    "jsonl_load_dataset": """
+from datasets import load_dataset
+data = load_dataset("json", data_files=PATH, split="train")
+rows = len(data)
+""",
+    "arrow_mmap_table": """
+from utils.dataset_storage import open_table
+data = open_table(PATH)
+rows = data.num_rows
+""",
+    "arrow_hf_dataset": """
+from utils.dataset_storage import load_hf_dataset
+data = load_hf_dataset(PATH)
+rows = len(data)
+"""
+}
+
+RUNNER = """
+import json, sys, time, psutil
+sys.path.append({root!r})
+PATH = {path!r}
+process = psutil.Process()
+rss_before = process.memory_info().rss
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"rows": rows, "seconds": elapsed, "rss_mb": (process.memory_info().rss - rss_before) / 1024 ** 2}}))
+"""
+
+
+def run_loader(name, path):
+    code = RUNNER.format(root=str(ROOT), path=str(path), body=LOADERS[name])
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("jsonl")
+    parser.add_argument("--tokenizer", default=None)
+    parser.add_argument("--compression", choices=["zstd", "lz4"], default=None)
+    args = parser.parse_args()
+
+    from utils.dataset_storage import convert_jsonl
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        arrow_dir = Path(tmp) / "arrow"
+        convert_jsonl(args.jsonl, arrow_dir, tokenizer=tokenizer, compression=args.compression)
+        jsonl_mb = Path(args.jsonl).stat().st_size / 1024 ** 2
+        arrow_mb = sum(p.stat().st_size for p in arrow_dir.glob("*.arrow")) / 1024 ** 2
+        print(f"💾 JSONL {jsonl_mb:.1f} MB, Arrow {arrow_mb:.1f} MB "
+              f"({'tokenized, ' if tokenizer else ''}compression={args.compression})")
+
+        for name in LOADERS:
+            path = args.jsonl if name.startswith("jsonl") else arrow_dir
+            result = run_loader(name, path)
+            print(f"⏱ {name:<20} rows={result['rows']:<8} {result['seconds'] * 1e3:9.1f} ms   "
+                  f"RSS +{result['rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Data-parallel scaling benchmark: run scripts/train_lora.py under torchrun with 1/2/4 processes
+on a tiny causal LM (gloo on CPU, NCCL on GPUs) and report tokens/sec per process.
+
+Per-process throughput comes from ThroughputProfilerCallback on rank 0 (non-padding tokens
+of its shard). CPU threads are split evenly between processes so runs are comparable.
+
+Usage:
+    python scripts/benchmark_ddp_scaling.py [--model hf-internal-testing/tiny-random-LlamaForCausalLM] [--procs 1 2 4]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def write_synthetic_dataset(path, samples):
+    rng = random.Random(0)
+    words = ["Hallo", "wie", "geht", "es", "dir", "ich", "habe", "einen", "Fehler", "gemacht", "Danke"]
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(samples):
+            record = {
+                "system": "Du bist ein Lehrer.",
+                "instruction": " ".join(rng.choice(words) for _ in range(rng.randint(10, 60))),
+                "response": " ".join(rng.choice(words) for _ in range(rng.randint(10, 120)))
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def run(procs, args, data_path, output_dir):
+    env = {**os.environ, "OMP_NUM_THREADS": str(max(1, (os.cpu_count() or 1) // procs))}
+    command = [
+        sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={procs}",
+        str(ROOT / "scripts" / "train_lora.py"),
+        "--model", args.model,
+        "--data", str(data_path),
+        "--output-dir", str(output_dir),
+        "--micro-batch", str(args.micro_batch),
+        "--max-steps", str(args.steps),
+        "--max-length", "256",
+        "--profile"
+    ]
+    subprocess.run(command, env=env, check=True, cwd=ROOT)
+    with open(Path(output_dir) / "profile_summary.json", "r", encoding="utf-8") as f:
+        return json.load(f)["summary"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-LlamaForCausalLM")
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--micro-batch", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = Path(tmp) / "train.jsonl"
+        write_synthetic_dataset(data_path, args.samples)
+
+        rows = []
+        for procs in args.procs:
+            summary = run(procs, args, data_path, Path(tmp) / f"run-{procs}")
+            rows.append((procs, summary))
+
+        base = rows[0][1]["tokens_per_sec"]
+        print(f"\n{'procs':>5} {'tokens/s per process':>22} {'total tokens/s':>15} {'scaling':>8} {'step ms':>8}")
+        for procs, summary in rows:
+            per_process = summary["tokens_per_sec"]
+            total = per_process * procs
+            print(f"{procs:>5} {per_process:>22,.0f} {total:>15,.0f} {total / base:>7.2f}x "
+                  f"{summary['step_time_mean'] * 1e3:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark a matrix of model load options: quantization (fp32/fp16/bf16, NF4 from config.py,
+int8 from chatbot/config/model_config.yaml) x LoRA adapter (none/unmerged/merged) x device (cpu/cuda).
+
+Every cell runs in a fresh subprocess and reports load time, resident memory, prefill latency,
+decode tokens/sec and greedy-output agreement with the reference (first cell that ran).
+Cells this machine cannot run (GPU-only quantization, missing CUDA/bitsandbytes, no adapter)
+are skipped with a reason. Results are printed and saved to results/load_matrix.csv.
+
+Usage:
+    python scripts/benchmark_load_matrix.py --model hf-internal-testing/tiny-random-LlamaForCausalLM [--adapter models/qwen-lora-finetuned]
+    python scripts/benchmark_load_matrix.py --quantization fp32 nf4 --adapter-modes none merged --devices cuda
+"""
+
+import argparse
+import csv
+import importlib.util
+import itertools
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from config import BASE_DIR, LOAD_MATRIX, MODEL_ID, RESULTS_PATH, SYSTEM_PROMPT
+
+MODEL_CONFIG_PATH = BASE_DIR / "chatbot" / "config" / "model_config.yaml"
+QUANTIZED = {"nf4", "int8"}
+DTYPES = {"fp32": "float32", "fp16": "float16", "bf16": "bfloat16"}
+PROMPTS = [
+    "Korrigiere bitte: Ich gehe am Montag ins Schule.",
+    "Объясни разницу между „wissen“ и „kennen“.",
+    "Kunde: Ich möchte ein Brot, bitte. Verkäufer: Was noch?"
+]
+
+
+def skip_reason(cell, adapter_path):
+    """
+    Why a cell can't run here, or None
+    """
+    import torch
+
+    if cell["device"] == "cuda" and not torch.cuda.is_available():
+        return "CUDA not available"
+    if cell["quantization"] in QUANTIZED:
+        if cell["device"] != "cuda":
+            return "bitsandbytes quantization is GPU-only"
+        if importlib.util.find_spec("bitsandbytes") is None:
+            return "bitsandbytes not installed"
+    if cell["quantization"] == "bf16" and cell["device"] == "cuda" and not torch.cuda.is_bf16_supported():
+        return "bf16 not supported on this GPU"
+    if cell["adapter"] != "none" and not adapter_path:
+        return "no --adapter given"
+    if cell["adapter"] == "merged" and cell["quantization"] in QUANTIZED:
+        return "merging into quantized weights is lossy"
+    return None
+
+
+def load_cell(model_id, cell, adapter_path):
+    import torch
+    import yaml
+    from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+
+    from config import BNB_4BIT_CONFIG, TRUST_REMOTE_CODE
+
+    kwargs = {"trust_remote_code": TRUST_REMOTE_CODE, "low_cpu_mem_usage": True}
+    quantization = cell["quantization"]
+    if quantization == "nf4":
+        kwargs["quantization_config"] = BitsAndBytesConfig(**{
+            **BNB_4BIT_CONFIG,
+            "bnb_4bit_compute_dtype": getattr(torch, BNB_4BIT_CONFIG["bnb_4bit_compute_dtype"])
+        })
+        kwargs["device_map"] = {"": 0}
+    elif quantization == "int8":
+        with open(MODEL_CONFIG_PATH, "r", encoding="utf-8") as f:
+            optimization = yaml.safe_load(f)["optimization"]
+        kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_8bit=True,
+            llm_int8_threshold=optimization.get("llm_int8_threshold", 6.0),
+            llm_int8_has_fp16_weight=optimization.get("llm_int8_has_fp16_weight", False)
+        )
+        kwargs["torch_dtype"] = getattr(torch, optimization.get("torch_dtype", "float16"))
+        kwargs["device_map"] = {"": 0}
+    else:
+        kwargs["torch_dtype"] = getattr(torch, DTYPES[quantization])
+
+    model = AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
+    if quantization not in QUANTIZED:
+        model.to(cell["device"])
+    if cell["adapter"] != "none":
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, adapter_path)
+        if cell["adapter"] == "merged":
+            model = model.merge_and_unload()
+    return model.eval()
+
+
+def run_cell(model_id, cell, adapter_path, max_new_tokens):
+    """
+    Executed in the child process; returns the measurements as a dict
+    """
+    import time
+
+    import psutil
+    import torch
+    from transformers import AutoTokenizer
+
+    from utils.chat_template import get_chat_template
+
+    process = psutil.Process()
+    cuda = cell["device"] == "cuda"
+
+    def sync():
+        if cuda:
+            torch.cuda.synchronize()
+
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = load_cell(model_id, cell, adapter_path)
+    sync()
+    load_time = time.perf_counter() - start
+    rss_mb = (process.memory_info().rss - rss_before) / 1024 ** 2
+    gpu_mb = torch.cuda.memory_allocated() / 1024 ** 2 if cuda else 0.0
+
+    template = get_chat_template(tokenizer)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    device = next(model.parameters()).device
+    prefill, decode, outputs = [], [], []
+    with torch.inference_mode():
+        for prompt in PROMPTS:
+            input_ids = torch.tensor([template.encode_prompt(SYSTEM_PROMPT, prompt)], device=device)
+            model(input_ids=input_ids)  # warm-up
+            sync()
+            start = time.perf_counter()
+            model(input_ids=input_ids)
+            sync()
+            prefill.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            output = model.generate(input_ids=input_ids, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                                    do_sample=False, pad_token_id=pad_token_id)
+            sync()
+            elapsed = time.perf_counter() - start
+            new_tokens = output[0, input_ids.shape[1]:].tolist()
+            decode.append((len(new_tokens) - 1) / max(elapsed - prefill[-1], 1e-9))
+            outputs.append(new_tokens)
+
+    return {
+        "load_sec": load_time,
+        "rss_mb": rss_mb,
+        "gpu_mb": gpu_mb,
+        "prefill_ms": sum(prefill) / len(prefill) * 1e3,
+        "decode_tokens_per_sec": sum(decode) / len(decode),
+        "outputs": outputs
+    }
+
+
+def agreement(outputs, reference):
+    """
+    Share of greedy tokens equal to the reference at the same position, and exact-match rate
+    """
+    same = total = exact = 0
+    for out, ref in zip(outputs, reference):
+        total += max(len(out), len(ref))
+        same += sum(a == b for a, b in zip(out, ref))
+        exact += out == ref
+    return same / total if total else 1.0, exact / len(reference) if reference else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--adapter", default=None, help="LoRA adapter directory for the adapter cells")
+    parser.add_argument("--quantization", nargs="+", default=LOAD_MATRIX["quantization"],
+                        choices=list(DTYPES) + sorted(QUANTIZED))
+    parser.add_argument("--adapter-modes", nargs="+", default=LOAD_MATRIX["adapter"],
+                        choices=["none", "unmerged", "merged"])
+    parser.add_argument("--devices", nargs="+", default=LOAD_MATRIX["device"], choices=["cpu", "cuda"])
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--output", default=str(RESULTS_PATH / "load_matrix.csv"))
+    parser.add_argument("--cell", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cell:
+        # Child process: measure one cell and print JSON on the last line
+        print(json.dumps(run_cell(args.model, json.loads(args.cell), args.adapter, args.max_new_tokens)))
+        return
+
+    cells = [{"quantization": q, "adapter": a, "device": d}
+             for d, q, a in itertools.product(args.devices, args.quantization, args.adapter_modes)]
+    rows, reference = [], None
+    for cell in cells:
+        name = f"{cell['device']}/{cell['quantization']}/{cell['adapter']}"
+        row = {"cell": name, **cell}
+        reason = skip_reason(cell, args.adapter)
+        if reason:
+            row["status"] = f"skipped: {reason}"
+            print(f"⏭ {name}: {reason}")
+            rows.append(row)
+            continue
+
+        command = [sys.executable, str(Path(__file__).resolve()), "--model", args.model, "--cell", json.dumps(cell),
+                   "--max-new-tokens", str(args.max_new_tokens)]
+        if args.adapter:
+            command += ["--adapter", args.adapter]
+        out = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+        if out.returncode != 0:
+            error = (out.stderr.strip().splitlines() or ["unknown error"])[-1]
+            row["status"] = f"error: {error}"
+            print(f"❌ {name}: {error}")
+            rows.append(row)
+            continue
+
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        outputs = result.pop("outputs")
+        if reference is None:
+            reference = outputs
+            row["reference"] = True
+        token_agreement, exact_match = agreement(outputs, reference)
+        row.update({k: round(v, 3) for k, v in result.items()})
+        row.update({"status": "ok", "token_agreement": round(token_agreement, 3), "exact_match": exact_match})
+        print(f"✅ {name}: load {row['load_sec']:.2f}s, RSS +{row['rss_mb']:.0f} MB, GPU {row['gpu_mb']:.0f} MB, "
+              f"prefill {row['prefill_ms']:.1f} ms, decode {row['decode_tokens_per_sec']:.1f} tokens/s, "
+              f"agreement {token_agreement:.1%}")
+        rows.append(row)
+
+    columns = ["cell", "device", "quantization", "adapter", "status", "load_sec", "rss_mb", "gpu_mb", "prefill_ms",
+               "decode_tokens_per_sec", "token_agreement", "exact_match", "reference"]
+    print(f"\n{'cell':<24} {'load s':>7} {'RSS MB':>8} {'GPU MB':>8} {'prefill ms':>11} {'tok/s':>8} {'agree':>6}  status")
+    for row in rows:
+        if row["status"] == "ok":
+            print(f"{row['cell']:<24} {row['load_sec']:>7.2f} {row['rss_mb']:>8.0f} {row['gpu_mb']:>8.0f} "
+                  f"{row['prefill_ms']:>11.1f} {row['decode_tokens_per_sec']:>8.1f} {row['token_agreement']:>6.1%}  ok")
+        else:
+            print(f"{row['cell']:<24} {'':>7} {'':>8} {'':>8} {'':>11} {'':>8} {'':>6}  {row['status']}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"💾 Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
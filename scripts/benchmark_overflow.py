@@ -0,0 +1,106 @@
+"""
+Exercise overflow routing against a local stub backend.
+
+Starts the OpenAI-compatible stub (scripts/openai_stub_server.py) as the
+overflow backend and simulates the local model with a fixed generation time.
+Then sends a burst of concurrent chat requests, as at lesson start, and reports
+which backend served them, the latency per backend, and what the circuit
+breaker does when the overflow backend starts failing.
+
+Usage:
+    python scripts/benchmark_overflow.py --requests 40 --local-latency 0.25 --threshold 1
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.insert(0, str(ROOT / "chatbot"))
+
+from app.routing.overflow import CircuitBreaker, LocalQueue, OverflowBackend, OverflowPolicy
+from scripts.openai_stub_server import serve
+
+
+def make_local_model(latency):
+    def generate():
+        time.sleep(latency)
+        return "local answer"
+    return generate
+
+
+async def burst(policy, requests, local_latency):
+    async def one(i):
+        _, backend = await policy.chat(make_local_model(local_latency), "Du bist ein Deutschlehrer.",
+                                       f"Frage {i}", 64)
+        return backend
+
+    return Counter(await asyncio.gather(*(one(i) for i in range(requests))))
+
+
+def report(title, served, policy):
+    metrics = policy.get_metrics()
+    overflow = metrics["overflow"]
+    print(f"\n{title}")
+    print(f"   served: {dict(served)}")
+    for name, backend in metrics["backends"].items():
+        print(f"   {name}: p50 {backend['latency_p50'] * 1e3:.0f} ms, p95 {backend['latency_p95'] * 1e3:.0f} ms")
+    if overflow is None:
+        return
+    print(f"   overflow reasons {metrics['overflow_reasons']}, fallbacks to local {metrics['overflow_fallbacks']}")
+    print(f"   overflow backend (totals): {overflow['requests']} requests, {overflow['errors']} errors, "
+          f"{overflow['rejected_concurrency']} over the concurrency limit, "
+          f"{overflow['rejected_circuit']} refused by the circuit ({overflow['circuit']['state']})")
+
+
+async def run(args):
+    stub = serve(port=args.port, latency=args.overflow_latency)
+    backend = OverflowBackend(
+        base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        model="stub",
+        max_concurrency=args.max_concurrency,
+        breaker=CircuitBreaker(failure_threshold=args.failure_threshold, reset_timeout=args.reset_timeout)
+    )
+    try:
+        # Without overflow: everything waits for the local model
+        policy = OverflowPolicy(LocalQueue(args.local_concurrency, args.local_latency))
+        report("🐢 Local model only", await burst(policy, args.requests, args.local_latency), policy)
+
+        policy = OverflowPolicy(LocalQueue(args.local_concurrency, args.local_latency), backend,
+                                queue_wait_threshold=args.threshold)
+        report("✅ Overflow enabled", await burst(policy, args.requests, args.local_latency), policy)
+
+        # Failing backend: the breaker opens and requests stay local
+        stub.RequestHandlerClass.fail_rate = 1.0
+        report("⚠️ Overflow backend failing", await burst(policy, args.requests, args.local_latency), policy)
+
+        # After reset_timeout a probe closes the circuit again
+        stub.RequestHandlerClass.fail_rate = 0.0
+        await asyncio.sleep(args.reset_timeout)
+        report("🔁 Overflow backend recovered", await burst(policy, args.requests, args.local_latency), policy)
+    finally:
+        await backend.close()
+        stub.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8301)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--local-latency", type=float, default=0.25, help="Simulated local generation time (s)")
+    parser.add_argument("--local-concurrency", type=int, default=1)
+    parser.add_argument("--overflow-latency", type=float, default=0.2, help="Stub backend latency (s)")
+    parser.add_argument("--threshold", type=float, default=1.0, help="Queue wait before overflowing (s)")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--reset-timeout", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
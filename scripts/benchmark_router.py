@@ -0,0 +1,114 @@
+"""
+Exercise the cache-affinity router against local stub replicas.
+
+Starts N stub replicas (scripts/openai_stub_server.py) and the router, then sends
+requests for a set of sessions and reports how consistently each session stayed
+on one replica, the load spread, what happens when a replica fails its health
+check, and the router's per-replica stats.
+
+Usage:
+    python scripts/benchmark_router.py --replicas 3 --sessions 50 --requests 400 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.insert(0, str(ROOT / "chatbot"))
+
+import httpx
+import uvicorn
+
+from app.routing.affinity import AffinityRouter
+from app.routing.server import create_router_app
+from scripts.openai_stub_server import serve
+
+
+async def send_requests(url, sessions, requests, concurrency):
+    placements = defaultdict(Counter)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def one(i):
+            session = f"session-{i % sessions}"
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(f"{url}/api/v1/chat", json={"message": f"Frage {i}", "session_id": session})
+                latencies.append(time.perf_counter() - start)
+            placements[session][response.headers.get("X-Routed-To", f"HTTP {response.status_code}")] += 1
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+    return placements, latencies
+
+
+def report(title, placements, latencies):
+    sticky = sum(max(c.values()) for c in placements.values()) / max(1, sum(sum(c.values()) for c in placements.values()))
+    load = Counter()
+    for counts in placements.values():
+        load.update(counts)
+    latencies.sort()
+    print(f"\n{title}")
+    print(f"   session stickiness: {sticky:.1%}  (requests served by the session's main replica)")
+    print(f"   latency p50 {latencies[len(latencies) // 2] * 1e3:.1f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1e3:.1f} ms")
+    for replica, count in sorted(load.items()):
+        print(f"   {replica}: {count} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=8201)
+    parser.add_argument("--router-port", type=int, default=8200)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub replica latency in seconds")
+    parser.add_argument("--load-factor", type=float, default=1.25)
+    args = parser.parse_args()
+
+    stubs = [serve(port=args.base_port + i, latency=args.latency, name=f"replica-{i}") for i in range(args.replicas)]
+    router = AffinityRouter([f"http://127.0.0.1:{s.server_address[1]}" for s in stubs], load_factor=args.load_factor)
+    app = create_router_app(router, health_interval=0.5, health_timeout=1)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.router_port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    url = f"http://127.0.0.1:{args.router_port}"
+
+    try:
+        placements, latencies = asyncio.run(send_requests(url, args.sessions, args.requests, args.concurrency))
+        report("✅ All replicas healthy", placements, latencies)
+        before = {s: c.most_common(1)[0][0] for s, c in placements.items()}
+
+        # Fail one replica's health check: its sessions move, the others stay put
+        stubs[0].RequestHandlerClass.healthy = False
+        time.sleep(1.5)
+        placements, latencies = asyncio.run(send_requests(url, args.sessions, args.requests, args.concurrency))
+        report(f"⚠️ {router.replicas[0].url} failing health checks", placements, latencies)
+        after = {s: c.most_common(1)[0][0] for s, c in placements.items()}
+        moved = [s for s in before if before[s] != after.get(s)]
+        displaced = [s for s in before if before[s] == router.replicas[0].url]
+        print(f"   sessions moved: {len(moved)} (sessions that were on the ejected replica: {len(displaced)})")
+
+        stubs[0].RequestHandlerClass.healthy = True
+        time.sleep(1.5)
+        print(f"\n📊 Router stats after re-admission: {httpx.get(f'{url}/router/stats').json()['available_replicas']} "
+              f"replicas available")
+        for replica in router.stats()["replicas"]:
+            print(f"   {replica['url']}: {replica['requests']} requests, {replica['fallbacks']} fallbacks, "
+                  f"p50 {replica['latency_p50'] * 1e3:.1f} ms, p95 {replica['latency_p95'] * 1e3:.1f} ms")
+    finally:
+        server.should_exit = True
+        for stub in stubs:
+            stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark prompt tokenization: full-string re-tokenization vs the pre-tokenized ChatTemplate.
+
+Usage:
+    python scripts/benchmark_tokenization.py --data data/train_sft.jsonl --tokenizer <model id>
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from transformers import AutoTokenizer
+
+from config import DATA_PATH, MODEL_ID, SYSTEM_PROMPT, TRUST_REMOTE_CODE
+from utils.chat_template import ChatTemplate, render_messages
+
+
+def load_conversations(path):
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if "messages" in obj:
+                conversations.append(obj["messages"])
+            else:
+                conversations.append([
+                    {"role": "system", "content": obj["system"]},
+                    {"role": "user", "content": obj["instruction"]},
+                    {"role": "assistant", "content": obj["response"]}
+                ])
+    return conversations
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=str(DATA_PATH / "train_sft.jsonl"))
+    parser.add_argument("--tokenizer", default=MODEL_ID)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=TRUST_REMOTE_CODE)
+    conversations = load_conversations(args.data)
+    prompts = [c[-2]["content"] for c in conversations if len(c) >= 2]
+    template = ChatTemplate(tokenizer)
+    print(f"📄 {len(conversations)} conversations, tokenizer: {args.tokenizer}")
+
+    # Per request: system + user prompt for generation
+    def naive_requests():
+        return [tokenizer(render_messages([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": p}
+        ]))["input_ids"] for p in prompts]
+
+    def template_requests():
+        return [template.encode_prompt(SYSTEM_PROMPT, p) for p in prompts]
+
+    naive_time, naive_ids = timed(naive_requests, args.repeat)
+    template_time, template_ids = timed(template_requests, args.repeat)
+    n = max(len(prompts), 1)
+    print(f"⏱ Per request: string {naive_time / n * 1e3:.3f} ms, "
+          f"template {template_time / n * 1e3:.3f} ms ({naive_time / max(template_time, 1e-9):.2f}x)")
+    print(f"   identical ids: {naive_ids == template_ids}")
+
+    # Per dataset: full training conversations
+    def naive_dataset():
+        return [tokenizer(render_messages(c, add_generation_prompt=False))["input_ids"]
+                for c in conversations]
+
+    def template_dataset():
+        return template.encode_batch(conversations, add_generation_prompt=False)
+
+    naive_time, naive_ids = timed(naive_dataset, args.repeat)
+    template_time, template_ids = timed(template_dataset, args.repeat)
+    print(f"⏱ Per dataset: string {naive_time:.3f} s, "
+          f"template (batched) {template_time:.3f} s ({naive_time / max(template_time, 1e-9):.2f}x)")
+    print(f"   identical ids: {naive_ids == template_ids}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Minimal OpenAI-compatible stub server for local testing of annotation and overflow clients.
+
+Serves POST /v1/chat/completions with a canned answer, optional latency and
+injected 429/500 failures. It also answers the chatbot replica API
+(POST /api/v1/chat, GET /api/v1/health and /api/v1/ready), so several instances can stand in
+for model replicas behind chatbot/start_router.py.
+
+Usage:
+    python scripts/openai_stub_server.py --port 8080 --latency 0.2 --fail-rate 0.1
+    OPENAI_BASE_URL=http://localhost:8080/v1 python -m utils.annotation --input ... --output ...
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    healthy = True
+    name = "stub"
+    rate_limit_share = 0.5
+    counter = 0
+    counter_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/api/v1/ready":
+            self._send_json(200 if self.healthy else 503, {"status": "ready"} if self.healthy
+                            else {"detail": "Model not loaded"})
+        elif self.path.rstrip("/") == "/api/v1/health":
+            self._send_json(200 if self.healthy else 503, {"status": "healthy" if self.healthy else "unhealthy",
+                                                           "model_loaded": True, "version": "stub"})
+        elif self.path.rstrip("/") in ("/health", "/v1/models"):
+            self._send_json(200, {"status": "ok", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _chatbot_chat(self, request, request_no):
+        """Replica API: ChatResponse-shaped answer naming the replica"""
+        start = time.time()
+        if self.latency:
+            time.sleep(self.latency)
+        response = f"{self.name} #{request_no}: {request.get('message', '')[:40]}"
+        self._send_json(200, {
+            "response": response,
+            "cached": False,
+            "response_time": time.time() - start,
+            "tokens_generated": len(response.split()),
+            "model_info": {"model_loaded": True, "device": "stub", "replica": self.name}
+        })
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path not in ("/v1/chat/completions", "/api/v1/chat"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if path == "/api/v1/chat":
+            with StubHandler.counter_lock:
+                StubHandler.counter += 1
+                request_no = StubHandler.counter
+            self._chatbot_chat(request, request_no)
+            return
+
+        with StubHandler.counter_lock:
+            StubHandler.counter += 1
+            request_no = StubHandler.counter
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if random.random() < self.fail_rate:
+            if random.random() < self.rate_limit_share:
+                self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                headers={"Retry-After": "1"})
+            else:
+                self._send_json(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        content = f"stub answer #{request_no}: {prompt[:40]}"
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+        completion_tokens = len(content.split())
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{request_no}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    # Bursts of concurrent clients overflow the default listen backlog of 5 (1 s SYN retries)
+    request_queue_size = 128
+
+
+def serve(host="127.0.0.1", port=8080, latency=0.0, fail_rate=0.0, name=None):
+    """
+    Start the stub server in a background thread and return it (call .shutdown() to stop).
+    Set `server.RequestHandlerClass.healthy = False` to fail the replica health and readiness checks.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "fail_rate": fail_rate,
+                                                             "name": name or f"stub-{port}"})
+    server = StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 429/500")
+    parser.add_argument("--name", default=None, help="Replica name in /api/v1/chat answers (default: stub-<port>)")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.fail_rate, args.name)
+    print(f"🧪 OpenAI stub listening on http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Train the LoRA adapter from config.py.
+
+Before training, the largest-throughput micro-batch that fits the MAX_MEMORY budget is
+searched (with and without gradient checkpointing) and gradient accumulation is derived
+so the effective batch of TRAINING_ARGS is preserved. Measurements for every candidate
+are saved to <output_dir>/batch_search.json.
+
+Launch with torchrun for data-parallel training (gloo on CPU, NCCL on GPUs). The
+effective batch is then split across processes, and only rank 0 logs and saves.
+
+With --pack, samples are packed into rows of --max-length tokens (utils/packing.py)
+instead of being padded per batch; the effective batch is converted from samples
+to packed rows so an optimizer step still sees about as many samples.
+
+Usage:
+    python scripts/train_lora.py [--model <id>] [--data data/train.jsonl] [--no-search] [--resume] [--pack]
+    torchrun --standalone --nproc_per_node 2 scripts/train_lora.py [...]
+"""
+
+import argparse
+import math
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from config import (ADAPTER_NAME, BATCH_SIZE_SEARCH, CHECKPOINTING, MAX_SEQ_LENGTH, MODEL_ID, MODELS_PATH,
+                    TRAIN_DATASET_PATH, TRAINING_ARGS, TRAINING_PROFILER)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--data", default=str(TRAIN_DATASET_PATH), help="JSONL file or Arrow shard directory")
+    parser.add_argument("--output-dir", default=str(MODELS_PATH))
+    parser.add_argument("--max-length", type=int, default=MAX_SEQ_LENGTH)
+    parser.add_argument("--pack", action="store_true",
+                        help="Pack samples into --max-length rows with PackedCollator instead of padding")
+    parser.add_argument("--micro-batch", type=int, default=None, help="Skip the search and use this micro-batch")
+    parser.add_argument("--gradient-checkpointing", action="store_true", help="With --micro-batch")
+    parser.add_argument("--no-search", action="store_true", help="Use the batch settings from TRAINING_ARGS")
+    parser.add_argument("--search-only", action="store_true", help="Run the micro-batch search and exit")
+    parser.add_argument("--max-steps", type=int, default=None)
+    parser.add_argument("--resume", action="store_true", help="Resume from the last checkpoint in --output-dir")
+    parser.add_argument("--profile", action="store_true", help="Attach ThroughputProfilerCallback")
+    parser.add_argument("--eval-data", default=None, help="Held-out JSONL for perplexity after every checkpoint")
+    parser.add_argument("--sync-checkpoints", action="store_true",
+                        help="Use the Trainer's synchronous full checkpoints instead of async adapter-only ones")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    from transformers import DataCollatorForLanguageModeling, Trainer
+
+    from utils.distributed import (allreduce_summary, broadcast_object, init_distributed, is_main_process,
+                                   main_process_first, silence_non_main_processes, world_size)
+    from utils.lora_training import (build_training_args, load_model_for_training, save_search_report,
+                                     search_micro_batch, set_gradient_checkpointing)
+    from utils.tokenization import tokenize_dataset
+
+    backend = init_distributed()
+    silence_non_main_processes()
+    if backend:
+        print(f"🌐 Distributed training: {world_size()} processes, backend={backend}")
+
+    model, tokenizer = load_model_for_training(args.model)
+    # Rank 0 fills the tokenization cache, the other ranks load it
+    with main_process_first():
+        dataset = tokenize_dataset(args.data, tokenizer, max_length=args.max_length)
+
+    effective_batch = TRAINING_ARGS["per_device_train_batch_size"] * TRAINING_ARGS["gradient_accumulation_steps"]
+    if args.pack:
+        from utils.packing import PackedCollator, pack_dataset
+
+        samples = len(dataset)
+        dataset = pack_dataset(dataset, max_length=args.max_length)
+        # flash_attention_2 separates samples by position_ids; other kernels need the block-diagonal mask
+        mode = "flatten" if getattr(model.config, "_attn_implementation", None) == "flash_attention_2" else "mask"
+        collator = PackedCollator(tokenizer.pad_token_id, mode=mode, mask_dtype=model.dtype)
+        effective_batch = max(1, round(effective_batch * len(dataset) / samples))
+        print(f"📦 Packed {samples} samples into {len(dataset)} rows of up to {args.max_length} tokens "
+              f"(collator mode={mode}, effective batch {effective_batch} rows)")
+    else:
+        collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    per_process_batch = max(1, effective_batch // world_size())
+    micro_batch = max(1, min(TRAINING_ARGS["per_device_train_batch_size"], effective_batch) // world_size())
+    gradient_checkpointing = args.gradient_checkpointing
+    if args.micro_batch:
+        micro_batch = args.micro_batch
+    elif not args.no_search and BATCH_SIZE_SEARCH["enabled"]:
+        best, results = search_micro_batch(model, dataset, collator, per_process_batch)
+        # Every rank searches on identical hardware; rank 0's choice keeps them in lockstep
+        best = broadcast_object(best)
+        micro_batch, gradient_checkpointing = best["micro_batch"], best["gradient_checkpointing"]
+        if is_main_process():
+            report_path = Path(args.output_dir) / "batch_search.json"
+            save_search_report(report_path, best, results, effective_batch)
+            print(f"💾 Batch search saved to {report_path}")
+    set_gradient_checkpointing(model, gradient_checkpointing)
+
+    grad_accum = max(1, math.ceil(effective_batch / (micro_batch * world_size())))
+    print(f"🔹 micro_batch={micro_batch}, gradient_accumulation_steps={grad_accum}, "
+          f"gradient_checkpointing={gradient_checkpointing} "
+          f"(effective batch {micro_batch * grad_accum * world_size()} over {world_size()} processes)")
+    if backend:
+        summary = allreduce_summary(model)
+        print(f"🔹 All-reduce limited to {summary['trainable_params']:,} adapter parameters "
+              f"({summary['allreduce_mb_per_step']:.1f} MB per step), {summary['frozen_params']:,} frozen")
+    if args.search_only:
+        return
+
+    overrides = {
+        "output_dir": args.output_dir,
+        "per_device_train_batch_size": micro_batch,
+        "gradient_accumulation_steps": grad_accum,
+        # Already set on the model; Trainer would otherwise re-enable it with its defaults
+        "gradient_checkpointing": False
+    }
+    if args.max_steps:
+        overrides["max_steps"] = args.max_steps
+
+    callbacks = []
+    if CHECKPOINTING["async"] and not args.sync_checkpoints:
+        from utils.async_checkpoint import AsyncAdapterCheckpointCallback
+        callbacks.append(AsyncAdapterCheckpointCallback())
+    if args.eval_data:
+        from utils.perplexity import PerplexityCallback
+        callbacks.append(PerplexityCallback(tokenizer, args.eval_data, max_length=args.max_length))
+    if args.profile or TRAINING_PROFILER["enabled"]:
+        from utils.training_profiler import ThroughputProfilerCallback
+        callbacks.append(ThroughputProfilerCallback())
+
+    trainer = Trainer(
+        model=model,
+        args=build_training_args(overrides),
+        train_dataset=dataset,
+        data_collator=collator,
+        callbacks=callbacks
+    )
+    trainer.train(resume_from_checkpoint=True if args.resume else None)
+
+    if is_main_process():
+        adapter_path = Path(args.output_dir) / ADAPTER_NAME
+        model.save_pretrained(adapter_path)
+        tokenizer.save_pretrained(adapter_path)
+        print(f"✅ Adapter saved to {adapter_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Shared fixtures for the data preparation, training and evaluation utilities:
+a tiny byte-level BPE tokenizer with the ChatML special tokens and a random
+two-layer Llama on top of it
+"""
+
+import os
+import sys
+
+import pytest
+import torch
+
+# Repository root: `config` and the `utils` / `scripts` packages
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CORPUS = [
+    "Привет, как дела? Ich heiße Anna. Kunde: Guten Tag! Verkäufer: Was möchten Sie? Du bist nett.",
+    "Ты — преподаватель немецкого языка для русскоязычных студентов уровня A2. Объясняй грамотно.",
+    "Der Hund läuft schnell nach Hause, weil es regnet. Wir lernen Deutsch jeden Tag.",
+    "Объясни разницу между wissen и kennen. Ich weiß, dass du die Stadt kennst."
+]
+
+
+@pytest.fixture(scope="session")
+def tiny_tokenizer(tmp_path_factory):
+    """ChatML tokenizer saved to disk (name_or_path is a real directory)"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=600, special_tokens=["<|endoftext|>", "<|im_start|>", "<|im_end|>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False)
+    tokenizer.train_from_iterator(CORPUS * 20, trainer)
+
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    fast.add_special_tokens({"additional_special_tokens": ["<|im_start|>", "<|im_end|>"]})
+    path = tmp_path_factory.mktemp("tiny-tokenizer")
+    fast.save_pretrained(str(path))
+    return PreTrainedTokenizerFast.from_pretrained(str(path))
+
+
+def make_tiny_model(tokenizer, seed=0, **overrides):
+    """Random two-layer Llama sized to the tokenizer"""
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=2048,
+                         eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id,
+                         bos_token_id=None, **overrides)
+    return LlamaForCausalLM(config).eval()
+
+
+@pytest.fixture
+def tiny_model(tiny_tokenizer):
+    return make_tiny_model(tiny_tokenizer)
@@ -0,0 +1,102 @@
+"""
+Annotation runner against the local OpenAI stub: retries of 429/5xx answers and
+resuming from the checkpoint file after failures and a torn last line
+"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+import scripts.openai_stub_server as stub_server
+from config import ANNOTATION_CONFIG
+from utils.annotation import annotate_samples_async, load_checkpoint, make_async_client, read_annotated, sample_key
+
+SAMPLES = [{"system": "Ты — преподаватель немецкого языка.", "instruction": f"Переведи предложение {i}: Ich heiße Anna."}
+           for i in range(8)]
+
+
+class ScriptedRandom:
+    """Stands in for `random` in the stub: scripted draws first, then 0.99 (no failure)"""
+
+    def __init__(self, draws=()):
+        self.draws = list(draws)
+        self.lock = threading.Lock()
+
+    def random(self):
+        with self.lock:
+            return self.draws.pop(0) if self.draws else 0.99
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(stub_server, "random", ScriptedRandom())
+    server = stub_server.serve(port=0, fail_rate=0.5)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(stub, output_path, samples=SAMPLES, **config):
+    client = make_async_client(base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1", api_key="test")
+    config = {**ANNOTATION_CONFIG, "backoff_base": 0.01, "backoff_max": 0.05, **config}
+    return asyncio.run(annotate_samples_async(samples, output_path, client=client, model="stub", config=config,
+                                              progress=False, use_cache=False))
+
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def records_without_torn_line(path):
+    result = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result.append(json.loads(line))
+            except json.JSONDecodeError:
+                assert line.startswith('{"id": "torn"')
+    return result
+
+
+def test_rate_limits_and_server_errors_are_retried(stub, tmp_path):
+    # One request at a time: first a 429 (fail draw, then rate-limit draw), then a 500
+    stub_server.random.draws = [0.0, 0.0, 0.0, 0.9]
+    stats = run(stub, tmp_path / "annotated.jsonl", max_concurrency=1)
+
+    assert stats.completed == len(SAMPLES) and stats.failed == 0
+    assert stats.retries == 2 and stats.rate_limited == 1
+    assert stats.requests == len(SAMPLES) + 2
+    assert stats.prompt_tokens > 0 and stats.completion_tokens > 0
+    assert all(r["response"].startswith("stub answer") for r in records(tmp_path / "annotated.jsonl"))
+
+
+def test_interrupted_run_resumes_from_checkpoint(stub, tmp_path):
+    output = tmp_path / "annotated.jsonl"
+    # Without retries the first three requests fail with 500s
+    stub_server.random.draws = [0.0, 0.9] * 3
+    first = run(stub, output, max_concurrency=1, max_retries=0)
+    assert first.failed == 3 and first.completed == len(SAMPLES) - 3
+    done = load_checkpoint(output)
+
+    # A crash in the middle of a write leaves a torn last line
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "torn", "resp')
+
+    second = run(stub, output)
+    assert second.skipped == len(SAMPLES) - 3
+    assert second.completed == 3 and second.requests == 3 and second.failed == 0
+
+    written = records_without_torn_line(output)
+    ids = [r["id"] for r in written]
+    assert sorted(ids) == sorted(sample_key(s) for s in SAMPLES)
+    assert done <= set(ids)
+
+    annotated = read_annotated([dict(s) for s in SAMPLES], output)
+    assert all(s["response"].startswith("stub answer") for s in annotated)
+
+    # Nothing left to do
+    assert run(stub, output).requests == 0
+
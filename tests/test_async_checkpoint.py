@@ -0,0 +1,89 @@
+"""
+Asynchronous adapter checkpoints: the on-disk layout written by the background
+thread, save_total_limit pruning, and resuming adapter, optimizer and scheduler
+state with `resume_from_checkpoint=True`
+"""
+
+import copy
+import json
+import random
+
+import pytest
+import torch
+from datasets import Dataset
+from safetensors.torch import load_file
+from transformers import DataCollatorForLanguageModeling, Trainer, TrainerCallback, TrainingArguments
+
+from utils.async_checkpoint import (
+    ADAPTER_WEIGHTS, OPTIMIZER_META, OPTIMIZER_WEIGHTS, RNG_STATE, TRAINER_STATE, AsyncAdapterCheckpointCallback,
+    list_checkpoints
+)
+
+from conftest import make_tiny_model
+
+peft = pytest.importorskip("peft")
+
+
+class StartProbe(TrainerCallback):
+    """Records the state training starts from (runs after the checkpoint callback restored it)"""
+
+    def on_train_begin(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        self.adapter = {k: v.detach().clone() for k, v in peft.get_peft_model_state_dict(model).items()}
+        self.optimizer = copy.deepcopy(optimizer.state_dict())
+        self.lr = lr_scheduler.get_last_lr()
+
+
+def make_trainer(tokenizer, output_dir, max_steps, callbacks):
+    model = make_tiny_model(tokenizer).train()
+    model = peft.get_peft_model(model, peft.LoraConfig(r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"],
+                                                       task_type="CAUSAL_LM"))
+    rng = random.Random(0)
+    dataset = Dataset.from_dict({"input_ids": [[rng.randrange(5, len(tokenizer)) for _ in range(rng.randint(8, 24))]
+                                               for _ in range(32)]})
+    args = TrainingArguments(output_dir=str(output_dir), per_device_train_batch_size=2, max_steps=max_steps,
+                             save_steps=2, save_total_limit=2, learning_rate=1e-3, lr_scheduler_type="linear",
+                             logging_steps=100, report_to="none", use_cpu=True, seed=0, disable_tqdm=True)
+    return Trainer(model=model, args=args, train_dataset=dataset, callbacks=callbacks,
+                   data_collator=DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False))
+
+
+def test_checkpoints_are_written_in_the_background_and_resumed(tiny_tokenizer, tmp_path):
+    callback = AsyncAdapterCheckpointCallback(max_pending=1)
+    make_trainer(tiny_tokenizer, tmp_path, max_steps=6, callbacks=[callback]).train()
+
+    # Steps 2, 4, 6 saved asynchronously; save_total_limit keeps the last two, no tmp dirs left over
+    assert callback.saved_steps == {2, 4, 6}
+    assert [p.name for p in list_checkpoints(tmp_path)] == ["checkpoint-4", "checkpoint-6"]
+    assert not list(tmp_path.glob("*.tmp"))
+    last = tmp_path / "checkpoint-6"
+    for name in [ADAPTER_WEIGHTS, "adapter_config.json", OPTIMIZER_WEIGHTS, OPTIMIZER_META, TRAINER_STATE, RNG_STATE]:
+        assert (last / name).exists(), name
+    assert not (last / "optimizer.pt").exists()
+    with open(last / TRAINER_STATE, encoding="utf-8") as f:
+        assert json.load(f)["global_step"] == 6
+    assert all("lora_" in key for key in load_file(str(last / ADAPTER_WEIGHTS)))
+
+    stats = json.loads((tmp_path / "checkpoint_stats.json").read_text(encoding="utf-8"))
+    assert stats["saves"] == 3 and stats["write_ms_mean"] > 0
+
+    saved_optimizer = load_file(str(last / OPTIMIZER_WEIGHTS))
+    saved_meta = json.loads((last / OPTIMIZER_META).read_text(encoding="utf-8"))
+
+    # Resume from the newest checkpoint with a fresh model and continue for one more save interval
+    saved_adapter = load_file(str(last / ADAPTER_WEIGHTS))
+    probe = StartProbe()
+    resumed = AsyncAdapterCheckpointCallback()
+    trainer = make_trainer(tiny_tokenizer, tmp_path, max_steps=8, callbacks=[resumed, probe])
+    trainer.train(resume_from_checkpoint=True)
+
+    assert trainer.state.global_step == 8
+    assert resumed.saved_steps == {8}
+    assert [p.name for p in list_checkpoints(tmp_path)] == ["checkpoint-6", "checkpoint-8"]
+
+    assert probe.adapter.keys() == saved_adapter.keys()
+    assert all(torch.equal(probe.adapter[key], saved_adapter[key]) for key in saved_adapter)
+    restored = {f"{param_id}.{name}": value for param_id, param_state in probe.optimizer["state"].items()
+                for name, value in param_state.items() if torch.is_tensor(value)}
+    assert restored.keys() == saved_optimizer.keys()
+    assert all(torch.equal(restored[key], saved_optimizer[key]) for key in restored)
+    assert probe.lr == saved_meta["scheduler"]["_last_lr"]
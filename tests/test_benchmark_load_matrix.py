@@ -0,0 +1,69 @@
+"""
+Load-option matrix: cells this machine cannot run are skipped with a reason, the
+others run in subprocesses and are compared with the reference cell
+"""
+
+import csv
+import subprocess
+import sys
+
+import pytest
+
+import scripts.benchmark_load_matrix as load_matrix
+
+from conftest import ROOT, make_tiny_model
+
+
+def test_agreement():
+    reference = [[1, 2, 3], [4, 5]]
+    assert load_matrix.agreement(reference, reference) == (1.0, 1.0)
+    # 4 of 5 positions match; one of two outputs is exact
+    assert load_matrix.agreement([[1, 2, 3], [4, 6]], reference) == (0.8, 0.5)
+    # A shorter output counts its missing positions as mismatches
+    assert load_matrix.agreement([[1, 2], [4, 5]], reference) == (0.8, 0.5)
+
+
+def test_skip_reasons(monkeypatch):
+    monkeypatch.setattr(load_matrix.importlib.util, "find_spec", lambda name: None)
+    cell = {"quantization": "fp32", "adapter": "none", "device": "cpu"}
+    assert load_matrix.skip_reason(cell, None) is None
+    assert load_matrix.skip_reason({**cell, "quantization": "nf4"}, None) == "bitsandbytes quantization is GPU-only"
+    assert load_matrix.skip_reason({**cell, "adapter": "merged"}, None) == "no --adapter given"
+    assert load_matrix.skip_reason({**cell, "adapter": "merged"}, "adapter") is None
+
+
+@pytest.fixture
+def tiny_checkpoint(tiny_tokenizer, tmp_path):
+    """Tiny Llama and a LoRA adapter with non-zero weights saved to disk"""
+    peft = pytest.importorskip("peft")
+    model_dir, adapter_dir = tmp_path / "model", tmp_path / "adapter"
+    model = make_tiny_model(tiny_tokenizer)
+    model.save_pretrained(str(model_dir))
+    tiny_tokenizer.save_pretrained(str(model_dir))
+    lora = peft.get_peft_model(model, peft.LoraConfig(r=4, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM",
+                                                      init_lora_weights=False))
+    lora.save_pretrained(str(adapter_dir))
+    return model_dir, adapter_dir
+
+
+def test_matrix_runs_cpu_cells(tiny_checkpoint, tmp_path):
+    model_dir, adapter_dir = tiny_checkpoint
+    output = tmp_path / "load_matrix.csv"
+    command = [sys.executable, "scripts/benchmark_load_matrix.py", "--model", str(model_dir), "--adapter",
+               str(adapter_dir), "--quantization", "fp32", "nf4", "--adapter-modes", "none", "unmerged", "merged",
+               "--devices", "cpu", "--max-new-tokens", "4", "--output", str(output)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=ROOT, timeout=600)
+    assert result.returncode == 0, result.stderr
+
+    with open(output, encoding="utf-8") as f:
+        rows = {row["cell"]: row for row in csv.DictReader(f)}
+    assert list(rows) == ["cpu/fp32/none", "cpu/fp32/unmerged", "cpu/fp32/merged", "cpu/nf4/none",
+                          "cpu/nf4/unmerged", "cpu/nf4/merged"]
+    assert all(rows[f"cpu/fp32/{mode}"]["status"] == "ok" for mode in ["none", "unmerged", "merged"])
+    assert rows["cpu/nf4/none"]["status"] == "skipped: bitsandbytes quantization is GPU-only"
+
+    reference = rows["cpu/fp32/none"]
+    assert reference["reference"] == "True" and float(reference["token_agreement"]) == 1.0
+    assert float(reference["decode_tokens_per_sec"]) > 0
+    # Merging the adapter into fp32 weights does not change greedy outputs
+    assert rows["cpu/fp32/merged"]["token_agreement"] == rows["cpu/fp32/unmerged"]["token_agreement"]
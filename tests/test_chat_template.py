@@ -0,0 +1,54 @@
+"""
+Token-level ChatML template: ids assembled from cached fragments must equal
+tokenizing the rendered prompt, and only assistant turns are training targets
+"""
+
+from utils.chat_template import ChatTemplate, render_messages
+
+IGNORE_INDEX = -100
+
+CONVERSATION = [
+    {"role": "system", "content": "Ты — преподаватель немецкого языка для русскоязычных студентов уровня A2."},
+    {"role": "user", "content": "Объясни разницу между wissen и kennen."},
+    {"role": "assistant", "content": "Ich weiß, dass du die Stadt kennst.\nwissen — знать факт."},
+    {"role": "user", "content": " Und 'Der Hund läuft schnell nach Hause'?"},
+    {"role": "assistant", "content": "Guten Tag! Verkäufer: Was möchten Sie?"}
+]
+
+
+def full_string_ids(tokenizer, text):
+    return tokenizer(text, add_special_tokens=False)["input_ids"]
+
+
+def test_encode_matches_rendered_string(tiny_tokenizer):
+    template = ChatTemplate(tiny_tokenizer)
+    for end in range(1, len(CONVERSATION) + 1):
+        messages = CONVERSATION[:end]
+        for add_generation_prompt in (True, False):
+            expected = full_string_ids(tiny_tokenizer, render_messages(messages, add_generation_prompt))
+            assert template.encode(messages, add_generation_prompt=add_generation_prompt) == expected
+
+
+def test_encode_batch_and_prompt_match_encode(tiny_tokenizer):
+    template = ChatTemplate(tiny_tokenizer)
+    conversations = [CONVERSATION[:2], CONVERSATION[:4], CONVERSATION]
+    assert template.encode_batch(conversations) == [template.encode(c) for c in conversations]
+    assert template.encode_prompt(CONVERSATION[0]["content"], CONVERSATION[1]["content"]) == \
+        template.encode(CONVERSATION[:2])
+    assert template.encode(CONVERSATION, max_length=10) == template.encode(CONVERSATION)[:10]
+
+
+def test_labels_cover_only_assistant_turns(tiny_tokenizer):
+    template = ChatTemplate(tiny_tokenizer)
+    ids, labels = template.encode_with_labels(CONVERSATION)
+
+    assert ids == template.encode(CONVERSATION, add_generation_prompt=False)
+    assert len(labels) == len(ids)
+    targets = [token for token, label in zip(ids, labels) if label != IGNORE_INDEX]
+    assert all(label in (IGNORE_INDEX, token) for token, label in zip(ids, labels))
+
+    expected = []
+    for m in CONVERSATION:
+        if m["role"] == "assistant":
+            expected += full_string_ids(tiny_tokenizer, m["content"] + "<|im_end|>\n")
+    assert targets == expected
@@ -0,0 +1,69 @@
+"""
+Arrow shard storage: one schema across shards (promoted and rewritten on close),
+readers over the shards, and clear errors for directories without shards
+"""
+
+import pyarrow as pa
+import pytest
+
+from utils.dataset_storage import (
+    ShardedDatasetWriter, iter_records, load_hf_dataset, open_table, read_manifest
+)
+
+
+def shard_schemas(dataset_dir):
+    schemas = []
+    for shard in read_manifest(dataset_dir)["shards"]:
+        with pa.memory_map(str(dataset_dir / shard["file"]), "r") as source:
+            schemas.append(pa.ipc.open_stream(source).schema)
+    return schemas
+
+
+@pytest.mark.parametrize("compression", [None, "zstd"])
+def test_schema_is_promoted_and_old_shards_rewritten(tmp_path, compression):
+    records = [
+        {"id": 1, "text": "Guten Tag", "score": None},
+        {"id": 2, "text": "Danke", "score": None},
+        # Later shards add a field, fill the all-null column and turn ints into floats
+        {"id": 3, "text": "Bitte", "score": 0.5, "source": "docx"},
+        {"id": 4.5, "text": "Tschüss", "score": 1, "source": None}
+    ]
+    with ShardedDatasetWriter(tmp_path, shard_rows=2, compression=compression) as writer:
+        writer.write_many(records)
+    manifest = read_manifest(tmp_path)
+
+    assert manifest["rows"] == 4 and len(manifest["shards"]) == 2
+    assert manifest["schema"] == {"id": "double", "text": "string", "score": "double", "source": "string"}
+    schemas = shard_schemas(tmp_path)
+    assert all(schema.equals(schemas[0]) for schema in schemas)
+
+    expected = [{"source": None, **r} for r in records[:2]] + records[2:]
+    expected = [{**r, "id": float(r["id"]), "score": None if r["score"] is None else float(r["score"])}
+                for r in expected]
+    assert list(iter_records(tmp_path, batch_size=1)) == expected
+    assert open_table(tmp_path, columns=["id"]).column("id").to_pylist() == [1.0, 2.0, 3.0, 4.5]
+    assert load_hf_dataset(tmp_path).to_list() == expected
+
+
+def test_fields_missing_from_the_first_record_are_kept(tmp_path):
+    with ShardedDatasetWriter(tmp_path, shard_rows=10) as writer:
+        writer.write({"text": "a"})
+        writer.write({"text": "b", "label": 1})
+    assert list(iter_records(tmp_path)) == [{"text": "a", "label": None}, {"text": "b", "label": 1}]
+
+
+def test_incompatible_types_raise(tmp_path):
+    writer = ShardedDatasetWriter(tmp_path, shard_rows=1)
+    writer.write({"id": 1})
+    with pytest.raises(ValueError, match="incompatible"):
+        writer.write({"id": "eins"})
+
+
+def test_directories_without_shards(tmp_path):
+    ShardedDatasetWriter(tmp_path / "empty").close()
+    with pytest.raises(ValueError, match="no shards"):
+        load_hf_dataset(tmp_path / "empty")
+    assert list(iter_records(tmp_path / "empty")) == []
+
+    with pytest.raises(FileNotFoundError, match="manifest.json"):
+        load_hf_dataset(tmp_path)
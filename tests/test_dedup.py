@@ -0,0 +1,82 @@
+"""
+MinHash-LSH near-duplicate removal: edited copies land in their original's
+cluster, unrelated samples stay apart, one representative per cluster is kept
+"""
+
+import json
+import random
+
+import numpy as np
+
+from utils.dedup import MinHasher, deduplicate_jsonl, find_near_duplicates, shingle_hashes
+
+VOCABULARY = [f"wort{i}" for i in range(2000)]
+
+
+def write_jsonl(path, samples):
+    with open(path, "w", encoding="utf-8") as f:
+        for s in samples:
+            f.write(json.dumps(s, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def random_samples(n, rng):
+    return [{"instruction": " ".join(rng.choices(VOCABULARY, k=50)), "response": " ".join(rng.choices(VOCABULARY, k=50))}
+            for _ in range(n)]
+
+
+def test_signature_similarity_tracks_jaccard():
+    hasher = MinHasher(num_perm=256)
+    a = shingle_hashes("der hund läuft schnell nach hause weil es regnet und kalt ist", 2)
+    b = shingle_hashes("der hund läuft schnell nach hause weil es schneit und kalt ist", 2)
+    jaccard = len(set(a) & set(b)) / len(set(a) | set(b))
+    estimate = np.mean(hasher.signature(a) == hasher.signature(b))
+    assert abs(estimate - jaccard) < 0.15
+    assert np.array_equal(hasher.signature(a), hasher.signature(a.copy()))
+
+
+def test_edited_copies_share_their_original_cluster(tmp_path):
+    rng = random.Random(1)
+    # More rows than the initial signature memmap holds; one edited word in 100 leaves
+    # a shingle Jaccard similarity of about 0.94, well above the 0.8 threshold
+    samples = random_samples(1100, rng)
+    originals = list(range(50))
+    for i in originals:
+        words = samples[i]["response"].split()
+        words[rng.randrange(len(words))] = "geändert"
+        samples.append({"instruction": samples[i]["instruction"], "response": " ".join(words)})
+    samples.append(dict(samples[0]))
+    path = tmp_path / "train.jsonl"
+    write_jsonl(path, samples)
+
+    uf, lengths, stats = find_near_duplicates(path)
+
+    assert stats["samples"] == len(samples) == len(lengths)
+    for offset, i in enumerate(originals):
+        assert uf.find(1100 + offset) == uf.find(i)
+    assert uf.find(len(samples) - 1) == uf.find(0)
+    # Random unique samples are never merged
+    assert len({uf.find(i) for i in range(1100)}) == 1100
+
+
+def test_one_representative_per_cluster(tmp_path):
+    samples = [
+        {"instruction": "Объясни разницу между wissen и kennen", "response": "Ich weiß, dass du die Stadt kennst und wir sie alle gut kennen"},
+        {"instruction": "Объясни разницу между wissen и kennen", "response": "Ich weiß, dass du die Stadt kennst und wir sie alle gut kennen!!"},
+        {"instruction": "Переведи фразу", "response": "Der Hund läuft schnell nach Hause, weil es draußen stark regnet"},
+        {"instruction": "Объясни разницу между wissen и kennen", "response": "Ich weiß, dass du die Stadt kennst und wir sie alle gut kennen, sagt Anna"}
+    ]
+    source = tmp_path / "train.jsonl"
+    write_jsonl(source, samples)
+
+    first = deduplicate_jsonl(source, tmp_path / "first.jsonl", threshold=0.7, shingle_size=2)
+    longest = deduplicate_jsonl(source, tmp_path / "longest.jsonl", threshold=0.7, shingle_size=2, keep="longest")
+
+    assert read_jsonl(tmp_path / "first.jsonl") == [samples[0], samples[2]]
+    assert read_jsonl(tmp_path / "longest.jsonl") == [samples[2], samples[3]]
+    assert first["kept"] == longest["kept"] == 2
+    assert first["removed"] == 2 and first["largest_cluster"] == 3
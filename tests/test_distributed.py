@@ -0,0 +1,86 @@
+"""
+torchrun helpers on a two-process gloo group: rank 0 goes first through
+main_process_first(), broadcast_object() hands out rank 0's value, and only
+the adapter parameters are all-reduced
+"""
+
+import os
+import socket
+import time
+
+import pytest
+import torch.multiprocessing as mp
+
+from utils import distributed
+
+WORLD_SIZE = 2
+TIMEOUT = 120
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def worker(rank, port, cache_dir, results):
+    os.environ.update({"MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port), "WORLD_SIZE": str(WORLD_SIZE),
+                       "RANK": str(rank), "LOCAL_RANK": str(rank)})
+    import torch.distributed as dist
+
+    assert distributed.init_distributed() == "gloo"
+    try:
+        cache = os.path.join(cache_dir, "tokenized")
+        with distributed.main_process_first():
+            # Rank 0 fills the cache (slowly), the others find it already there
+            if distributed.is_main_process():
+                time.sleep(0.5)
+            found = os.path.exists(cache)
+            if not found:
+                with open(cache, "w", encoding="utf-8") as f:
+                    f.write(str(rank))
+        micro_batch = distributed.broadcast_object(8 if distributed.is_main_process() else None)
+        results.put((rank, found, micro_batch))
+        distributed.barrier()
+    finally:
+        dist.destroy_process_group()
+
+
+def test_main_process_goes_first_and_broadcasts(tmp_path):
+    context = mp.get_context("spawn")
+    results = context.SimpleQueue()
+    processes = mp.start_processes(worker, args=(free_port(), str(tmp_path), results), nprocs=WORLD_SIZE,
+                                   join=False, start_method="spawn")
+    # Mismatched barriers deadlock instead of raising
+    deadline = time.time() + TIMEOUT
+    while not processes.join(timeout=1):
+        if time.time() > deadline:
+            for process in processes.processes:
+                process.kill()
+            pytest.fail(f"Ranks did not finish within {TIMEOUT}s")
+
+    outcomes = sorted(results.get() for _ in range(WORLD_SIZE))
+    assert outcomes == [(0, False, 8), (1, True, 8)]
+    assert (tmp_path / "tokenized").read_text(encoding="utf-8") == "0"
+
+
+def test_single_process_defaults(monkeypatch):
+    for name in ["WORLD_SIZE", "RANK", "LOCAL_RANK"]:
+        monkeypatch.delenv(name, raising=False)
+    assert not distributed.is_distributed() and distributed.is_main_process()
+    assert distributed.init_distributed() is None
+    assert distributed.broadcast_object({"batch": 4}) == {"batch": 4}
+    with distributed.main_process_first():
+        pass
+
+
+def test_only_adapter_parameters_are_all_reduced(tiny_model):
+    peft = pytest.importorskip("peft")
+    model = peft.get_peft_model(tiny_model, peft.LoraConfig(r=4, target_modules=["q_proj", "v_proj"],
+                                                            task_type="CAUSAL_LM"))
+    trainable = sum(p.numel() for n, p in model.named_parameters() if "lora_" in n)
+
+    summary = distributed.allreduce_summary(model)
+    assert summary["trainable_params"] == trainable
+    assert summary["frozen_params"] == sum(p.numel() for p in model.parameters()) - trainable
+    assert summary["allreduce_mb_per_step"] == pytest.approx(trainable * 4 / 1024 ** 2)
@@ -0,0 +1,51 @@
+"""
+Streaming .docx reader: paragraph text must match python-docx, including paragraphs
+that contain text boxes and tables
+"""
+
+import pytest
+
+from utils.docx_stream import iter_blocks, iter_paragraphs
+
+docx = pytest.importorskip("docx")
+from docx.oxml import parse_xml  # noqa: E402
+
+TEXT_BOX = (
+    '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:v="urn:schemas-microsoft-com:vml">'
+    '<w:pict><v:shape><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t>Kasten eins</w:t></w:r></w:p>'
+    '<w:p><w:r><w:t>Kasten zwei</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+)
+
+
+@pytest.fixture
+def document_path(tmp_path):
+    document = docx.Document()
+    document.add_paragraph("Kunde: Guten Tag!")
+    # Text before and after a text box in the same paragraph
+    paragraph = document.add_paragraph("Verkäufer: Was ")
+    paragraph._p.append(parse_xml(TEXT_BOX))
+    paragraph.add_run("möchten Sie?")
+    document.add_paragraph("")
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Zelle"
+    document.add_paragraph("Ich heiße Anna.\tDanke.")
+
+    path = tmp_path / "dialog.docx"
+    document.save(str(path))
+    return path
+
+
+def test_paragraphs_match_python_docx(document_path):
+    expected = [p.text for p in docx.Document(str(document_path)).paragraphs]
+    assert list(iter_paragraphs(document_path)) == expected
+    assert expected[1] == "Verkäufer: Was möchten Sie?"
+
+
+def test_blocks_are_split_at_empty_paragraphs(document_path):
+    assert list(iter_blocks(document_path)) == [
+        "Kunde: Guten Tag!\nVerkäufer: Was möchten Sie?",
+        "Ich heiße Anna.\tDanke."
+    ]
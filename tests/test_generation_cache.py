@@ -0,0 +1,74 @@
+"""
+Generation cache: content-hash keys, hit accounting across reopen and
+least-recently-used pruning to a size bound
+"""
+
+import itertools
+
+import pytest
+
+import utils.generation_cache as generation_cache
+from utils.generation_cache import GenerationCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time() so last_used order is deterministic"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(generation_cache.time, "time", lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = GenerationCache(tmp_path / "generations.sqlite")
+    yield cache
+    cache.close()
+
+
+def test_key_covers_everything_that_changes_the_answer():
+    base = cache_key("model", {"max_tokens": 16, "temperature": 0.7}, system="s", instruction="i")
+    assert base == cache_key("model", {"temperature": 0.7, "max_tokens": 16}, system="s", instruction="i")
+    assert base != cache_key("other", {"max_tokens": 16, "temperature": 0.7}, system="s", instruction="i")
+    assert base != cache_key("model", {"max_tokens": 32, "temperature": 0.7}, system="s", instruction="i")
+    assert base != cache_key("model", {"max_tokens": 16, "temperature": 0.7}, system="s", instruction="j")
+
+
+def test_get_or_generate_stores_and_counts_hits(cache, tmp_path):
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "Guten Tag"
+
+    assert cache.get_or_generate("k", generate, model="m") == "Guten Tag"
+    assert cache.get_or_generate("k", generate, model="m") == "Guten Tag"
+    assert len(calls) == 1
+    # Empty answers are not cached
+    assert cache.get_or_generate("empty", lambda: "") == ""
+    assert cache.get("empty") is None
+
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["entries_per_model"] == {"m": 1}
+    assert stats["session_hits"] == 1 and stats["session_misses"] == 3
+
+    reopened = GenerationCache(tmp_path / "generations.sqlite")
+    try:
+        assert reopened.get("k") == "Guten Tag"
+        assert reopened.stats()["total_hits"] == 2
+    finally:
+        reopened.close()
+
+
+def test_prune_removes_least_recently_used_first(cache):
+    for key in "abcde":
+        cache.put(key, "x" * 100)
+    # Reading an entry makes it recent again
+    assert cache.get("a") is not None
+
+    assert cache.prune(max_bytes=1000) == 0
+    assert cache.prune(max_bytes=300) == 2
+    assert [cache.get(key) is not None for key in "abcde"] == [True, False, False, True, True]
+    assert cache.stats()["size_mb"] == round(300 / 1024 ** 2, 3)
+
+    assert cache.prune(max_bytes=0) == 3
+    assert cache.stats()["entries"] == 0
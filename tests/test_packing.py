@@ -0,0 +1,67 @@
+"""
+Sequence packing: bin assignment, the boundary-aware collator, equivalence with
+per-sample forwards and the micro-batch search on packed rows
+"""
+
+import pytest
+import torch
+from datasets import Dataset
+
+from utils.lora_training import search_micro_batch
+from utils.packing import IGNORE_INDEX, PackedCollator, best_fit_decreasing, pack_dataset, pack_examples
+from utils.training_profiler import count_real_tokens
+
+SAMPLES = [[5 + (i * 7 + j) % 300 for j in range(length)] for i, length in enumerate([9, 3, 14, 6, 11, 2, 7, 5])]
+
+
+def test_bins_fit_and_cover_every_sample():
+    lengths = [len(s) for s in SAMPLES]
+    bins = best_fit_decreasing(lengths, 16)
+    assert sorted(i for b in bins for i in b) == list(range(len(SAMPLES)))
+    assert all(sum(lengths[i] for i in b) <= 16 for b in bins)
+    # 57 tokens need at least 4 rows of 16
+    assert len(bins) == 4
+
+
+def test_collator_masks_padding_and_sample_starts():
+    packed = pack_examples(SAMPLES, 16)
+    rows = [{"input_ids": i, "position_ids": p} for i, p in zip(packed["input_ids"], packed["position_ids"])]
+    batch = PackedCollator(pad_token_id=0)(rows)
+
+    real = sum(len(s) for s in SAMPLES)
+    starts = sum(p.count(0) for p in packed["position_ids"])
+    assert int((batch["labels"] != IGNORE_INDEX).sum()) == real - starts
+    assert count_real_tokens(batch) == real
+
+
+def test_packed_rows_match_per_sample_forwards(tiny_model):
+    packed = pack_examples(SAMPLES, 24)
+    rows = [{"input_ids": i, "position_ids": p} for i, p in zip(packed["input_ids"], packed["position_ids"])]
+    batch = PackedCollator(pad_token_id=0, mask_dtype=tiny_model.dtype)(rows)
+
+    with torch.no_grad():
+        logits = tiny_model(input_ids=batch["input_ids"], position_ids=batch["position_ids"],
+                            attention_mask=batch["attention_mask"]).logits
+        for row, ids in enumerate(packed["input_ids"]):
+            positions = packed["position_ids"][row]
+            starts = [t for t, p in enumerate(positions) if p == 0] + [len(ids)]
+            for start, end in zip(starts[:-1], starts[1:]):
+                alone = tiny_model(input_ids=torch.tensor([ids[start:end]])).logits[0]
+                torch.testing.assert_close(logits[row, start:end], alone, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("mode", ["mask", "flatten"])
+def test_micro_batch_search_on_packed_rows(tiny_model, mode):
+    dataset = pack_dataset(Dataset.from_dict({"input_ids": SAMPLES * 4}), max_length=32)
+    collator = PackedCollator(pad_token_id=0, mode=mode, mask_dtype=tiny_model.dtype)
+    search = {"candidates": [1, 2], "gradient_checkpointing": [False], "probe_steps": 2, "memory_headroom": 1.0}
+    before = [p.detach().clone() for p in tiny_model.parameters()]
+
+    best, results = search_micro_batch(tiny_model, dataset, collator, effective_batch=4, search=search,
+                                       max_memory={"cpu": "1TiB"})
+
+    assert [r["micro_batch"] for r in results] == [1, 2]
+    assert all(r["fits"] and r["tokens_per_sec"] > 0 for r in results)
+    assert best in results
+    # Probing restores the weights it trained
+    assert all(torch.equal(a, b) for a, b in zip(before, tiny_model.parameters()))
@@ -0,0 +1,99 @@
+"""
+Held-out perplexity: sliding windows score every target token exactly once, and
+the streamed, batched evaluation matches a plain forward pass
+"""
+
+import json
+import math
+import random
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from utils.chat_template import ChatTemplate
+from utils.dataset_storage import record_to_messages
+from utils.packing import IGNORE_INDEX
+from utils.perplexity import evaluate_perplexity, sliding_windows
+
+RECORDS = [
+    {"system": "Ты — преподаватель немецкого языка.", "instruction": "Объясни разницу между wissen и kennen.",
+     "response": "Ich weiß, dass du die Stadt kennst. wissen — знать факт, kennen — быть знакомым. " * 3},
+    {"system": "Ты — преподаватель немецкого языка.", "instruction": "Переведи: Der Hund läuft schnell nach Hause.",
+     "response": "Собака быстро бежит домой."},
+    {"messages": [{"role": "user", "content": "Kunde: Guten Tag!"},
+                  {"role": "assistant", "content": "Verkäufer: Was möchten Sie?"},
+                  {"role": "user", "content": "Ich heiße Anna."},
+                  {"role": "assistant", "content": "Du bist nett. Wir lernen Deutsch jeden Tag."}]}
+]
+
+
+def scored_positions(windows, stride):
+    """Absolute positions scored by the shifted loss (position 0 of a window has no context)"""
+    scored = []
+    for w, (ids, labels) in enumerate(windows):
+        begin = w * stride
+        scored += [begin + t for t in range(1, len(ids)) if labels[t] != IGNORE_INDEX]
+    return scored
+
+
+@pytest.mark.parametrize("length,max_length,stride", [(50, 16, 8), (50, 16, 15), (50, 16, 1), (64, 16, 8),
+                                                      (17, 16, 5), (10, 16, 8)])
+def test_every_target_is_scored_exactly_once(length, max_length, stride):
+    rng = random.Random(length * stride)
+    input_ids = [rng.randrange(5, 500) for _ in range(length)]
+    labels = [t if rng.random() < 0.6 else IGNORE_INDEX for t in input_ids]
+
+    windows = sliding_windows(input_ids, labels, max_length, stride)
+
+    assert all(len(ids) <= max_length for ids, _ in windows)
+    assert all(ids == input_ids[w * stride:w * stride + len(ids)] for w, (ids, _) in enumerate(windows))
+    assert windows[-1][0][-1] == input_ids[-1]
+    scored = scored_positions(windows, stride)
+    assert sorted(scored) == scored
+    assert scored == [t for t in range(1, length) if labels[t] != IGNORE_INDEX]
+
+
+@pytest.mark.parametrize("stride", [0, 16, 20])
+def test_windows_must_overlap(stride):
+    with pytest.raises(ValueError):
+        sliding_windows(list(range(40)), list(range(40)), 16, stride)
+
+
+def write_records(path):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in RECORDS:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def reference_loss(model, tokenizer):
+    template = ChatTemplate(tokenizer)
+    total, count = 0.0, 0
+    with torch.no_grad():
+        for record in RECORDS:
+            ids, labels = template.encode_with_labels(record_to_messages(record))
+            logits = model(input_ids=torch.tensor([ids])).logits[0, :-1]
+            target = torch.tensor(labels[1:])
+            total += F.cross_entropy(logits, target, ignore_index=IGNORE_INDEX, reduction="sum").item()
+            count += int((target != IGNORE_INDEX).sum())
+    return total / count, count
+
+
+def test_evaluation_matches_plain_forward(tiny_model, tiny_tokenizer, tmp_path):
+    path = tmp_path / "heldout.jsonl"
+    write_records(path)
+    loss, count = reference_loss(tiny_model, tiny_tokenizer)
+
+    # Windows longer than every sample, small batches and chunks: same loss as one forward per sample
+    whole = evaluate_perplexity(tiny_model, tiny_tokenizer, path, max_length=1024, max_batch_tokens=256,
+                                chunk_size=2)
+    assert whole["samples"] == len(RECORDS) and whole["windows"] == len(RECORDS)
+    assert whole["scored_tokens"] == count
+    assert whole["loss"] == pytest.approx(loss, rel=1e-4)
+    assert whole["perplexity"] == pytest.approx(math.exp(loss), rel=1e-4)
+
+    # Short windows see less context but still score each target once
+    windowed = evaluate_perplexity(tiny_model, tiny_tokenizer, path, max_length=32, stride=16)
+    assert windowed["windows"] > len(RECORDS)
+    assert windowed["scored_tokens"] == count
+    assert math.isfinite(windowed["loss"])
@@ -0,0 +1,90 @@
+"""
+Evaluation results store: summaries weighted by prompt count, and idempotent
+imports of legacy result files
+"""
+
+import json
+import time
+
+import pytest
+
+from utils.results_store import ResultsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(tmp_path / "results.sqlite")
+    yield store
+    store.close()
+
+
+def rows(times, **metrics):
+    return [{"prompt": f"Frage {i}", "response": "Antwort", "time_sec": t, **metrics} for i, t in enumerate(times)]
+
+
+def test_summary_is_weighted_by_prompt_count(store):
+    store.add_run(rows([1.0, 3.0], ttft_sec=0.5, peak_memory_mb=100), model="base", prompt_set="a2")
+    store.add_run(rows([5.0] * 6, peak_memory_mb=300), model="base", prompt_set="a2")
+    store.add_run(rows([2.0, 2.0]), model="lora", adapter="adapters/v1", prompt_set="a2")
+
+    summary = store.summarize().set_index("model")
+    base = summary.loc["base"]
+    assert base["runs"] == 2 and base["prompt_count"] == 8
+    # (2 prompts * 2.0 s + 6 prompts * 5.0 s) / 8 prompts, not the mean of the run averages
+    assert base["avg_time_sec"] == pytest.approx(4.25)
+    # Runs without a metric do not dilute it
+    assert base["avg_ttft_sec"] == pytest.approx(0.5)
+    assert base["peak_memory_mb"] == 300
+    assert summary.loc["lora", "avg_time_sec"] == pytest.approx(2.0)
+    assert list(summary.index) == ["lora", "base"]
+
+    by_adapter = store.summarize(group_by=["model", "adapter"], model="lora")
+    assert by_adapter.to_dict("records")[0]["adapter"] == "adapters/v1"
+    with pytest.raises(ValueError):
+        store.summarize(group_by=["prompt"])
+
+
+def test_latest_only_keeps_the_newest_run(store):
+    store.add_run(rows([9.0]), model="base", prompt_set="a2")
+    time.sleep(0.01)
+    store.add_run(rows([1.0]), model="base", prompt_set="a2")
+    latest = store.summarize(latest_only=True).to_dict("records")[0]
+    assert latest["runs"] == 1 and latest["avg_time_sec"] == pytest.approx(1.0)
+
+
+def test_rows_keep_metrics_and_extra_fields(store):
+    run_id = store.add_run(rows([1.5], new_tokens=12, temperature=0.7), model="base", run_id="run-1")
+    assert store.add_run(rows([99.0]), model="base", run_id="run-1") == "run-1"
+
+    results = store.results(run_id=run_id)
+    assert len(results) == 1
+    row = results.iloc[0]
+    assert row["time_sec"] == 1.5 and row["new_tokens"] == 12
+    assert json.loads(row["extra"]) == {"temperature": 0.7}
+
+
+def test_files_are_imported_once(store, tmp_path):
+    result_dir = tmp_path / "a2_prompts"
+    result_dir.mkdir()
+    with open(result_dir / "base.json", "w", encoding="utf-8") as f:
+        json.dump(rows([1.0, 2.0], model="base"), f)
+    with open(result_dir / "base_summary.json", "w", encoding="utf-8") as f:
+        json.dump([{"model": "base", "time_sec": 100.0}], f)
+    (result_dir / "lora.csv").write_text("model,prompt,time_sec,ttft_sec\nlora,Frage,3.0,\nlora,Frage 2,5.0,0.2\n",
+                                         encoding="utf-8")
+
+    assert len(store.import_directory(result_dir)) == 1
+    assert store.import_directory(result_dir) == []
+    assert store.import_file(result_dir / "base.json") is None
+    csv_run = store.import_file(result_dir / "lora.csv")
+    assert csv_run is not None and store.import_file(result_dir / "lora.csv") is None
+
+    summary = store.summarize(prompt_set="a2_prompts").set_index("model")
+    assert summary.loc["base", "prompt_count"] == 2 and summary.loc["base", "avg_time_sec"] == pytest.approx(1.5)
+    assert summary.loc["lora", "avg_time_sec"] == pytest.approx(4.0)
+    assert summary.loc["lora", "avg_ttft_sec"] == pytest.approx(0.2)
+
+    # A changed file is a new run
+    with open(result_dir / "base.json", "w", encoding="utf-8") as f:
+        json.dump(rows([1.0, 2.0, 3.0], model="base"), f)
+    assert len(store.import_directory(result_dir)) == 1
@@ -0,0 +1,67 @@
+"""
+Dataset tokenization: the same ids as the chat template, cached under a key of
+source file, tokenizer and max_length, and the same result with worker processes
+"""
+
+import json
+
+import pytest
+
+from utils.chat_template import ChatTemplate
+from utils.dataset_storage import record_to_messages
+from utils.tokenization import tokenization_cache_key, tokenize_dataset
+
+RECORDS = [
+    {"system": "Ты — преподаватель немецкого языка.", "instruction": f"Переведи предложение {i}: Ich heiße Anna.",
+     "response": "Меня зовут Анна. " * (1 + i % 4)}
+    for i in range(12)
+]
+
+
+def write_records(path, records=RECORDS):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def expected_ids(tokenizer, max_length):
+    template = ChatTemplate(tokenizer)
+    return [template.encode_with_labels(record_to_messages(r))[0][:max_length] for r in RECORDS]
+
+
+def test_ids_match_the_template_and_are_cached(tiny_tokenizer, tmp_path, capsys):
+    source = tmp_path / "train.jsonl"
+    write_records(source)
+    cache_dir = tmp_path / "cache"
+
+    tokenized = tokenize_dataset(source, tiny_tokenizer, max_length=48, num_proc=1, cache_dir=cache_dir)
+    assert tokenized["input_ids"] == expected_ids(tiny_tokenizer, 48)
+    assert all(len(mask) == len(ids) for mask, ids in zip(tokenized["attention_mask"], tokenized["input_ids"]))
+    assert "Tokenized 12 rows" in capsys.readouterr().out
+
+    cached = tokenize_dataset(source, tiny_tokenizer, max_length=48, num_proc=1, cache_dir=cache_dir)
+    assert "from cache" in capsys.readouterr().out
+    assert cached["input_ids"] == tokenized["input_ids"]
+    assert [p.name for p in cache_dir.iterdir()] == [tokenization_cache_key(source, tiny_tokenizer, 48)]
+
+
+def test_key_changes_with_source_and_max_length(tiny_tokenizer, tmp_path):
+    source = tmp_path / "train.jsonl"
+    write_records(source)
+    key = tokenization_cache_key(source, tiny_tokenizer, 48)
+    assert key != tokenization_cache_key(source, tiny_tokenizer, 64)
+
+    write_records(source, RECORDS[:-1])
+    assert key != tokenization_cache_key(source, tiny_tokenizer, 48)
+
+
+@pytest.mark.parametrize("batch_size,processes", [(2, "2 processes"), (8, "1 process ")])
+def test_worker_processes_give_the_same_ids(tiny_tokenizer, tmp_path, capsys, batch_size, processes):
+    source = tmp_path / "train.jsonl"
+    write_records(source)
+
+    # 12 rows fill a batch of 2 per worker; with batch_size=8 the pool is skipped and the log says so
+    tokenized = tokenize_dataset(source, tiny_tokenizer, max_length=1024, num_proc=2, batch_size=batch_size,
+                                 cache_dir=tmp_path / "cache")
+    assert tokenized["input_ids"] == expected_ids(tiny_tokenizer, 1024)
+    assert f"with {processes}" in capsys.readouterr().out
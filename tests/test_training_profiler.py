@@ -0,0 +1,67 @@
+"""
+Training profiler: non-padding tokens per step, step time and data wait without
+the work marked excluded_from_step_time(), and the summary written at the end
+"""
+
+import json
+import time
+
+import torch
+from datasets import Dataset
+from transformers import DataCollatorForLanguageModeling, Trainer, TrainerCallback, TrainingArguments
+
+from utils.training_profiler import ThroughputProfilerCallback, count_real_tokens, excluded_from_step_time
+
+from conftest import make_tiny_model
+
+LENGTHS = [5, 9, 12, 16, 7, 20, 3, 11]
+PAUSE = 0.2
+
+
+class HeldOutEvaluation(TrainerCallback):
+    """Slow work between and inside steps, marked as not training time"""
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        with excluded_from_step_time():
+            time.sleep(PAUSE / 2)
+
+    def on_step_end(self, args, state, control, **kwargs):
+        with excluded_from_step_time():
+            time.sleep(PAUSE)
+
+
+def test_count_real_tokens():
+    input_ids = torch.ones(2, 6, dtype=torch.long)
+    attention_mask = torch.tensor([[1] * 6, [1] * 2 + [0] * 4])
+    assert count_real_tokens({"input_ids": input_ids, "attention_mask": attention_mask}) == 8
+    assert count_real_tokens({"input_ids": input_ids}) == 12
+    assert count_real_tokens({}) == 0
+
+
+def test_profile_excludes_marked_work(tiny_tokenizer, tmp_path):
+    dataset = Dataset.from_dict({"input_ids": [[5 + (i + j) % 300 for j in range(n)] for i, n in enumerate(LENGTHS)]})
+    # Registered before the profiler: the on_step_begin pause falls in the data wait, the on_step_end one in the step
+    profiler = ThroughputProfilerCallback(profile_steps=None, warmup_steps=1, sync_cuda=False)
+    args = TrainingArguments(output_dir=str(tmp_path), per_device_train_batch_size=2, max_steps=4,
+                             logging_steps=100, report_to="none", use_cpu=True, seed=0, disable_tqdm=True)
+    trainer = Trainer(model=make_tiny_model(tiny_tokenizer).train(), args=args, train_dataset=dataset,
+                      callbacks=[HeldOutEvaluation(), profiler],
+                      data_collator=DataCollatorForLanguageModeling(tokenizer=tiny_tokenizer, mlm=False))
+    trainer.train()
+
+    records = profiler.records
+    assert [r["step"] for r in records] == [1, 2, 3, 4]
+    # Padded batches: only the real tokens are counted, and one epoch sees every sample once
+    assert sum(r["tokens"] for r in records) == sum(LENGTHS)
+    assert all(r["step_time"] < PAUSE / 2 for r in records)
+    assert all(r["data_wait"] < PAUSE / 2 for r in records)
+    assert all(r["forward"] <= r["step_time"] for r in records)
+
+    with open(tmp_path / "profile_summary.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    summary = saved["summary"]
+    assert summary["steps"] == 3 and summary["warmup_steps_skipped"] == 1
+    assert summary["tokens_per_sec"] > 0 and 0 <= summary["data_wait_share"] < 1
+    assert len(saved["steps"]) == 4
+    assert not profiler._hooks
+    assert list((tmp_path / "runs").glob("events.out.tfevents.*"))
@@ -0,0 +1,317 @@
+# annotation.py
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from config import (ANNOTATION_CONFIG, BASE_DIR, OPENAI_BASE_URL, OPENAI_MODEL, OPENAI_PRICING,
+                    USE_GENERATION_CACHE)
+from utils.generation_cache import cache_key, get_generation_cache
+
+
+def sample_key(sample):
+    """
+    Stable id of a sample: hash of its system prompt and instruction
+    """
+    text = f"{sample['system']}\x00{sample['instruction']}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def make_async_client(base_url=OPENAI_BASE_URL, api_key=None, timeout=ANNOTATION_CONFIG["request_timeout"]):
+    """
+    AsyncOpenAI client; base_url may point to any OpenAI-compatible server
+    """
+    load_dotenv(dotenv_path=BASE_DIR / ".env", override=False)
+    # OPENAI_BASE_URL from .env counts too: local servers need no key
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        if base_url is None:
+            raise ValueError("OPENAI_API_KEY environment variable not found")
+        api_key = "local"
+    # Retries are handled by the runner so they can respect the shared rate limiter
+    return AsyncOpenAI(api_key=api_key.strip(), base_url=base_url, timeout=timeout, max_retries=0)
+
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute, shared by all workers
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def pause(self, seconds):
+        """
+        Stop handing out budget for `seconds` (server asked us to back off)
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max((1 - self._requests) * 60 / self.rpm, (tokens - self._tokens) * 60 / self.tpm, 0.01)
+                await asyncio.sleep(wait)
+
+
+@dataclass
+class AnnotationStats:
+    model: str = OPENAI_MODEL
+    total: int = 0
+    skipped: int = 0
+    completed: int = 0
+    failed: int = 0
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    started: float = field(default_factory=time.time)
+    errors: list = field(default_factory=list)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def cost_usd(self):
+        price = OPENAI_PRICING.get(self.model)
+        if price is None:
+            return None
+        return (self.prompt_tokens * price["prompt"] + self.completion_tokens * price["completion"]) / 1000
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-9)
+        summary = asdict(self)
+        summary.pop("errors")
+        summary.update({
+            "elapsed_sec": round(elapsed, 2),
+            "samples_per_sec": round(self.completed / elapsed, 3),
+            "completion_tokens_per_sec": round(self.completion_tokens / elapsed, 1),
+            "cost_usd": None if self.cost_usd is None else round(self.cost_usd, 4),
+            "last_errors": self.errors[-5:]
+        })
+        return summary
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error):
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+async def annotate_one(client, limiter, stats, sample, model=OPENAI_MODEL, config=ANNOTATION_CONFIG):
+    """
+    Request a response for one sample with exponential backoff on 429/5xx
+    """
+    max_tokens = config["max_tokens"]
+    estimate = (len(sample["system"]) + len(sample["instruction"])) // 3 + max_tokens
+
+    for attempt in range(config["max_retries"] + 1):
+        await limiter.acquire(estimate)
+        stats.requests += 1
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": sample["system"]},
+                    {"role": "user", "content": sample["instruction"]}
+                ],
+                temperature=config["temperature"],
+                max_tokens=max_tokens
+            )
+        except Exception as e:
+            if not _is_retryable(e) or attempt == config["max_retries"]:
+                raise
+            delay = min(config["backoff_max"], config["backoff_base"] * 2 ** attempt)
+            delay *= 0.5 + random.random()
+            retry_after = _retry_after(e)
+            if isinstance(e, APIStatusError) and e.status_code == 429:
+                stats.rate_limited += 1
+                limiter.pause(retry_after or delay)
+            stats.retries += 1
+            await asyncio.sleep(max(delay, retry_after or 0))
+            continue
+
+        if response.usage is not None:
+            stats.prompt_tokens += response.usage.prompt_tokens
+            stats.completion_tokens += response.usage.completion_tokens
+        content = response.choices[0].message.content
+        return "" if content is None else content.strip()
+
+
+def load_checkpoint(output_path):
+    """
+    Ids of samples already annotated in a checkpoint JSONL
+    """
+    done = set()
+    if not Path(output_path).exists():
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                # A torn last line from a crash is ignored and re-annotated
+                continue
+    return done
+
+
+async def annotate_samples_async(samples, output_path, client=None, model=OPENAI_MODEL,
+                                 config=ANNOTATION_CONFIG, progress=True, use_cache=USE_GENERATION_CACHE):
+    """
+    Annotate samples concurrently, appending each finished sample to `output_path`.
+    Samples already present in the file are skipped, so an interrupted run resumes.
+    """
+    client = client or make_async_client()
+    cache = get_generation_cache() if use_cache else None
+    params = {"max_tokens": config["max_tokens"], "temperature": config["temperature"]}
+    limiter = RateLimiter(config["requests_per_minute"], config["tokens_per_minute"])
+    stats = AnnotationStats(model=model, total=len(samples))
+    done = load_checkpoint(output_path)
+    semaphore = asyncio.Semaphore(config["max_concurrency"])
+    write_lock = asyncio.Lock()
+
+    pending = []
+    for s in samples:
+        key = s.get("id") or sample_key(s)
+        if key in done:
+            stats.skipped += 1
+        else:
+            pending.append((key, s))
+    print(f"🔹 To annotate: {len(pending)}, already done: {stats.skipped}")
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as out:
+        if out.tell() > 0:
+            # Terminate a line torn by a crash so the next record starts cleanly
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    out.write("\n")
+
+        async def worker(key, sample):
+            generation_key = cache_key(model, params, system=sample["system"], instruction=sample["instruction"])
+            response = cache.get(generation_key) if cache else None
+            if response is not None:
+                stats.cache_hits += 1
+            else:
+                async with semaphore:
+                    try:
+                        response = await annotate_one(client, limiter, stats, sample, model=model, config=config)
+                    except Exception as e:
+                        stats.failed += 1
+                        stats.errors.append(f"{key[:8]}: {type(e).__name__}: {e}")
+                        return
+                if cache and response:
+                    cache.put(generation_key, response, model=model)
+            record = {**sample, "id": key, "response": response}
+            async with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats.completed += 1
+                if progress and stats.completed % 10 == 0:
+                    print(f"✏️ {stats.completed}/{len(pending)} done, "
+                          f"{stats.completed / max(stats.elapsed, 1e-9):.2f} samples/s")
+
+        await asyncio.gather(*(worker(key, s) for key, s in pending))
+
+    print(f"✅ Annotated {stats.completed}, failed {stats.failed}, retries {stats.retries}")
+    return stats
+
+
+def annotate_samples(samples, output_path, **kwargs):
+    """
+    Synchronous wrapper; inside Jupyter use `await annotate_samples_async(...)`
+    """
+    return asyncio.run(annotate_samples_async(samples, output_path, **kwargs))
+
+
+def read_annotated(samples, output_path):
+    """
+    Fill `response` of samples from a checkpoint file, keeping the original order
+    """
+    responses = {}
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                responses[record["id"]] = record["response"]
+    for s in samples:
+        key = s.get("id") or sample_key(s)
+        if key in responses:
+            s["response"] = responses[key]
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate samples with an OpenAI-compatible API")
+    parser.add_argument("--input", required=True, help="JSONL with system/instruction samples")
+    parser.add_argument("--output", required=True, help="Checkpointed JSONL output (appended, resumable)")
+    parser.add_argument("--model", default=OPENAI_MODEL)
+    parser.add_argument("--base-url", default=OPENAI_BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=ANNOTATION_CONFIG["max_concurrency"])
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    config = {**ANNOTATION_CONFIG, "max_concurrency": args.concurrency}
+    client = make_async_client(base_url=args.base_url)
+    stats = annotate_samples(samples, args.output, client=client, model=args.model, config=config)
+    print(json.dumps(stats.summary(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# async_checkpoint.py
+
+import dataclasses
+import json
+import os
+import queue
+import re
+import shutil
+import statistics
+import threading
+import time
+from pathlib import Path
+
+import torch
+from safetensors.torch import load_file, save_file
+from transformers import TrainerCallback
+
+from config import CHECKPOINTING
+from utils.training_profiler import excluded_time
+
+ADAPTER_WEIGHTS = "adapter_model.safetensors"
+OPTIMIZER_WEIGHTS = "optimizer.safetensors"
+OPTIMIZER_META = "optimizer_meta.json"
+TRAINER_STATE = "trainer_state.json"
+RNG_STATE = "rng_state.pth"
+CHECKPOINT_RE = re.compile(r"^checkpoint-(\d+)$")
+
+
+def _to_cpu(tensor):
+    return tensor.detach().to("cpu", copy=True).contiguous()
+
+
+def snapshot_optimizer(optimizer, scheduler=None):
+    """
+    Optimizer state as flat CPU tensors ("<param id>.<name>") plus JSON metadata
+    for param groups, non-tensor state and the LR scheduler
+    """
+    state_dict = optimizer.state_dict()
+    tensors, scalars = {}, {}
+    for param_id, param_state in state_dict["state"].items():
+        for name, value in param_state.items():
+            if torch.is_tensor(value):
+                tensors[f"{param_id}.{name}"] = _to_cpu(value)
+            else:
+                scalars[f"{param_id}.{name}"] = value
+    meta = {
+        "param_groups": state_dict["param_groups"],
+        "scalars": scalars,
+        "scheduler": scheduler.state_dict() if scheduler is not None else None
+    }
+    return tensors, meta
+
+
+def restore_optimizer(optimizer, scheduler, checkpoint_dir):
+    checkpoint_dir = Path(checkpoint_dir)
+    tensors = load_file(str(checkpoint_dir / OPTIMIZER_WEIGHTS))
+    with open(checkpoint_dir / OPTIMIZER_META, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    state = {}
+    for key, value in list(tensors.items()) + list(meta["scalars"].items()):
+        param_id, name = key.split(".", 1)
+        state.setdefault(int(param_id), {})[name] = value
+    optimizer.load_state_dict({"state": state, "param_groups": meta["param_groups"]})
+    if scheduler is not None and meta["scheduler"] is not None:
+        scheduler.load_state_dict(meta["scheduler"])
+
+
+def list_checkpoints(output_dir):
+    """
+    Finished checkpoints (tmp dirs excluded) sorted by step
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.exists():
+        return []
+    found = [(int(m.group(1)), p) for p in output_dir.iterdir() if (m := CHECKPOINT_RE.match(p.name)) and p.is_dir()]
+    return [p for _, p in sorted(found)]
+
+
+class StepIntervalTimer(TrainerCallback):
+    """
+    Wall time between consecutive optimizer steps. Unlike on_step_begin/on_step_end
+    timing it includes whatever the Trainer does between steps (logging, saving),
+    except work marked with excluded_from_step_time() such as held-out evaluation.
+    """
+
+    def __init__(self):
+        self.intervals = {}
+        self._last = None
+        self._excluded = 0.0
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._last = time.perf_counter()
+        self._excluded = excluded_time()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        excluded = excluded_time()
+        self.intervals[state.global_step] = max(0.0, now - self._last - (excluded - self._excluded))
+        self._last, self._excluded = now, excluded
+
+    def spike_stats(self, save_steps):
+        """
+        Median step time vs. steps right after a save (where a synchronous save lands)
+        """
+        around = [t for step, t in self.intervals.items() if step - 1 in save_steps or step in save_steps]
+        others = [t for step, t in self.intervals.items() if step - 1 not in save_steps and step not in save_steps]
+        return {
+            "step_time_median": statistics.median(others) if others else 0.0,
+            "step_time_around_saves_max": max(around) if around else 0.0,
+            "step_time_around_saves_mean": statistics.mean(around) if around else 0.0
+        }
+
+
+class AsyncAdapterCheckpointCallback(StepIntervalTimer):
+    """
+    Adapter-only checkpoints written by a background thread.
+
+    On every step where the Trainer would save, the synchronous save is cancelled and
+    the LoRA weights, optimizer and scheduler state are copied to CPU instead. A writer
+    thread stores them as safetensors in checkpoint-<step>.tmp, renames the directory
+    atomically and deletes checkpoints beyond save_total_limit. The layout is what
+    Trainer expects for PEFT models (adapter_model.safetensors, trainer_state.json,
+    rng_state.pth), and the optimizer/scheduler state is restored by this callback, so
+    `trainer.train(resume_from_checkpoint=True)` works as before.
+    """
+
+    def __init__(self, max_pending=CHECKPOINTING["max_pending"]):
+        super().__init__()
+        self.max_pending = max_pending
+        self.snapshot_times = []
+        self.write_times = []
+        self.blocked_times = []
+        self.saved_steps = set()
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+    # Background writer
+
+    def _writer(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                start = time.perf_counter()
+                self._write(**job)
+                self.write_times.append(time.perf_counter() - start)
+            except Exception as e:  # surfaced on the training thread at the next save
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, output_dir, step, adapter, peft_config, optimizer, optimizer_meta, trainer_state, rng_state,
+               save_total_limit):
+        final_dir = Path(output_dir) / f"checkpoint-{step}"
+        tmp_dir = final_dir.with_name(final_dir.name + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        save_file(adapter, str(tmp_dir / ADAPTER_WEIGHTS), metadata={"format": "pt"})
+        peft_config.save_pretrained(str(tmp_dir))
+        save_file(optimizer, str(tmp_dir / OPTIMIZER_WEIGHTS))
+        with open(tmp_dir / OPTIMIZER_META, "w", encoding="utf-8") as f:
+            json.dump(optimizer_meta, f)
+        with open(tmp_dir / TRAINER_STATE, "w", encoding="utf-8") as f:
+            f.write(trainer_state)
+        torch.save(rng_state, tmp_dir / RNG_STATE)
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+        if save_total_limit:
+            for old in list_checkpoints(output_dir)[:-save_total_limit]:
+                shutil.rmtree(old, ignore_errors=True)
+
+    # Trainer events
+
+    def on_train_begin(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        super().on_train_begin(args, state, control, **kwargs)
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._thread = threading.Thread(target=self._writer, name="async-checkpoint", daemon=True)
+        self._thread.start()
+
+        # Resumed run: Trainer restored adapter, trainer state and RNG; optimizer state is ours
+        if state.global_step > 0 and optimizer is not None:
+            checkpoint_dir = args.resume_from_checkpoint
+            if not isinstance(checkpoint_dir, str) or not os.path.isdir(checkpoint_dir):
+                checkpoint_dir = Path(args.output_dir) / f"checkpoint-{state.global_step}"
+            if (Path(checkpoint_dir) / OPTIMIZER_WEIGHTS).exists():
+                restore_optimizer(optimizer, lr_scheduler, checkpoint_dir)
+                print(f"🔁 Optimizer and scheduler state restored from {checkpoint_dir}")
+
+    def on_step_end(self, args, state, control, model=None, optimizer=None, lr_scheduler=None, **kwargs):
+        super().on_step_end(args, state, control, **kwargs)
+        if not control.should_save:
+            return
+        control.should_save = False
+        if self._error is not None:
+            raise RuntimeError("Asynchronous checkpoint write failed") from self._error
+        if not state.is_world_process_zero:
+            return
+
+        from peft import get_peft_model_state_dict
+
+        start = time.perf_counter()
+        adapter = {k: _to_cpu(v) for k, v in get_peft_model_state_dict(model).items()}
+        optimizer_tensors, optimizer_meta = snapshot_optimizer(optimizer, lr_scheduler)
+        job = {
+            "output_dir": args.output_dir,
+            "step": state.global_step,
+            "adapter": adapter,
+            "peft_config": model.peft_config[model.active_adapter],
+            "optimizer": optimizer_tensors,
+            "optimizer_meta": optimizer_meta,
+            "trainer_state": json.dumps(dataclasses.asdict(state), indent=2, sort_keys=True) + "\n",
+            "rng_state": _rng_state(),
+            "save_total_limit": args.save_total_limit
+        }
+        self.snapshot_times.append(time.perf_counter() - start)
+
+        # Blocks only when `max_pending` writes are still in flight
+        start = time.perf_counter()
+        self._queue.put(job)
+        self.blocked_times.append(time.perf_counter() - start)
+        self.saved_steps.add(state.global_step)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self._queue is None:
+            return
+        self._queue.put(None)
+        self._queue.join()
+        self._thread.join()
+        self._queue = None
+        if self._error is not None:
+            raise RuntimeError("Asynchronous checkpoint write failed") from self._error
+
+        stats = self.stats()
+        if state.is_world_process_zero and stats["saves"]:
+            with open(Path(args.output_dir) / "checkpoint_stats.json", "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+            print(f"💾 {stats['saves']} async checkpoints: snapshot {stats['snapshot_ms_mean']:.1f} ms, "
+                  f"write {stats['write_ms_mean']:.1f} ms (background), step time around saves "
+                  f"{stats['step_time_around_saves_max'] * 1e3:.0f} ms vs median "
+                  f"{stats['step_time_median'] * 1e3:.0f} ms")
+
+    def stats(self):
+        def ms(values):
+            return statistics.mean(values) * 1e3 if values else 0.0
+
+        return {
+            "saves": len(self.saved_steps),
+            "snapshot_ms_mean": ms(self.snapshot_times),
+            "snapshot_ms_max": max(self.snapshot_times, default=0.0) * 1e3,
+            "blocked_ms_mean": ms(self.blocked_times),
+            "write_ms_mean": ms(self.write_times),
+            **self.spike_stats(self.saved_steps)
+        }
+
+
+def _rng_state():
+    import random
+
+    import numpy as np
+
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "cpu": torch.random.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.random.get_rng_state_all()
+    return state
@@ -0,0 +1,75 @@
+# batched_generation.py
+
+import torch
+
+from config import DO_SAMPLE, GENERATION_BATCH_SIZE, MAX_TOKENS, USE_GENERATION_CACHE
+from utils.chat_template import get_chat_template
+from utils.generation_cache import cache_key, get_generation_cache
+
+
+def length_buckets(lengths, batch_size):
+    """
+    Group indices into batches of similar length, longest first
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def left_pad(sequences, pad_token_id):
+    """
+    Left-pad token id lists into input_ids / attention_mask tensors
+    """
+    width = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, width - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+def generate_batched(model, tokenizer, samples, batch_size=GENERATION_BATCH_SIZE, max_new_tokens=MAX_TOKENS,
+                     use_cache=USE_GENERATION_CACHE, **generate_kwargs):
+    """
+    Generate responses for system/instruction samples in length-sorted, left-padded batches.
+    Yields (indices, responses) as each batch finishes; responses contain only the new tokens.
+    """
+    generate_kwargs.setdefault("do_sample", DO_SAMPLE)
+    template = get_chat_template(tokenizer)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    model_id = model.name_or_path
+    params = {"max_new_tokens": max_new_tokens, **generate_kwargs}
+    cache = get_generation_cache() if use_cache else None
+
+    keys = [cache_key(model_id, params, system=s["system"], instruction=s["instruction"]) for s in samples]
+    pending, cached_indices, cached_responses = [], [], []
+    for i, key in enumerate(keys):
+        cached = cache.get(key) if cache else None
+        if cached is None:
+            pending.append(i)
+        else:
+            cached_indices.append(i)
+            cached_responses.append(cached)
+    if cached_indices:
+        yield cached_indices, cached_responses
+
+    prompt_ids = [template.encode_prompt(samples[i]["system"], samples[i]["instruction"]) for i in pending]
+    for bucket in length_buckets([len(ids) for ids in prompt_ids], batch_size):
+        input_ids, attention_mask = left_pad([prompt_ids[b] for b in bucket], pad_token_id)
+        with torch.inference_mode():
+            output = model.generate(
+                input_ids=input_ids.to(model.device),
+                attention_mask=attention_mask.to(model.device),
+                max_new_tokens=max_new_tokens,
+                pad_token_id=pad_token_id,
+                **generate_kwargs
+            )
+        new_tokens = output[:, input_ids.shape[1]:]
+        responses = [r.strip() for r in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+        indices = [pending[b] for b in bucket]
+        if cache:
+            for i, response in zip(indices, responses):
+                if response:
+                    cache.put(keys[i], response, model=model_id)
+        yield indices, responses
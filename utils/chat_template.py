@@ -0,0 +1,152 @@
+# chat_template.py
+
+from functools import lru_cache
+
+TEMPLATE_NAME = "chatml"
+IM_START = "<|im_start|>"
+IM_END = "<|im_end|>"
+
+
+def render_messages(messages, add_generation_prompt=True):
+    """
+    Render chat messages as a ChatML prompt string
+    """
+    parts = [f"{IM_START}{m['role']}\n{m['content']}{IM_END}\n" for m in messages]
+    if add_generation_prompt:
+        parts.append(f"{IM_START}assistant\n")
+    return "".join(parts)
+
+
+def render_prompt(system, instruction):
+    """
+    Render a system + user prompt ready for generation
+    """
+    return render_messages([
+        {"role": "system", "content": system},
+        {"role": "user", "content": instruction}
+    ])
+
+
+class ChatTemplate:
+    """
+    ChatML template that works on token ids instead of strings.
+
+    Role headers, the end-of-turn marker and system prompts are tokenized once
+    and cached; only message contents are tokenized per call, and prompts are
+    assembled by concatenating id lists. ChatML markers are special tokens, so
+    the result matches tokenizing the rendered string in one go.
+    """
+
+    def __init__(self, tokenizer, max_cached_contents=64):
+        self.tokenizer = tokenizer
+        self.max_cached_contents = max_cached_contents
+        self._headers = {}
+        self._cached_contents = {}
+        self.footer_ids = self._encode(f"{IM_END}\n")
+        self.prefix_ids = []
+        if getattr(tokenizer, "add_bos_token", False) and tokenizer.bos_token_id is not None:
+            self.prefix_ids = [tokenizer.bos_token_id]
+
+    def _encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def header_ids(self, role):
+        """
+        Token ids of the `<|im_start|>role\\n` header
+        """
+        if role not in self._headers:
+            self._headers[role] = self._encode(f"{IM_START}{role}\n")
+        return self._headers[role]
+
+    def cached_content_ids(self, content):
+        """
+        Token ids of a recurring content (system prompts), tokenized once
+        """
+        ids = self._cached_contents.get(content)
+        if ids is None:
+            ids = self._encode(content)
+            if len(self._cached_contents) >= self.max_cached_contents:
+                self._cached_contents.pop(next(iter(self._cached_contents)))
+            self._cached_contents[content] = ids
+        return ids
+
+    def _assemble(self, messages, content_ids, add_generation_prompt):
+        ids = list(self.prefix_ids)
+        for message, content in zip(messages, content_ids):
+            ids += self.header_ids(message["role"])
+            ids += content
+            ids += self.footer_ids
+        if add_generation_prompt is None:
+            add_generation_prompt = messages[-1]["role"] != "assistant"
+        if add_generation_prompt:
+            ids += self.header_ids("assistant")
+        return ids
+
+    def encode(self, messages, add_generation_prompt=True, max_length=None):
+        """
+        Encode chat messages into token ids.
+        add_generation_prompt=None appends the assistant header only when the
+        conversation does not already end with an assistant turn.
+        """
+        content_ids = [
+            self.cached_content_ids(m["content"]) if m["role"] == "system" else self._encode(m["content"])
+            for m in messages
+        ]
+        ids = self._assemble(messages, content_ids, add_generation_prompt)
+        return ids[:max_length] if max_length else ids
+
+    def encode_batch(self, batch_messages, add_generation_prompt=True, max_length=None):
+        """
+        Encode many conversations with a single batched tokenizer call
+        """
+        flat, positions = [], []
+        for messages in batch_messages:
+            for m in messages:
+                if m["role"] == "system":
+                    positions.append(self.cached_content_ids(m["content"]))
+                else:
+                    positions.append(len(flat))
+                    flat.append(m["content"])
+
+        encoded = self.tokenizer(flat, add_special_tokens=False)["input_ids"] if flat else []
+        content_ids = [encoded[p] if isinstance(p, int) else p for p in positions]
+
+        results, offset = [], 0
+        for messages in batch_messages:
+            ids = self._assemble(messages, content_ids[offset:offset + len(messages)], add_generation_prompt)
+            offset += len(messages)
+            results.append(ids[:max_length] if max_length else ids)
+        return results
+
+    def encode_with_labels(self, messages, ignore_index=-100):
+        """
+        Encode a conversation and return (input_ids, labels) where only assistant
+        contents and their end-of-turn markers are targets
+        """
+        ids = list(self.prefix_ids)
+        labels = [ignore_index] * len(ids)
+        for m in messages:
+            header = self.header_ids(m["role"])
+            content = self.cached_content_ids(m["content"]) if m["role"] == "system" else self._encode(m["content"])
+            body = content + self.footer_ids
+            ids += header + body
+            labels += [ignore_index] * len(header)
+            labels += body if m["role"] == "assistant" else [ignore_index] * len(body)
+        return ids, labels
+
+    def encode_prompt(self, system, instruction):
+        """
+        Encode a system + user prompt ready for generation
+        """
+        return self.encode([
+            {"role": "system", "content": system},
+            {"role": "user", "content": instruction}
+        ])
+
+
+@lru_cache(maxsize=8)
+def get_chat_template(tokenizer):
+    """
+    Shared ChatTemplate per tokenizer, so fragment caches survive across calls
+    """
+    return ChatTemplate(tokenizer)
@@ -1,14 +1,14 @@
 # data_preparation_utils.py
 
-from docx import Document
 import json
 from tqdm import tqdm
-from transformers import pipeline
-from config import SYSTEM_PROMPT
+from config import SYSTEM_PROMPT, GENERATION_BATCH_SIZE
 
 from utils.utils import load_model
-from utils.prompt_utils import build_prompt
-from utils.model_interactions import generate_response
+from utils.chat_template import get_chat_template
+from utils.docx_stream import iter_blocks
+from utils.batched_generation import generate_batched
+from utils.generation_cache import get_generation_cache
 
 import openai
 
@@ -16,18 +16,7 @@ def extract_blocks_from_docx(path):
     """
     Read a document and split it into meaningful blocks
     """
-    doc = Document(path)
-    blocks, current = [], []
-    for p in doc.paragraphs:
-        text = p.text.strip()
-        if text:
-            current.append(text)
-        elif current:
-            blocks.append("\n".join(current))
-            current = []
-    if current:
-        blocks.append("\n".join(current))
-    return blocks
+    return list(iter_blocks(path))
 
 def block_to_sample(dialog_text: str) -> dict:
     """
@@ -60,9 +49,17 @@ def is_valid_block(text):
     """
     return len(text.split()) > 5 and ("Kunde" in text or "Verkäufer" in text or "Du" in text)
 
-def prepare_dataset_from_docx(docx_path, output_path, model_id):
+def iter_samples_from_docx(path):
     """
-    Full cycle: from docx to ready .jsonl with answers
+    Lazily read, filter and convert the blocks of a document into samples
+    """
+    return (block_to_sample(b) for b in iter_blocks(path) if is_valid_block(b))
+
+def prepare_dataset_from_docx(docx_path, output_path, model_id, batch_size=GENERATION_BATCH_SIZE):
+    """
+    Full cycle: from docx to ready .jsonl with answers.
+    Samples are generated in length-sorted batches and written as each batch finishes,
+    so the output is in completion order, not document order.
     """
     print("📄 Reading and filtering blocks...")
     raw_blocks = extract_blocks_from_docx(docx_path)
@@ -73,28 +70,35 @@ def prepare_dataset_from_docx(docx_path, output_path, model_id):
 
     tokenizer, model = load_model(model_id=model_id)
 
-    generator = pipeline("text-generation", model=model, tokenizer=tokenizer,
-                         pad_token_id=tokenizer.eos_token_id, do_sample=False)
-
-    print("✏️ Generating answers...")
-    for s in tqdm(samples, desc="Generating"):
-        prompt = build_prompt(s["system"], s["instruction"])
-        s["response"] = generate_response(generator, prompt)
-
-    print(f"💾 Saving to {output_path}")
-    with open(output_path, "w", encoding="utf-8") as f:
-        for s in samples:
-            json.dump(s, f, ensure_ascii=False)
-            f.write("\n")
+    print(f"✏️ Generating answers, saving to {output_path}")
+    with open(output_path, "w", encoding="utf-8") as f, tqdm(total=len(samples), desc="Generating") as bar:
+        for indices, responses in generate_batched(model, tokenizer, samples, batch_size=batch_size):
+            for i, response in zip(indices, responses):
+                samples[i]["response"] = response
+                json.dump(samples[i], f, ensure_ascii=False)
+                f.write("\n")
+            f.flush()
+            bar.update(len(indices))
+
+    cache_stats = get_generation_cache().stats()
+    print(f"🗄 Generation cache: {cache_stats['session_hits']} hits, {cache_stats['session_misses']} misses")
     print("✅ Done!")
 
-def tokenize(example, tokenizer):
-    messages = example["messages"]
-    full_text = ""
-    for msg in messages:
-        full_text += f"<|im_start|>{msg['role']}\n{msg['content']}<|im_end|>\n"
-    full_text += "<|im_start|>assistant\n"  
-    return tokenizer(full_text, truncation=True, max_length=1024)
+def tokenize(example, tokenizer, max_length=1024):
+    """
+    Tokenize a chat example with the shared ChatML template
+    """
+    template = get_chat_template(tokenizer)
+    input_ids = template.encode(example["messages"], add_generation_prompt=None, max_length=max_length)
+    return {"input_ids": input_ids, "attention_mask": [1] * len(input_ids)}
+
+def tokenize_batch(batch, tokenizer, max_length=1024):
+    """
+    Batched variant of `tokenize` for `dataset.map(..., batched=True)`
+    """
+    template = get_chat_template(tokenizer)
+    input_ids = template.encode_batch(batch["messages"], add_generation_prompt=None, max_length=max_length)
+    return {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
 
 def format_to_messages(example):
     return {
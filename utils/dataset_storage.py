@@ -0,0 +1,275 @@
+# dataset_storage.py
+
+import argparse
+import json
+from pathlib import Path
+
+import pyarrow as pa
+
+from config import DATASET_STORAGE
+
+MANIFEST = "manifest.json"
+
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _records_table(records, schema=None):
+    """
+    Table of dict records; without a schema, fields and types are inferred from all
+    records (pa.Table.from_pylist only looks at the keys of the first one)
+    """
+    array = pa.array(records, type=pa.struct(list(schema)) if schema is not None else None)
+    return pa.Table.from_struct_array(array)
+
+
+def _write_shard(path, table, compression):
+    tmp_path = path.with_name(path.name + ".tmp")
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    tmp_path.replace(path)
+
+
+class ShardedDatasetWriter:
+    """
+    Streaming writer of records into Arrow IPC stream shards plus a manifest.
+    Uncompressed shards are memory-mapped zero-copy on load; zstd shards are smaller
+    on disk but decompressed when read.
+
+    The schema is unified across shards: fields that first appear in a later shard,
+    columns that were all null so far and int columns that turn into floats are
+    promoted, and shards written with an older schema are rewritten on close so all
+    shards share the final schema. Incompatible types (e.g. int and string) raise.
+    """
+
+    def __init__(self, output_dir, shard_rows=DATASET_STORAGE["shard_rows"],
+                 compression=DATASET_STORAGE["compression"], metadata=None):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_rows = shard_rows
+        self.compression = compression
+        self.metadata = metadata or {}
+        self.schema = None
+        self.shards = []
+        self.rows = 0
+        self._buffer = []
+        self._shard_schemas = []
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.shard_rows:
+            self._flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _unify(self, schema):
+        if self.schema is None:
+            return schema
+        try:
+            return pa.unify_schemas([self.schema, schema], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"Schema of shard {len(self.shards)} in {self.output_dir} "
+                             f"is incompatible with the earlier shards: {e}") from e
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = _records_table(self._buffer)
+        schema = self._unify(table.schema)
+        if not table.schema.equals(schema):
+            table = _records_table(self._buffer, schema)
+
+        name = f"shard-{len(self.shards):05d}.arrow"
+        _write_shard(self.output_dir / name, table, self.compression)
+
+        self.schema = schema
+        self._shard_schemas.append(schema)
+        self.shards.append({"file": name, "rows": table.num_rows})
+        self.rows += table.num_rows
+        self._buffer = []
+
+    def _conform_shards(self):
+        """Rewrite shards written before the schema was last promoted"""
+        for i, (shard, schema) in enumerate(zip(self.shards, self._shard_schemas)):
+            if schema.equals(self.schema):
+                continue
+            path = self.output_dir / shard["file"]
+            with pa.memory_map(str(path), "r") as source:
+                records = pa.ipc.open_stream(source).read_all().to_pylist()
+            _write_shard(path, _records_table(records, self.schema), self.compression)
+            self._shard_schemas[i] = self.schema
+
+    def close(self):
+        self._flush()
+        self._conform_shards()
+        manifest = {
+            "rows": self.rows,
+            "shards": self.shards,
+            "compression": self.compression,
+            "columns": self.schema.names if self.schema is not None else [],
+            "schema": {field.name: str(field.type) for field in self.schema} if self.schema is not None else {},
+            "metadata": self.metadata
+        }
+        with open(self.output_dir / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def read_manifest(dataset_dir):
+    path = Path(dataset_dir) / MANIFEST
+    if not path.exists():
+        raise FileNotFoundError(f"{dataset_dir} is not a shard directory (no {MANIFEST})")
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def open_table(dataset_dir, columns=None):
+    """
+    Memory-map all shards into one pyarrow Table (zero-copy for uncompressed shards)
+    """
+    dataset_dir = Path(dataset_dir)
+    tables = []
+    for shard in read_manifest(dataset_dir)["shards"]:
+        source = pa.memory_map(str(dataset_dir / shard["file"]), "r")
+        table = pa.ipc.open_stream(source).read_all()
+        tables.append(table.select(columns) if columns else table)
+    return pa.concat_tables(tables) if tables else pa.table({})
+
+
+def iter_records(dataset_dir, columns=None, batch_size=1024):
+    """
+    Stream records shard by shard without materializing the whole dataset
+    """
+    dataset_dir = Path(dataset_dir)
+    for shard in read_manifest(dataset_dir)["shards"]:
+        source = pa.memory_map(str(dataset_dir / shard["file"]), "r")
+        for batch in pa.ipc.open_stream(source):
+            if columns:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, batch_size):
+                yield from batch.slice(offset, batch_size).to_pylist()
+
+
+def load_hf_dataset(dataset_dir):
+    """
+    Hugging Face Dataset backed by the memory-mapped shards (no copy, no re-parsing)
+    """
+    from datasets import Dataset, concatenate_datasets
+
+    dataset_dir = Path(dataset_dir)
+    parts = [Dataset.from_file(str(dataset_dir / s["file"])) for s in read_manifest(dataset_dir)["shards"]]
+    if not parts:
+        raise ValueError(f"{dataset_dir} has no shards (the dataset was written without records)")
+    return concatenate_datasets(parts) if len(parts) > 1 else parts[0]
+
+
+def load_training_dataset(path):
+    """
+    Dataset from a .jsonl file or an Arrow shard directory
+    """
+    path = Path(path)
+    if path.is_dir():
+        return load_hf_dataset(path)
+    from datasets import load_dataset
+    return load_dataset("json", data_files=str(path), split="train")
+
+
+def iter_dataset_records(path):
+    """
+    Stream records from a .jsonl file or an Arrow shard directory
+    """
+    path = Path(path)
+    return iter_records(path) if path.is_dir() else read_jsonl(path)
+
+
+def record_to_messages(record):
+    """
+    Chat messages of a record (stored `messages` or system/instruction/response)
+    """
+    if "messages" in record:
+        return record["messages"]
+    return [
+        {"role": "system", "content": record["system"]},
+        {"role": "user", "content": record["instruction"]},
+        {"role": "assistant", "content": record["response"]}
+    ]
+
+
+def convert_jsonl(jsonl_path, output_dir, tokenizer=None, max_length=1024,
+                  shard_rows=DATASET_STORAGE["shard_rows"], compression=DATASET_STORAGE["compression"],
+                  tokenize_batch_size=256):
+    """
+    Convert a JSONL dataset to Arrow shards. With a tokenizer, `input_ids` and
+    `attention_mask` are stored next to the text so training skips re-tokenization.
+    """
+    metadata = {"source": str(jsonl_path)}
+    template = None
+    if tokenizer is not None:
+        from utils.chat_template import TEMPLATE_NAME, get_chat_template
+
+        template = get_chat_template(tokenizer)
+        metadata.update({
+            "tokenizer": tokenizer.name_or_path,
+            "template": TEMPLATE_NAME,
+            "max_length": max_length
+        })
+
+    def flush(writer, batch):
+        if template is not None:
+            encoded = template.encode_batch([record_to_messages(r) for r in batch],
+                                            add_generation_prompt=None, max_length=max_length)
+            for record, ids in zip(batch, encoded):
+                record["input_ids"] = ids
+                record["attention_mask"] = [1] * len(ids)
+        writer.write_many(batch)
+
+    with ShardedDatasetWriter(output_dir, shard_rows=shard_rows, compression=compression,
+                              metadata=metadata) as writer:
+        batch = []
+        for record in read_jsonl(jsonl_path):
+            batch.append(record)
+            if len(batch) >= tokenize_batch_size:
+                flush(writer, batch)
+                batch = []
+        if batch:
+            flush(writer, batch)
+
+    print(f"✅ {writer.rows} rows → {len(writer.shards)} shards in {output_dir}")
+    return read_manifest(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSONL datasets to memory-mappable Arrow shards")
+    parser.add_argument("input", help="JSONL file")
+    parser.add_argument("output_dir")
+    parser.add_argument("--tokenizer", default=None, help="Also store input_ids/attention_mask for this tokenizer")
+    parser.add_argument("--max-length", type=int, default=1024)
+    parser.add_argument("--shard-rows", type=int, default=DATASET_STORAGE["shard_rows"])
+    parser.add_argument("--compression", choices=["zstd", "lz4"], default=DATASET_STORAGE["compression"])
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+
+    convert_jsonl(args.input, args.output_dir, tokenizer=tokenizer, max_length=args.max_length,
+                  shard_rows=args.shard_rows, compression=args.compression)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# dedup.py
+
+import argparse
+import json
+import re
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def sample_text(sample):
+    """
+    Text used for near-duplicate detection: instruction + response, or user/assistant turns
+    """
+    if "messages" in sample:
+        return "\n".join(m["content"] for m in sample["messages"] if m["role"] != "system")
+    return f"{sample.get('instruction', '')}\n{sample.get('response', '')}"
+
+
+def shingle_hashes(text, shingle_size=3):
+    """
+    32-bit hashes of word n-gram shingles of a normalized text
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` universal hash functions, computed with NumPy
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        # a, b < 2**32 keep a * x + b inside uint64 for 32-bit shingle hashes
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        if hashes.size == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = []
+
+    def add(self):
+        self.parent.append(len(self.parent))
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            # The lower index stays root, so clusters are keyed by their first sample
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def _iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def find_near_duplicates(input_path, num_perm=128, bands=16, threshold=0.8, shingle_size=3, seed=1):
+    """
+    One streaming pass: MinHash every sample, bucket signature bands with LSH and
+    merge candidates whose estimated Jaccard similarity reaches `threshold`.
+    Signatures live in a disk-backed memmap; in memory only the LSH buckets and
+    cluster ids grow with the number of samples.
+    Returns (union-find, per-sample text lengths, stats).
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm, seed)
+    uf = UnionFind()
+    buckets = [defaultdict(list) for _ in range(bands)]
+    lengths = []
+    candidates = merged = 0
+
+    capacity = 1024
+    tmp = tempfile.NamedTemporaryFile(suffix=".sig", delete=False)
+    tmp.close()
+    signatures = np.memmap(tmp.name, dtype=np.uint32, mode="w+", shape=(capacity, num_perm))
+
+    start = time.perf_counter()
+    try:
+        for idx, line in enumerate(_iter_jsonl(input_path)):
+            text = sample_text(json.loads(line))
+            lengths.append(len(text))
+            if idx >= capacity:
+                signatures.flush()
+                capacity *= 2
+                signatures = np.memmap(tmp.name, dtype=np.uint32, mode="r+", shape=(capacity, num_perm))
+            sig = hasher.signature(shingle_hashes(text, shingle_size))
+            signatures[idx] = sig
+            uf.add()
+
+            seen = set()
+            for band in range(bands):
+                key = sig[band * rows:(band + 1) * rows].tobytes()
+                bucket = buckets[band][key]
+                joined = False
+                for other in bucket:
+                    if other in seen:
+                        continue
+                    seen.add(other)
+                    candidates += 1
+                    if np.mean(signatures[other] == sig) >= threshold:
+                        if uf.find(other) != uf.find(idx):
+                            merged += 1
+                            uf.union(other, idx)
+                        joined = True
+                # A bucket keeps one member per cluster, so exact duplicates don't make it quadratic
+                if not joined:
+                    bucket.append(idx)
+    finally:
+        del signatures
+        Path(tmp.name).unlink(missing_ok=True)
+
+    stats = {
+        "samples": len(lengths),
+        "candidate_pairs": candidates,
+        "merged_pairs": merged,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+    return uf, lengths, stats
+
+
+def cluster_stats(uf, n):
+    roots = Counter(uf.find(i) for i in range(n))
+    sizes = Counter(roots.values())
+    duplicate_clusters = [size for size in roots.values() if size > 1]
+    return {
+        "clusters": len(roots),
+        "duplicate_clusters": len(duplicate_clusters),
+        "removed": n - len(roots),
+        "largest_cluster": max(roots.values(), default=0),
+        "cluster_size_histogram": dict(sorted(sizes.items()))
+    }
+
+
+def deduplicate_jsonl(input_path, output_path, num_perm=128, bands=16, threshold=0.8,
+                      shingle_size=3, keep="first", seed=1):
+    """
+    Write one representative per near-duplicate cluster of `input_path` to `output_path`.
+    keep="first" keeps the earliest sample of a cluster, keep="longest" the longest one.
+    """
+    uf, lengths, stats = find_near_duplicates(input_path, num_perm, bands, threshold, shingle_size, seed)
+    n = len(lengths)
+
+    representative = {}
+    for i in range(n):
+        root = uf.find(i)
+        best = representative.get(root)
+        if best is None or (keep == "longest" and lengths[i] > lengths[best]):
+            representative[root] = i
+    keep_ids = set(representative.values())
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as out:
+        for idx, line in enumerate(_iter_jsonl(input_path)):
+            if idx in keep_ids:
+                out.write(line if line.endswith("\n") else line + "\n")
+
+    stats.update(cluster_stats(uf, n))
+    stats["kept"] = len(keep_ids)
+    print(f"🧹 {n} samples → {stats['kept']} kept, {stats['removed']} near-duplicates removed "
+          f"in {stats['duplicate_clusters']} clusters (largest {stats['largest_cluster']})")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate removal for training JSONL (MinHash + LSH)")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity to merge")
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--bands", type=int, default=16)
+    parser.add_argument("--shingle-size", type=int, default=3, help="Words per shingle")
+    parser.add_argument("--keep", choices=["first", "longest"], default="first")
+    parser.add_argument("--stats", default=None, help="Write cluster stats to this JSON file")
+    args = parser.parse_args()
+
+    stats = deduplicate_jsonl(args.input, args.output, num_perm=args.num_perm, bands=args.bands,
+                              threshold=args.threshold, shingle_size=args.shingle_size, keep=args.keep)
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
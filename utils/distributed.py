@@ -0,0 +1,94 @@
+# distributed.py
+
+import os
+import sys
+from contextlib import contextmanager
+
+import torch
+import torch.distributed as dist
+
+
+def world_size():
+    return int(os.environ.get("WORLD_SIZE", 1))
+
+
+def rank():
+    return int(os.environ.get("RANK", 0))
+
+
+def local_rank():
+    return int(os.environ.get("LOCAL_RANK", 0))
+
+
+def is_distributed():
+    return world_size() > 1
+
+
+def is_main_process():
+    return rank() == 0
+
+
+def default_backend():
+    return "nccl" if torch.cuda.is_available() and dist.is_nccl_available() else "gloo"
+
+
+def init_distributed():
+    """
+    Join the torchrun process group (NCCL on GPUs, gloo on CPU). Trainer/accelerate
+    reuse an already initialized group. Returns the backend, or None when not launched
+    with torchrun.
+    """
+    if not is_distributed():
+        return None
+    backend = default_backend()
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank())
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    return backend
+
+
+def barrier():
+    if dist.is_available() and dist.is_initialized():
+        dist.barrier()
+
+
+@contextmanager
+def main_process_first():
+    """
+    Rank 0 runs the block first (e.g. filling an on-disk cache), the others follow
+    """
+    if not is_main_process():
+        barrier()
+    yield
+    if is_main_process():
+        barrier()
+
+
+def broadcast_object(obj):
+    """
+    Rank 0's value of `obj` on every rank
+    """
+    if not (dist.is_available() and dist.is_initialized()):
+        return obj
+    payload = [obj]
+    dist.broadcast_object_list(payload, src=0)
+    return payload[0]
+
+
+def silence_non_main_processes():
+    """
+    Drop stdout on ranks > 0 so progress output is printed once; stderr is kept
+    """
+    if not is_main_process():
+        sys.stdout = open(os.devnull, "w")
+
+
+def allreduce_summary(model):
+    """
+    Parameters synchronized by DDP: only those with requires_grad (the adapter)
+    """
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    frozen = sum(p.numel() for p in model.parameters() if not p.requires_grad)
+    grad_bytes = sum(p.numel() * p.element_size() for p in model.parameters() if p.requires_grad)
+    return {"trainable_params": trainable, "frozen_params": frozen, "allreduce_mb_per_step": grad_bytes / 1024 ** 2}
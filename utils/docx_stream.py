@@ -0,0 +1,62 @@
+# docx_stream.py
+
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+BODY = W_NS + "body"
+PARAGRAPH = W_NS + "p"
+TEXT = W_NS + "t"
+TAB = W_NS + "tab"
+BREAKS = (W_NS + "br", W_NS + "cr")
+
+
+def iter_paragraphs(path):
+    """
+    Yield the text of top-level body paragraphs of a .docx, parsing document.xml incrementally.
+    Matches python-docx `Document.paragraphs` (table cells and text boxes are skipped).
+    """
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        # One text buffer per open paragraph: paragraphs nested in text boxes (w:txbxContent)
+        # or table cells collect their own text and leave the enclosing paragraph's alone
+        stack, buffers = [], []
+        for event, elem in iterparse(xml, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                if elem.tag == PARAGRAPH:
+                    buffers.append([])
+                continue
+
+            stack.pop()
+            tag = elem.tag
+            if tag == PARAGRAPH:
+                parts = buffers.pop()
+                if stack and stack[-1].tag == BODY:
+                    yield "".join(parts)
+            elif buffers:
+                if tag == TEXT:
+                    buffers[-1].append(elem.text or "")
+                elif tag == TAB:
+                    buffers[-1].append("\t")
+                elif tag in BREAKS:
+                    buffers[-1].append("\n")
+
+            # Detach finished paragraphs and body children so memory stays bounded
+            if stack and (tag == PARAGRAPH or stack[-1].tag == BODY):
+                stack[-1].remove(elem)
+
+
+def iter_blocks(path):
+    """
+    Yield blocks of consecutive non-empty paragraphs, separated by empty ones
+    """
+    current = []
+    for paragraph in iter_paragraphs(path):
+        text = paragraph.strip()
+        if text:
+            current.append(text)
+        elif current:
+            yield "\n".join(current)
+            current = []
+    if current:
+        yield "\n".join(current)
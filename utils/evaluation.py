@@ -0,0 +1,219 @@
+# evaluation.py
+
+import re
+import time
+
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+from config import GENERATION_BATCH_SIZE
+from utils.batched_generation import left_pad, length_buckets
+from utils.chat_template import get_chat_template
+from utils.lora_training import PeakMemoryMonitor
+
+DEFAULT_PROMPTS = [
+    "Q: Кто такой Альберт Эйнштейн?\nA:",
+    "Q: Объясни, как работает градиентный спуск простыми словами\nA:",
+    "Q: Придумай короткий диалог между учителем и учеником на тему экологии\nA:",
+    "Q: Переведи: 'I am testing a language model' и объясни перевод.\nA:",
+    "Q: Придумай фантастическое животное и опиши, где оно живёт\nA:"
+]
+
+_QA_SCAFFOLD = re.compile(r"^\s*Q:\s*|\s*A:\s*$")
+
+
+def prompt_to_messages(prompt, system_prompt=None):
+    """
+    "Q: ...\\nA:" prompt -> chat messages (the template provides the roles)
+    """
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    messages.append({"role": "user", "content": _QA_SCAFFOLD.sub("", prompt)})
+    return messages
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class StepTimer(BaseStreamer):
+    """
+    Streamer that timestamps every decoding step of a batched generate() call.
+    The first put() is the prompt, the second one the first generated token.
+    """
+
+    def __init__(self, eos_token_ids):
+        self.eos_token_ids = set(eos_token_ids)
+        self.start = None
+        self.step_times = []
+        self.finished_at = {}
+
+    def put(self, value):
+        if self.start is None:
+            self.start = time.perf_counter()
+            return
+        now = time.perf_counter()
+        self.step_times.append(now)
+        for row, token in enumerate(value.view(-1).tolist()):
+            if row not in self.finished_at and token in self.eos_token_ids:
+                self.finished_at[row] = (now, len(self.step_times))
+
+    def end(self):
+        pass
+
+
+def _eos_ids(model, tokenizer):
+    eos = model.generation_config.eos_token_id
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    return eos if isinstance(eos, list) else [eos]
+
+
+def generate_with_timings(model, tokenizer, batch_messages, batch_size=GENERATION_BATCH_SIZE, max_new_tokens=100,
+                          do_sample=False, temperature=0.2):
+    """
+    Generate responses for many conversations in length-sorted, left-padded batches.
+    Returns one dict per conversation (input order) with the response, TTFT,
+    total latency, decode tokens/sec and the peak memory of its batch.
+    """
+    template = get_chat_template(tokenizer)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    eos_ids = _eos_ids(model, tokenizer)
+    device = "cuda" if next(model.parameters()).is_cuda else "cpu"
+    generate_kwargs = {"do_sample": do_sample, "max_new_tokens": max_new_tokens, "pad_token_id": pad_token_id}
+    if do_sample:
+        generate_kwargs["temperature"] = temperature
+
+    prompt_ids = template.encode_batch(batch_messages)
+    results = [None] * len(prompt_ids)
+    for bucket in length_buckets([len(ids) for ids in prompt_ids], batch_size):
+        input_ids, attention_mask = left_pad([prompt_ids[i] for i in bucket], pad_token_id)
+        timer = StepTimer(eos_ids)
+        with PeakMemoryMonitor(device) as memory, torch.inference_mode():
+            output = model.generate(
+                input_ids=input_ids.to(model.device),
+                attention_mask=attention_mask.to(model.device),
+                streamer=timer,
+                **generate_kwargs
+            )
+        done_at = time.perf_counter()
+        new_tokens = output[:, input_ids.shape[1]:]
+        responses = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        if not timer.step_times:
+            # No decoding step (e.g. max_new_tokens=0): zero-token records instead of missing ones
+            started_at = timer.start if timer.start is not None else done_at
+            for row, i in enumerate(bucket):
+                results[i] = {
+                    "response": responses[row].strip(),
+                    "prompt_tokens": len(prompt_ids[i]),
+                    "new_tokens": 0,
+                    "batch_size": len(bucket),
+                    "ttft_sec": done_at - started_at,
+                    "latency_sec": done_at - started_at,
+                    "decode_tokens_per_sec": 0.0,
+                    "peak_memory_mb": memory.peak_bytes / 1024 ** 2
+                }
+            continue
+        first_token_at = timer.step_times[0]
+        last_step_at = timer.step_times[-1]
+
+        for row, i in enumerate(bucket):
+            end_at, steps = timer.finished_at.get(row, (last_step_at, len(timer.step_times)))
+            decode_time = end_at - first_token_at
+            results[i] = {
+                "response": responses[row].strip(),
+                "prompt_tokens": len(prompt_ids[i]),
+                "new_tokens": steps,
+                "batch_size": len(bucket),
+                "ttft_sec": first_token_at - timer.start,
+                "latency_sec": end_at - timer.start,
+                "decode_tokens_per_sec": (steps - 1) / decode_time if steps > 1 and decode_time > 0 else 0.0,
+                "peak_memory_mb": memory.peak_bytes / 1024 ** 2
+            }
+    return results
+
+
+def summarize(results):
+    """
+    p50/p95 aggregates over per-prompt results
+    """
+    summary = {"prompts": len(results)}
+    for metric in ("ttft_sec", "latency_sec", "decode_tokens_per_sec"):
+        values = [r[metric] for r in results]
+        summary[f"{metric}_p50"] = percentile(values, 50)
+        summary[f"{metric}_p95"] = percentile(values, 95)
+    summary["peak_memory_mb"] = max((r["peak_memory_mb"] for r in results), default=0.0)
+    return summary
+
+
+def run_evaluation(model, tokenizer, model_name, prompts=None, system_prompt=None, adapter=None, **generate_kwargs):
+    """
+    Evaluate one model (or the active adapter) on a prompt set
+    """
+    prompts = prompts or DEFAULT_PROMPTS
+    print(f"🔄 {model_name}{f' [{adapter}]' if adapter else ''}: {len(prompts)} prompts")
+    timings = generate_with_timings(model, tokenizer, [prompt_to_messages(p, system_prompt) for p in prompts],
+                                    **generate_kwargs)
+    results = []
+    for prompt, timing in zip(prompts, timings):
+        results.append({
+            "model": model_name,
+            "adapter": adapter,
+            "prompt": prompt,
+            **timing,
+            # Kept for older result files / summaries
+            "time_sec": round(timing["latency_sec"], 2)
+        })
+    summary = summarize(results)
+    print(f"⏱ TTFT p50 {summary['ttft_sec_p50'] * 1e3:.0f} ms / p95 {summary['ttft_sec_p95'] * 1e3:.0f} ms, "
+          f"latency p50 {summary['latency_sec_p50']:.2f}s / p95 {summary['latency_sec_p95']:.2f}s, "
+          f"decode p50 {summary['decode_tokens_per_sec_p50']:.1f} tokens/s, "
+          f"peak memory {summary['peak_memory_mb']:.0f} MB")
+    return results, summary
+
+
+def evaluate_adapters(base_model, tokenizer, model_name, adapters, prompts=None, **kwargs):
+    """
+    Evaluate several LoRA adapters (name -> path; None = base model) on one loaded base.
+    Adapters are attached to the same base weights and switched with set_adapter;
+    afterwards they are removed again, so base_model is left as it was passed in.
+    """
+    from peft import PeftModel
+
+    model = base_model
+    previous_adapter = base_model.active_adapter if isinstance(base_model, PeftModel) else None
+    added = []
+    runs = {}
+    try:
+        for name, path in adapters.items():
+            if path is None:
+                continue
+            if isinstance(model, PeftModel):
+                model.load_adapter(str(path), adapter_name=name)
+            else:
+                model = PeftModel.from_pretrained(base_model, str(path), adapter_name=name)
+            added.append(name)
+        model.eval()
+
+        for name, path in adapters.items():
+            if path is None:
+                if isinstance(model, PeftModel):
+                    with model.disable_adapter():
+                        runs[name] = run_evaluation(model, tokenizer, model_name, prompts, adapter=name, **kwargs)
+                else:
+                    runs[name] = run_evaluation(model, tokenizer, model_name, prompts, adapter=name, **kwargs)
+            else:
+                model.set_adapter(name)
+                runs[name] = run_evaluation(model, tokenizer, model_name, prompts, adapter=name, **kwargs)
+    finally:
+        # PeftModel.from_pretrained injects LoRA layers into base_model in place; take them out again
+        if model is not base_model:
+            model.unload()
+        else:
+            for name in added:
+                model.delete_adapter(name)
+            if previous_adapter is not None:
+                model.set_adapter(previous_adapter)
+    return runs
@@ -0,0 +1,173 @@
+# generation_cache.py
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import GENERATION_CACHE_PATH
+
+
+def cache_key(model, params, system=None, instruction=None, prompt=None):
+    """
+    Content hash of everything that determines a generation
+    """
+    payload = {
+        "model": model,
+        "params": params,
+        "system": system,
+        "instruction": instruction,
+        "prompt": prompt
+    }
+    text = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Persistent SQLite cache of generated responses keyed by content hash.
+    Writes are single transactions, so an interrupted run never leaves partial entries.
+    """
+
+    def __init__(self, path=GENERATION_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " size_bytes INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON generations(last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE generations SET hits = hits + 1, last_used = ? WHERE key = ?",
+                    (time.time(), key)
+                )
+            return row[0]
+
+    def put(self, key, response, model=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, model, response, size_bytes, created, last_used, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, response, len(response.encode("utf-8")), now, now)
+            )
+
+    def get_or_generate(self, key, generate, model=None):
+        """
+        Cached response for `key`, calling `generate()` and storing the result on a miss
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        response = generate()
+        if response:
+            self.put(key, response, model=model)
+        return response
+
+    def stats(self):
+        with self._lock:
+            entries, size, stored_hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hits), 0) FROM generations"
+            ).fetchone()
+            per_model = self._conn.execute(
+                "SELECT model, COUNT(*) FROM generations GROUP BY model"
+            ).fetchall()
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "size_mb": round(size / 1024 ** 2, 3),
+            "total_hits": stored_hits,
+            "session_hits": self.hits,
+            "session_misses": self.misses,
+            "session_hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries_per_model": dict(per_model)
+        }
+
+    def prune(self, max_bytes):
+        """
+        Delete least recently used entries until the cache fits in `max_bytes`
+        """
+        with self._lock, self._conn:
+            total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM generations").fetchone()[0]
+            removed = 0
+            if total > max_bytes:
+                rows = self._conn.execute("SELECT key, size_bytes FROM generations ORDER BY last_used").fetchall()
+                to_delete = []
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    to_delete.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM generations WHERE key = ?", to_delete)
+                removed = len(to_delete)
+        with self._lock:
+            self._conn.execute("VACUUM")
+        return removed
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM generations")
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache = None
+
+
+def get_generation_cache():
+    """
+    Process-wide cache at GENERATION_CACHE_PATH
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GenerationCache()
+    return _default_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or prune the generation cache")
+    parser.add_argument("command", choices=["stats", "prune", "clear"])
+    parser.add_argument("--path", default=str(GENERATION_CACHE_PATH))
+    parser.add_argument("--max-mb", type=float, default=500, help="Size bound for `prune`")
+    args = parser.parse_args()
+
+    cache = GenerationCache(args.path)
+    if args.command == "prune":
+        removed = cache.prune(int(args.max_mb * 1024 ** 2))
+        print(f"🧹 Removed {removed} entries")
+    elif args.command == "clear":
+        cache.clear()
+        print("🧹 Cache cleared")
+    print(json.dumps(cache.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# lora_training.py
+
+import json
+import threading
+import time
+from pathlib import Path
+
+import psutil
+import torch
+
+from config import (BATCH_SIZE_SEARCH, BNB_4BIT_CONFIG, LOGS_PATH, LORA_CONFIG, MAX_MEMORY, MODEL_CACHE_PATH,
+                    MODELS_PATH, TRAINING_ARGS, TRUST_REMOTE_CODE, USE_4BIT, USE_MODEL_CACHE)
+from utils.distributed import default_backend, is_distributed, local_rank, main_process_first
+from utils.model_cache import load_cached_model
+from utils.training_profiler import count_real_tokens
+
+_SIZE_UNITS = {"TIB": 1024 ** 4, "GIB": 1024 ** 3, "MIB": 1024 ** 2, "KIB": 1024,
+               "TB": 10 ** 12, "GB": 10 ** 9, "MB": 10 ** 6, "KB": 10 ** 3, "B": 1}
+
+
+def parse_memory_size(value):
+    """
+    "12GiB" / "16GB" / 1024 -> bytes
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().upper()
+    for unit, factor in _SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(float(text))
+
+
+def memory_budget(max_memory=MAX_MEMORY):
+    """
+    (device, bytes) the training run may use: GPU 0 when available, else CPU RAM
+    """
+    if torch.cuda.is_available() and 0 in max_memory:
+        return "cuda", parse_memory_size(max_memory[0])
+    return "cpu", parse_memory_size(max_memory.get("cpu", psutil.virtual_memory().total))
+
+
+def load_model_for_training(model_id, use_4bit=USE_4BIT, lora_config=LORA_CONFIG, max_memory=MAX_MEMORY):
+    """
+    Base model (4-bit on GPU when enabled) wrapped with the LoRA adapter from config
+    """
+    from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+    from transformers import AutoTokenizer, BitsAndBytesConfig
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=TRUST_REMOTE_CODE)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    print(f"🔄 Loading model for training: {model_id}")
+    if torch.cuda.is_available():
+        quantize = use_4bit
+        if is_distributed():
+            # DDP: one full replica per process on its own GPU
+            kwargs = {"device_map": {"": local_rank()}, "torch_dtype": "auto"}
+        else:
+            kwargs = {"device_map": "auto", "max_memory": max_memory, "torch_dtype": "auto"}
+        if quantize:
+            kwargs["quantization_config"] = BitsAndBytesConfig(**{
+                **BNB_4BIT_CONFIG,
+                "bnb_4bit_compute_dtype": getattr(torch, BNB_4BIT_CONFIG["bnb_4bit_compute_dtype"])
+            })
+    else:
+        # bitsandbytes 4-bit needs CUDA
+        quantize = False
+        kwargs = {"torch_dtype": torch.float32}
+
+    # Rank 0 quantizes and saves the artifact; the other ranks then load it from disk.
+    # No in-process reuse: get_peft_model modifies the base model in place
+    with main_process_first():
+        model = load_cached_model(model_id, MODEL_CACHE_PATH, use_cache=USE_MODEL_CACHE, reuse=False,
+                                  trust_remote_code=TRUST_REMOTE_CODE, **kwargs)
+    model.config.use_cache = False
+    if quantize:
+        model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=False)
+    model = get_peft_model(model, LoraConfig(**lora_config))
+    model.print_trainable_parameters()
+    return model, tokenizer
+
+
+def set_gradient_checkpointing(model, enabled):
+    if enabled:
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    else:
+        model.gradient_checkpointing_disable()
+
+
+class PeakMemoryMonitor:
+    """
+    Peak memory inside a `with` block: CUDA allocator peak on GPU,
+    RSS sampled by a background thread on CPU
+    """
+
+    def __init__(self, device, interval=0.005):
+        self.device = device
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+            self.peak_bytes = torch.cuda.max_memory_allocated()
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self.peak_bytes, psutil.Process().memory_info().rss)
+
+
+def _is_oom(error):
+    if torch.cuda.is_available() and isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    message = str(error).lower()
+    return "out of memory" in message or "can't allocate memory" in message
+
+
+def probe_micro_batch(model, batches, micro_batch, gradient_checkpointing, device, budget_bytes):
+    """
+    Run one warm-up and len(batches) - 1 measured forward/backward/optimizer steps.
+    Adapter weights are restored afterwards so probing does not train the model.
+    """
+    set_gradient_checkpointing(model, gradient_checkpointing)
+    model.train()
+    trainable = [p for p in model.parameters() if p.requires_grad]
+    snapshot = [p.detach().clone() for p in trainable]
+    optimizer = torch.optim.AdamW(trainable, lr=0.0)
+    result = {"micro_batch": micro_batch, "gradient_checkpointing": gradient_checkpointing}
+
+    try:
+        with PeakMemoryMonitor(device) as monitor:
+            tokens, start = 0, None
+            for i, batch in enumerate(batches):
+                if i == 1:
+                    if device == "cuda":
+                        torch.cuda.synchronize()
+                    start = time.perf_counter()
+                batch = {k: v.to(model.device) for k, v in batch.items()}
+                model(**batch).loss.backward()
+                optimizer.step()
+                optimizer.zero_grad(set_to_none=True)
+                if i >= 1:
+                    tokens += count_real_tokens(batch)
+            if device == "cuda":
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start if start is not None else 0.0
+        result.update({
+            "fits": monitor.peak_bytes <= budget_bytes,
+            "peak_mb": round(monitor.peak_bytes / 1024 ** 2, 1),
+            "tokens_per_sec": round(tokens / elapsed, 1) if elapsed else 0.0
+        })
+    except RuntimeError as e:
+        if not _is_oom(e):
+            raise
+        result.update({"fits": False, "peak_mb": None, "tokens_per_sec": 0.0, "error": "out of memory"})
+    finally:
+        del optimizer
+        with torch.no_grad():
+            for p, saved in zip(trainable, snapshot):
+                p.copy_(saved)
+                p.grad = None
+        if device == "cuda":
+            torch.cuda.empty_cache()
+    return result
+
+
+def search_micro_batch(model, dataset, collator, effective_batch, search=BATCH_SIZE_SEARCH, max_memory=MAX_MEMORY):
+    """
+    Try micro-batch sizes (up to the effective batch) with and without gradient
+    checkpointing on the longest samples, and pick the fastest candidate that stays
+    within the MAX_MEMORY budget. Returns (best, results).
+    """
+    device, budget = memory_budget(max_memory)
+    budget_bytes = int(budget * search["memory_headroom"])
+    steps = search["probe_steps"] + 1
+    lengths = [len(ids) for ids in dataset["input_ids"]]
+    by_length = sorted(range(len(lengths)), key=lengths.__getitem__, reverse=True)
+    print(f"🔎 Micro-batch search on {device}, budget {budget_bytes / 1024 ** 3:.1f} GiB, "
+          f"effective batch {effective_batch}")
+
+    results = []
+    for gradient_checkpointing in search["gradient_checkpointing"]:
+        for micro_batch in search["candidates"]:
+            if micro_batch > effective_batch:
+                break
+            # Worst case: the longest samples, repeated if the dataset is small
+            indices = [by_length[i % len(by_length)] for i in range(micro_batch * steps)]
+            batches = [collator([dataset[j] for j in indices[k:k + micro_batch]])
+                       for k in range(0, len(indices), micro_batch)]
+            result = probe_micro_batch(model, batches, micro_batch, gradient_checkpointing, device, budget_bytes)
+            results.append(result)
+            status = "✅" if result["fits"] else "❌"
+            print(f"   {status} micro_batch={micro_batch:<3} gradient_checkpointing={str(gradient_checkpointing):<5} "
+                  f"peak={result['peak_mb']} MB  {result['tokens_per_sec']} tokens/s")
+            if not result["fits"]:
+                break
+
+    fitting = [r for r in results if r["fits"]]
+    if not fitting:
+        raise RuntimeError(f"No micro-batch size fits the memory budget {max_memory}")
+    best = max(fitting, key=lambda r: r["tokens_per_sec"])
+    set_gradient_checkpointing(model, best["gradient_checkpointing"])
+    return best, results
+
+
+def build_training_args(overrides=None):
+    """
+    TrainingArguments from config.TRAINING_ARGS with output/log dirs resolved
+    against the project paths (the config values are relative to notebooks/)
+    """
+    from transformers import TrainingArguments
+
+    args = {**TRAINING_ARGS, "output_dir": str(MODELS_PATH), "logging_dir": str(LOGS_PATH)}
+    if not torch.cuda.is_available():
+        args.update({"fp16": False, "bf16": False})
+    if is_distributed():
+        # Frozen base weights never get gradients, so DDP buckets hold only the adapter;
+        # skipping the unused-parameter graph walk saves a traversal per step
+        args.update({"ddp_backend": default_backend(), "ddp_find_unused_parameters": False})
+    args.update(overrides or {})
+    return TrainingArguments(**args)
+
+
+def save_search_report(path, best, results, effective_batch):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"effective_batch": effective_batch, "selected": best, "candidates": results}, f, indent=2)
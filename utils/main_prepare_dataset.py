@@ -0,0 +1,132 @@
+# main_prepare_dataset.py
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from config import DATA_PATH
+from utils.data_preparation_utils import iter_samples_from_docx
+from utils.dataset_storage import ShardedDatasetWriter
+
+
+def iter_docx_files(input_dir):
+    """
+    .docx files under `input_dir` in a stable order (Word lock files skipped)
+    """
+    return sorted(p for p in Path(input_dir).rglob("*.docx") if not p.name.startswith("~$"))
+
+
+def process_docx(path):
+    """
+    Ingest one document into samples; runs in a worker process
+    """
+    start = time.perf_counter()
+    samples = []
+    for s in iter_samples_from_docx(path):
+        s["metadata"]["source"] = Path(path).name
+        samples.append(s)
+    return {
+        "path": str(path),
+        "samples": samples,
+        "seconds": time.perf_counter() - start,
+        "bytes": os.path.getsize(path)
+    }
+
+
+def ordered_map(fn, items, workers, max_in_flight=None):
+    """
+    Map `fn` over `items` in a process pool, yielding results in input order
+    with at most `max_in_flight` results pending at once
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _JsonlWriter:
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        json.dump(record, self.f, ensure_ascii=False)
+        self.f.write("\n")
+
+    def close(self):
+        self.f.close()
+
+
+def ingest_directory(input_dir, output_path, workers=None, max_in_flight=None, output_format="jsonl"):
+    """
+    Stream samples from every .docx under `input_dir` into a JSONL file
+    (or an Arrow shard directory with output_format="arrow").
+    Output order follows the sorted file list regardless of worker scheduling.
+    """
+    workers = workers or os.cpu_count() or 1
+    files = iter_docx_files(input_dir)
+    print(f"📂 {len(files)} documents in {input_dir}, {workers} workers")
+
+    start = time.perf_counter()
+    total_samples, total_bytes, report = 0, 0, []
+    if output_format == "arrow":
+        writer = ShardedDatasetWriter(output_path, metadata={"source": str(input_dir)})
+    else:
+        writer = _JsonlWriter(output_path)
+    try:
+        for result in ordered_map(process_docx, files, workers, max_in_flight):
+            for s in result["samples"]:
+                writer.write(s)
+
+            n = len(result["samples"])
+            seconds = max(result["seconds"], 1e-9)
+            total_samples += n
+            total_bytes += result["bytes"]
+            report.append({
+                "file": Path(result["path"]).name,
+                "samples": n,
+                "seconds": round(result["seconds"], 3),
+                "mb_per_sec": round(result["bytes"] / 1024 ** 2 / seconds, 2),
+                "samples_per_sec": round(n / seconds, 1)
+            })
+            print(f"📄 {report[-1]['file']}: {n} samples in {seconds:.2f}s "
+                  f"({report[-1]['mb_per_sec']} MB/s, {report[-1]['samples_per_sec']} samples/s)")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {total_samples} samples from {len(files)} files in {elapsed:.2f}s "
+          f"({total_bytes / 1024 ** 2 / max(elapsed, 1e-9):.2f} MB/s), saved to {output_path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract training samples from a directory of .docx files")
+    parser.add_argument("--input-dir", default=str(DATA_PATH))
+    parser.add_argument("--output", default=str(DATA_PATH / "train_raw.jsonl"))
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Pending files kept in memory")
+    parser.add_argument("--format", choices=["jsonl", "arrow"], default="jsonl",
+                        help="arrow writes a shard directory at --output")
+    args = parser.parse_args()
+
+    ingest_directory(args.input_dir, args.output, workers=args.workers, max_in_flight=args.max_in_flight,
+                     output_format=args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,90 @@
 import os
 import json
-import time
 import pandas as pd
-from config import MODELS_PATH, DATA_PATH, LOGS_PATH
+from config import MODELS_PATH, DATA_PATH, LOGS_PATH, GENERATION_BATCH_SIZE
 
-from utils.prompt_utils import build_prompt
-from utils.model_interactions import generate_response
+from utils.evaluation import evaluate_adapters, run_evaluation
+from utils.results_store import get_results_store
+
+
+def _export(results, save_dir, name):
+    """
+    JSON/CSV copies for reading by hand; kept out of the store's import path
+    """
+    export_dir = os.path.join(save_dir, "export")
+    os.makedirs(export_dir, exist_ok=True)
+    with open(os.path.join(export_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    pd.DataFrame(results).to_csv(os.path.join(export_dir, f"{name}.csv"), index=False)
 
 
 def evaluate_model(model, tokenizer, model_name: str, 
                    prompts=None, max_new_tokens=100, save_dir="results",
-                   do_sample=False, temperature=0.2):
+                   do_sample=False, temperature=0.2, batch_size=GENERATION_BATCH_SIZE,
+                   system_prompt=None, adapter=None, prompt_set=None, export=False):
     """
-    Оценивает модель по фиксированным промптам, сохраняет результаты в JSON и CSV.
+    Оценивает модель по фиксированным промптам батчами через общий chat template.
+    Для каждого промпта пишет TTFT, задержку, скорость декодирования и пиковую память.
+    Результаты дописываются как новый запуск в results.sqlite в save_dir
+    (prompt_set по умолчанию — имя save_dir); export=True дополнительно пишет JSON и CSV в save_dir/export.
     """
-    if prompts is None:
-        prompts = [
-            "Q: Кто такой Альберт Эйнштейн?\nA:",
-            "Q: Объясни, как работает градиентный спуск простыми словами\nA:",
-            "Q: Придумай короткий диалог между учителем и учеником на тему экологии\nA:",
-            "Q: Переведи: 'I am testing a language model' и объясни перевод.\nA:",
-            "Q: Придумай фантастическое животное и опиши, где оно живёт\nA:"
-        ]
-
-    results = []
-    for prompt in prompts:
-        print(f"🔄 {model_name}: {prompt[:60]}")
-        full_prompt = build_prompt(prompt, model_name)
-        start_time = time.time()
-        output = generate_response(full_prompt, model, tokenizer, max_new_tokens=max_new_tokens,
-                                   do_sample=do_sample, temperature=temperature)
-        elapsed = round(time.time() - start_time, 2)
-        results.append({
-            "model": model_name,
-            "prompt": prompt,
-            "response": output.strip(),
-            "time_sec": elapsed
-        })
+    results, summary = run_evaluation(model, tokenizer, model_name, prompts=prompts,
+                                      system_prompt=system_prompt, adapter=adapter,
+                                      batch_size=batch_size, max_new_tokens=max_new_tokens,
+                                      do_sample=do_sample, temperature=temperature)
 
-    # Сохраняем    
-    os.makedirs(save_dir, exist_ok=True)
+    # Сохраняем
+    params = {"max_new_tokens": max_new_tokens, "do_sample": do_sample, "temperature": temperature,
+              "batch_size": batch_size, "system_prompt": system_prompt}
+    store = get_results_store(save_dir)
+    run_id = store.add_run(results, model=model_name, adapter=adapter,
+                           prompt_set=prompt_set or os.path.basename(os.path.abspath(save_dir)),
+                           params=params, summary=summary)
+    store.close()
+    if export:
+        _export(results, save_dir, model_name)
 
-    json_path = os.path.join(save_dir, f"{model_name}.json")
-    csv_path = os.path.join(save_dir, f"{model_name}.csv")
+    print(f"✅ Результаты сохранены: {store.path} (run {run_id})")
 
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    return results
 
-    pd.DataFrame(results).to_csv(csv_path, index=False)
+def evaluate_adapter_set(base_model, tokenizer, model_name: str, adapters: dict,
+                         prompts=None, save_dir="results", prompt_set=None, export=False, **kwargs):
+    """
+    Оценивает несколько LoRA-адаптеров (имя -> путь, None = базовая модель) за один запуск,
+    не перезагружая базовую модель. Каждый адаптер — отдельный запуск в results.sqlite.
+    """
+    runs = evaluate_adapters(base_model, tokenizer, model_name, adapters, prompts=prompts, **kwargs)
 
-    print(f"✅ Результаты сохранены: {json_path}, {csv_path}")
+    store = get_results_store(save_dir)
+    prompt_set = prompt_set or os.path.basename(os.path.abspath(save_dir))
+    for adapter, (results, summary) in runs.items():
+        store.add_run(results, model=model_name, adapter=adapter, prompt_set=prompt_set, params=kwargs,
+                      summary=summary)
+        if export:
+            _export(results, save_dir, f"{model_name}__{adapter}")
+    store.close()
 
-    return results
+    print(f"✅ Результаты {len(runs)} адаптеров сохранены в {store.path}")
+    return runs
 
-def summarize_all_results(result_dir="results"):
+def summarize_all_results(result_dir="results", group_by=("model",), prompt_set=None, latest_only=False):
     """
-    Считывает все json-файлы с результатами моделей и объединяет в одну сводную таблицу.
+    Сводная таблица по всем запускам из results.sqlite (агрегация в SQL, без перечитывания файлов).
+    Старые json-файлы с результатами в result_dir импортируются один раз.
     Возвращает DataFrame и сохраняет его в CSV.
     """
-    summary = []
-    
-    for filename in os.listdir(result_dir):
-        if filename.endswith(".json"):
-            filepath = os.path.join(result_dir, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                for entry in data:
-                    summary.append(entry)
+    store = get_results_store(result_dir)
+    imported = store.import_directory(result_dir)
+    if imported:
+        print(f"📥 Импортировано старых файлов с результатами: {len(imported)}")
 
-    df = pd.DataFrame(summary)
-    
     # Агрегированные метрики
-    summary_table = (
-        df.groupby("model")
-        .agg(avg_time_sec=("time_sec", "mean"), prompt_count=("prompt", "count"))
-        .reset_index()
-        .sort_values(by="avg_time_sec")
-    )
+    summary_table = store.summarize(group_by, prompt_set=prompt_set, latest_only=latest_only)
+    store.close()
 
     # Сохраняем
     summary_path = os.path.join(result_dir, "summary.csv")
     summary_table.to_csv(summary_path, index=False)
 
-    return summary_table
\ No newline at end of file
+    return summary_table
@@ -0,0 +1,173 @@
+# model_cache.py
+
+import argparse
+import hashlib
+import json
+import shutil
+import time
+import weakref
+from importlib import metadata
+from pathlib import Path
+
+ARTIFACT_META = "artifact.json"
+LIBRARIES = ["torch", "transformers", "accelerate", "bitsandbytes", "safetensors", "peft"]
+# Placement only: the same artifact can be loaded onto any device map
+PLACEMENT_KWARGS = {"device_map", "max_memory", "offload_folder", "offload_state_dict", "low_cpu_mem_usage"}
+
+# In-process reuse: a model stays shared while something still references it
+_loaded = weakref.WeakValueDictionary()
+
+
+def library_versions():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _describe(value):
+    """
+    JSON-stable form of a from_pretrained argument (BitsAndBytesConfig, torch.dtype, ...)
+    """
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {str(k): _describe(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_describe(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def artifact_key(model_id, load_kwargs):
+    """
+    Hash of everything that changes the stored weights: model id (and local mtime),
+    quantization config, dtype, target device type and library versions
+    """
+    import torch
+
+    weights = {k: _describe(v) for k, v in load_kwargs.items() if k not in PLACEMENT_KWARGS}
+    source = Path(model_id)
+    payload = {
+        "model_id": str(model_id),
+        "source_mtime": source.joinpath("config.json").stat().st_mtime_ns if source.joinpath("config.json").exists()
+        else None,
+        "load_kwargs": weights,
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "versions": library_versions()
+    }
+    text = json.dumps(payload, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24], payload
+
+
+def artifact_path(cache_dir, model_id, key):
+    name = str(model_id).strip("/").replace("/", "--")
+    return Path(cache_dir) / f"{name}-{key}"
+
+
+def _save_artifact(model, path, payload):
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        model.save_pretrained(tmp, safe_serialization=True)
+        with open(tmp / ARTIFACT_META, "w", encoding="utf-8") as f:
+            json.dump({**payload, "created": time.time()}, f, indent=2)
+        tmp.rename(path)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_cached_model(model_id, cache_dir, use_cache=True, reuse=True, **load_kwargs):
+    """
+    AutoModelForCausalLM.from_pretrained with an on-disk artifact cache.
+
+    The first load quantizes from the source weights as usual and saves the result
+    (quantized weights + quantization config) as safetensors under `cache_dir`.
+    Later loads read that artifact, memory-mapped, without re-quantizing. With
+    `reuse`, a model still alive in this process is returned as is.
+    A report (source, timings, artifact path) is attached as `model.load_report`.
+    """
+    from transformers import AutoModelForCausalLM
+
+    key, payload = artifact_key(model_id, load_kwargs)
+    placement = json.dumps(_describe({k: v for k, v in load_kwargs.items() if k in PLACEMENT_KWARGS}), sort_keys=True)
+    if reuse:
+        model = _loaded.get((key, placement))
+        if model is not None:
+            print(f"♻️ Reusing loaded model: {model_id}")
+            model.load_report = {**model.load_report, "source": "memory", "load_sec": 0.0}
+            return model
+
+    path = artifact_path(cache_dir, model_id, key)
+    start = time.perf_counter()
+    report = {"model_id": str(model_id), "key": key, "artifact": str(path), "save_sec": None}
+    if use_cache and (path / ARTIFACT_META).exists():
+        # The quantization config is stored with the artifact
+        kwargs = {k: v for k, v in load_kwargs.items() if k != "quantization_config"}
+        model = AutoModelForCausalLM.from_pretrained(path, **kwargs)
+        report.update(source="artifact", load_sec=time.perf_counter() - start)
+        print(f"⚡ Loaded {model_id} from artifact cache in {report['load_sec']:.1f}s ({path.name})")
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_id, **load_kwargs)
+        report.update(source="model", load_sec=time.perf_counter() - start)
+        print(f"🔄 Loaded {model_id} from source weights in {report['load_sec']:.1f}s")
+        if use_cache:
+            save_start = time.perf_counter()
+            try:
+                _save_artifact(model, path, payload)
+                report["save_sec"] = time.perf_counter() - save_start
+                print(f"💾 Saved artifact in {report['save_sec']:.1f}s: {path}")
+            except Exception as e:
+                # e.g. offloaded modules or a bitsandbytes version without serialization
+                report["save_error"] = str(e)
+                print(f"⚠️ Could not save artifact for {model_id}: {e}")
+
+    model.load_report = report
+    if reuse:
+        _loaded[(key, placement)] = model
+    return model
+
+
+def list_artifacts(cache_dir):
+    artifacts = []
+    for meta in sorted(Path(cache_dir).glob(f"*/{ARTIFACT_META}")):
+        with open(meta, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        size = sum(p.stat().st_size for p in meta.parent.iterdir() if p.is_file())
+        artifacts.append({"path": str(meta.parent), "model_id": info["model_id"], "size_mb": size / 1024 ** 2,
+                          "created": info.get("created")})
+    return artifacts
+
+
+def main():
+    from config import MODEL_CACHE_PATH, MODEL_ID
+
+    parser = argparse.ArgumentParser(description="Quantized model artifact cache")
+    parser.add_argument("--dir", default=str(MODEL_CACHE_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show cached artifacts")
+    warm = sub.add_parser("warm", help="Build the artifact used by utils.utils.load_model")
+    warm.add_argument("--model", default=MODEL_ID)
+    warm.add_argument("--no-4bit", action="store_true")
+    sub.add_parser("clear", help="Delete all artifacts")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for a in list_artifacts(args.dir):
+            print(f"{a['size_mb']:>10.0f} MB  {a['model_id']}  {a['path']}")
+    elif args.command == "warm":
+        from utils.utils import load_model
+        _, model = load_model(args.model, load_4bit=not args.no_4bit, cache_dir=args.dir)
+        print(json.dumps(model.load_report, indent=2))
+    else:
+        shutil.rmtree(args.dir, ignore_errors=True)
+        print(f"🗑 Removed {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
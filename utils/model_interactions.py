@@ -1,9 +1,12 @@
-from config import MAX_TOKENS, BASE_DIR
+from config import MAX_TOKENS, BASE_DIR, USE_GENERATION_CACHE
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
 from pathlib import Path
 
+from utils.chat_template import render_prompt
+from utils.generation_cache import cache_key, get_generation_cache
+
 # load key
 env_path = BASE_DIR / ".env"
 load_dotenv(dotenv_path=env_path, override=True)
@@ -15,27 +18,45 @@ openai_key = openai_key.strip()
 # new client
 clientOpenAI = OpenAI(api_key=openai_key, project="proj_JaNxEwOgdIt5HgqdzL4eULHS")
 
-def generate_response(generator, prompt, max_tokens=MAX_TOKENS):
+def generate_response(generator, prompt, max_tokens=MAX_TOKENS, use_cache=USE_GENERATION_CACHE):
     """
     Generate text from the model
     """
-    out = generator(prompt, max_new_tokens=max_tokens)[0]["generated_text"]
-    return out
-
-def generate_response_openai(system: str, instruction: str, model="gpt-4", max_tokens=768) -> str:
-    response = clientOpenAI.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": instruction}
-        ],
-        temperature=0.7,
-        max_tokens=max_tokens
-    )
-    content = response.choices[0].message.content
-    if content is None:
-        return ""
-    return content.strip()
+    def generate():
+        return generator(prompt, max_new_tokens=max_tokens)[0]["generated_text"]
+
+    if not use_cache:
+        return generate()
+
+    model_id = generator.model.name_or_path
+    # Pipeline-level generation kwargs (do_sample, pad_token_id, ...) are part of the key
+    params = {"max_new_tokens": max_tokens, **getattr(generator, "_forward_params", {})}
+    key = cache_key(model_id, params, prompt=prompt)
+    return get_generation_cache().get_or_generate(key, generate, model=model_id)
+
+def generate_response_openai(system: str, instruction: str, model="gpt-4", max_tokens=768,
+                             temperature=0.7, use_cache=USE_GENERATION_CACHE) -> str:
+    def generate():
+        response = clientOpenAI.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": instruction}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        content = response.choices[0].message.content
+        if content is None:
+            return ""
+        return content.strip()
+
+    if not use_cache:
+        return generate()
+
+    params = {"max_tokens": max_tokens, "temperature": temperature}
+    key = cache_key(model, params, system=system, instruction=instruction)
+    return get_generation_cache().get_or_generate(key, generate, model=model)
 
 def build_prompt(system, instruction):
-    return f"<|system|>\n{system}\n<|user|>\n{instruction}\n<|assistant|>\n"
\ No newline at end of file
+    return render_prompt(system, instruction)
\ No newline at end of file
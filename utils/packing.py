@@ -0,0 +1,148 @@
+# packing.py
+
+from bisect import bisect_left, insort
+
+import torch
+
+IGNORE_INDEX = -100
+
+
+def best_fit_decreasing(lengths, max_length):
+    """
+    Assign sequence indices to bins of `max_length` tokens (best-fit decreasing)
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    bins = []
+    free = []  # sorted (remaining capacity, bin index)
+    for i in order:
+        length = min(lengths[i], max_length)
+        pos = bisect_left(free, (length, -1))
+        if pos < len(free):
+            remaining, b = free.pop(pos)
+            bins[b].append(i)
+            insort(free, (remaining - length, b))
+        else:
+            bins.append([i])
+            insort(free, (max_length - length, len(bins) - 1))
+    return bins
+
+
+def pack_examples(input_ids, max_length):
+    """
+    Concatenate tokenized samples into rows of at most `max_length` tokens.
+    Each row gets position_ids that restart at 0 for every sample, which marks
+    the sample boundaries for the collator.
+    """
+    input_ids = [ids[:max_length] for ids in input_ids]
+    packed = {"input_ids": [], "position_ids": []}
+    for bin_indices in best_fit_decreasing([len(ids) for ids in input_ids], max_length):
+        row_ids, row_positions = [], []
+        for i in bin_indices:
+            row_ids += input_ids[i]
+            row_positions += list(range(len(input_ids[i])))
+        packed["input_ids"].append(row_ids)
+        packed["position_ids"].append(row_positions)
+    return packed
+
+
+def pack_dataset(dataset, max_length=1024):
+    """
+    Pack a tokenized datasets.Dataset (with `input_ids`) into fixed-length rows
+    """
+    from datasets import Dataset
+
+    return Dataset.from_dict(pack_examples(dataset["input_ids"], max_length))
+
+
+def padding_stats(lengths, batch_size):
+    """
+    Share of real tokens when batches (in dataset order) are padded to their longest item
+    """
+    real = sum(lengths)
+    padded = sum(max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size])
+                 for i in range(0, len(lengths), batch_size))
+    return {"real_tokens": real, "computed_tokens": padded, "efficiency": real / padded if padded else 0.0}
+
+
+def packing_stats(packed, max_length):
+    """
+    Share of real tokens in packed rows padded to `max_length`
+    """
+    real = sum(len(ids) for ids in packed["input_ids"])
+    computed = len(packed["input_ids"]) * max_length
+    return {
+        "rows": len(packed["input_ids"]),
+        "real_tokens": real,
+        "computed_tokens": computed,
+        "efficiency": real / computed if computed else 0.0
+    }
+
+
+class PackedCollator:
+    """
+    Collator for packed rows.
+
+    mode="mask": pads rows to the longest row and builds a block-diagonal causal
+    4D attention mask so samples never attend to each other (eager/SDPA attention).
+    mask_dtype should match the model's compute dtype.
+    mode="flatten": concatenates the batch into one row and relies on position_ids
+    resets for boundaries (flash_attention_2 only).
+    Labels are -100 on padding and on the first token of every sample.
+    """
+
+    def __init__(self, pad_token_id, mode="mask", mask_dtype=torch.float32):
+        if mode not in ("mask", "flatten"):
+            raise ValueError(f"Unknown packing collator mode: {mode}")
+        self.pad_token_id = pad_token_id
+        self.mode = mode
+        self.mask_dtype = mask_dtype
+
+    def _labels(self, ids, positions):
+        labels = list(ids)
+        for t, p in enumerate(positions):
+            if p == 0:
+                labels[t] = IGNORE_INDEX
+        return labels
+
+    def __call__(self, features):
+        if self.mode == "flatten":
+            ids, positions, labels = [], [], []
+            for f in features:
+                ids += f["input_ids"]
+                positions += f["position_ids"]
+                labels += self._labels(f["input_ids"], f["position_ids"])
+            return {
+                "input_ids": torch.tensor([ids], dtype=torch.long),
+                "position_ids": torch.tensor([positions], dtype=torch.long),
+                "labels": torch.tensor([labels], dtype=torch.long)
+            }
+
+        width = max(len(f["input_ids"]) for f in features)
+        batch = len(features)
+        input_ids = torch.full((batch, width), self.pad_token_id, dtype=torch.long)
+        position_ids = torch.zeros((batch, width), dtype=torch.long)
+        labels = torch.full((batch, width), IGNORE_INDEX, dtype=torch.long)
+        min_value = torch.finfo(self.mask_dtype).min
+        attention_mask = torch.full((batch, 1, width, width), min_value, dtype=self.mask_dtype)
+        causal = torch.ones((width, width), dtype=torch.bool).tril()
+
+        for row, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[row, :n] = torch.tensor(f["input_ids"], dtype=torch.long)
+            position_ids[row, :n] = torch.tensor(f["position_ids"], dtype=torch.long)
+            labels[row, :n] = torch.tensor(self._labels(f["input_ids"], f["position_ids"]), dtype=torch.long)
+
+            starts = [t for t, p in enumerate(f["position_ids"]) if p == 0] + [n]
+            for start, end in zip(starts[:-1], starts[1:]):
+                block = causal[:end - start, :end - start]
+                attention_mask[row, 0, start:end, start:end].masked_fill_(block, 0.0)
+            # Padding rows attend to themselves only, which keeps softmax finite
+            for t in range(n, width):
+                attention_mask[row, 0, t, t] = 0.0
+
+        return {
+            "input_ids": input_ids,
+            "position_ids": position_ids,
+            "attention_mask": attention_mask,
+            "labels": labels
+        }
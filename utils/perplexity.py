@@ -0,0 +1,210 @@
+# perplexity.py
+
+import argparse
+import math
+import time
+from itertools import islice
+
+import torch
+import torch.nn.functional as F
+from transformers import TrainerCallback
+
+from config import MAX_SEQ_LENGTH
+from utils.chat_template import get_chat_template
+from utils.dataset_storage import iter_dataset_records, record_to_messages
+from utils.packing import IGNORE_INDEX
+from utils.training_profiler import excluded_from_step_time, tensorboard_dir
+
+
+def sliding_windows(input_ids, labels, max_length, stride):
+    """
+    Split an over-length sample into windows of `max_length` tokens advancing by
+    `stride`. Every target token is scored exactly once, in the window where it
+    has the most left context. Windows must overlap (stride < max_length): the
+    first token of a window has no context in it and is scored by the previous one.
+    """
+    if not 0 < stride < max_length:
+        raise ValueError(f"Sliding window stride must be between 1 and max_length - 1 "
+                         f"(got stride={stride}, max_length={max_length})")
+    if len(input_ids) <= max_length:
+        return [(input_ids, labels)]
+    windows, scored_until = [], 0
+    for begin in range(0, len(input_ids), stride):
+        end = min(begin + max_length, len(input_ids))
+        window_labels = [IGNORE_INDEX if t < scored_until else labels[t] for t in range(begin, end)]
+        windows.append((input_ids[begin:end], window_labels))
+        scored_until = end
+        if end == len(input_ids):
+            break
+    return windows
+
+
+def _token_batches(items, max_batch_tokens):
+    """
+    Length-sorted batches whose padded size stays within `max_batch_tokens`
+    """
+    items = sorted(items, key=lambda x: len(x[0]), reverse=True)
+    batch = []
+    for item in items:
+        # Sorted descending, so the first item sets the padded width
+        if batch and len(batch[0][0]) * (len(batch) + 1) > max_batch_tokens:
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+
+@torch.inference_mode()
+def _batch_nll(model, batch, pad_token_id):
+    width = max(len(ids) for ids, _ in batch)
+    input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+    labels = torch.full((len(batch), width), IGNORE_INDEX, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+    for row, (ids, target) in enumerate(batch):
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        labels[row, :len(ids)] = torch.tensor(target)
+        attention_mask[row, :len(ids)] = 1
+
+    device = next(model.parameters()).device
+    logits = model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)).logits
+    shift_logits = logits[:, :-1].float()
+    shift_labels = labels[:, 1:].to(device)
+    nll = F.cross_entropy(shift_logits.reshape(-1, shift_logits.size(-1)), shift_labels.reshape(-1),
+                          ignore_index=IGNORE_INDEX, reduction="sum")
+    return nll.item(), int((shift_labels != IGNORE_INDEX).sum()), int(attention_mask.sum())
+
+
+def evaluate_perplexity(model, tokenizer, path, max_length=MAX_SEQ_LENGTH, stride=None, max_batch_tokens=16384,
+                        chunk_size=512, max_samples=None):
+    """
+    Assistant-only perplexity over a held-out JSONL file (or Arrow shard directory).
+
+    Records are streamed from disk in chunks of `chunk_size`; each chunk is tokenized,
+    split into sliding windows when longer than `max_length`, and evaluated in
+    length-sorted batches of at most `max_batch_tokens` padded tokens.
+    """
+    stride = stride or max_length // 2
+    template = get_chat_template(tokenizer)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    was_training = model.training
+    model.eval()
+
+    total_nll, scored_tokens, processed_tokens, samples, windows = 0.0, 0, 0, 0, 0
+    start = time.perf_counter()
+    records = iter_dataset_records(path)
+    if max_samples:
+        records = islice(records, max_samples)
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            items = []
+            for record in chunk:
+                ids, labels = template.encode_with_labels(record_to_messages(record))
+                items += sliding_windows(ids, labels, max_length, stride)
+            samples += len(chunk)
+            windows += len(items)
+            for batch in _token_batches(items, max_batch_tokens):
+                nll, scored, processed = _batch_nll(model, batch, pad_token_id)
+                total_nll += nll
+                scored_tokens += scored
+                processed_tokens += processed
+    finally:
+        if was_training:
+            model.train()
+
+    elapsed = time.perf_counter() - start
+    mean_nll = total_nll / scored_tokens if scored_tokens else float("nan")
+    return {
+        "perplexity": math.exp(mean_nll) if scored_tokens else float("nan"),
+        "loss": mean_nll,
+        "samples": samples,
+        "windows": windows,
+        "scored_tokens": scored_tokens,
+        "processed_tokens": processed_tokens,
+        "seconds": elapsed,
+        "tokens_per_sec": processed_tokens / elapsed if elapsed else 0.0
+    }
+
+
+class PerplexityCallback(TrainerCallback):
+    """
+    Held-out perplexity every `eval_steps` optimizer steps (default: save_steps)
+    and at the end of training; logged to the Trainer state and TensorBoard (eval/).
+    The evaluation is marked with excluded_from_step_time(), so the throughput
+    profiler and the checkpoint step timer do not count it as step or save time.
+    """
+
+    def __init__(self, tokenizer, path, eval_steps=None, **eval_kwargs):
+        self.tokenizer = tokenizer
+        self.path = path
+        self.eval_steps = eval_steps
+        self.eval_kwargs = eval_kwargs
+        self.writer = None
+
+    def _evaluate(self, args, state, model):
+        if not state.is_world_process_zero:
+            return
+        with excluded_from_step_time():
+            result = evaluate_perplexity(model, self.tokenizer, self.path, **self.eval_kwargs)
+        state.log_history.append({"eval_perplexity": result["perplexity"], "eval_loss_assistant": result["loss"],
+                                  "step": state.global_step})
+        if self.writer is None:
+            from torch.utils.tensorboard import SummaryWriter
+            self.writer = SummaryWriter(log_dir=tensorboard_dir(args))
+        self.writer.add_scalar("eval/perplexity", result["perplexity"], state.global_step)
+        self.writer.add_scalar("eval/tokens_per_sec", result["tokens_per_sec"], state.global_step)
+        print(f"📉 Step {state.global_step}: perplexity {result['perplexity']:.3f} "
+              f"({result['scored_tokens']} tokens, {result['tokens_per_sec']:,.0f} tokens/s)")
+
+    def on_step_end(self, args, state, control, model=None, **kwargs):
+        every = self.eval_steps or args.save_steps
+        if every and state.global_step % every == 0:
+            self._evaluate(args, state, model)
+
+    def on_train_end(self, args, state, control, model=None, **kwargs):
+        every = self.eval_steps or args.save_steps
+        if not every or state.global_step % every:
+            self._evaluate(args, state, model)
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assistant-only perplexity over a held-out SFT dataset")
+    parser.add_argument("data", help="JSONL file or Arrow shard directory")
+    parser.add_argument("--model", required=True, help="Base model id or path")
+    parser.add_argument("--adapter", default=None, help="LoRA adapter directory")
+    parser.add_argument("--max-length", type=int, default=MAX_SEQ_LENGTH)
+    parser.add_argument("--stride", type=int, default=None, help="Sliding window stride, below --max-length (default: max_length / 2)")
+    parser.add_argument("--max-batch-tokens", type=int, default=16384)
+    parser.add_argument("--max-samples", type=int, default=None)
+    args = parser.parse_args()
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from config import TRUST_REMOTE_CODE
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=TRUST_REMOTE_CODE)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model,
+        torch_dtype="auto",
+        device_map="auto" if torch.cuda.is_available() else None,
+        trust_remote_code=TRUST_REMOTE_CODE
+    )
+    if args.adapter:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, args.adapter)
+
+    result = evaluate_perplexity(model, tokenizer, args.data, max_length=args.max_length, stride=args.stride,
+                                 max_batch_tokens=args.max_batch_tokens, max_samples=args.max_samples)
+    print(f"✅ Perplexity {result['perplexity']:.3f} (loss {result['loss']:.4f}) over {result['samples']} samples / "
+          f"{result['windows']} windows, {result['scored_tokens']} assistant tokens in {result['seconds']:.1f}s "
+          f"({result['tokens_per_sec']:,.0f} tokens/s)")
+
+
+if __name__ == "__main__":
+    main()
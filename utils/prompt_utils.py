@@ -1,15 +1,12 @@
 from config import MAX_TOKENS
+from utils.chat_template import render_messages, render_prompt
 
 def build_prompt(system, instruction):
-    return (
-        f"<|im_start|>system\n{system}<|im_end|>\n"
-        f"<|im_start|>user\n{instruction}<|im_end|>\n"
-        f"<|im_start|>assistant\n"
-    )
+    return render_prompt(system, instruction)
 
-# TODO: 
-def format_messages_as_prompt(messages):
-    pass
+def format_messages_as_prompt(messages, add_generation_prompt=True):
+    return render_messages(messages, add_generation_prompt=add_generation_prompt)
 
+# TODO: 
 def parse_response(response):
     pass
@@ -0,0 +1,244 @@
+# results_store.py
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from config import RESULTS_PATH
+
+RESULTS_DB = "results.sqlite"
+
+# Per-prompt metrics stored as columns; anything else in a result row goes to `extra`
+METRICS = ["time_sec", "ttft_sec", "latency_sec", "decode_tokens_per_sec", "new_tokens", "prompt_tokens",
+           "peak_memory_mb"]
+GROUP_COLUMNS = {"model", "adapter", "prompt_set", "run_id"}
+
+
+def _mean_or_none(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+class ResultsStore:
+    """
+    Append-only SQLite store of evaluation results.
+
+    Every evaluation is one run (model, adapter, prompt set) inserted in a single
+    transaction. Per-run aggregates are computed once at insert time, so summaries
+    over hundreds of runs are a GROUP BY over the small `runs` table.
+    """
+
+    def __init__(self, path=RESULTS_PATH / RESULTS_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        metric_columns = "".join(f" {m} REAL," for m in METRICS)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " adapter TEXT,"
+            " prompt_set TEXT,"
+            " created REAL NOT NULL,"
+            " source TEXT,"
+            " params TEXT,"
+            " prompt_count INTEGER NOT NULL,"
+            " avg_time_sec REAL, avg_ttft_sec REAL, avg_latency_sec REAL, avg_decode_tokens_per_sec REAL,"
+            " peak_memory_mb REAL, summary TEXT);"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " id INTEGER PRIMARY KEY,"
+            " run_id TEXT NOT NULL REFERENCES runs(run_id),"
+            " model TEXT NOT NULL,"
+            " adapter TEXT,"
+            " prompt_set TEXT,"
+            " prompt TEXT,"
+            " response TEXT,"
+            f"{metric_columns}"
+            " extra TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_runs_model ON runs(model, adapter, prompt_set);"
+            "CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id);"
+            "CREATE INDEX IF NOT EXISTS idx_results_model ON results(model, adapter, prompt_set);"
+        )
+        self._conn.commit()
+
+    def add_run(self, results, model=None, adapter=None, prompt_set=None, run_id=None, params=None, summary=None,
+                source=None):
+        """
+        Append one evaluation run; returns its run_id (existing run ids are skipped)
+        """
+        run_id = run_id or uuid.uuid4().hex
+        model = model or (results[0].get("model") if results else None) or "unknown"
+        adapter = adapter if adapter is not None else (results[0].get("adapter") if results else None)
+
+        rows = []
+        for r in results:
+            extra = {k: v for k, v in r.items() if k not in METRICS and k not in ("model", "adapter", "prompt",
+                                                                                     "response")}
+            rows.append((run_id, model, adapter, prompt_set, r.get("prompt"), r.get("response"),
+                         *[r.get(m) for m in METRICS], json.dumps(extra, ensure_ascii=False) if extra else None))
+
+        run = (
+            run_id, model, adapter, prompt_set, time.time(), source,
+            json.dumps(params, ensure_ascii=False, default=str) if params else None,
+            len(results),
+            _mean_or_none([r.get("time_sec") for r in results]),
+            _mean_or_none([r.get("ttft_sec") for r in results]),
+            _mean_or_none([r.get("latency_sec") for r in results]),
+            _mean_or_none([r.get("decode_tokens_per_sec") for r in results]),
+            max((r["peak_memory_mb"] for r in results if r.get("peak_memory_mb") is not None), default=None),
+            json.dumps(summary) if summary else None
+        )
+        placeholders = ", ".join("?" * (7 + len(METRICS)))
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone():
+                return run_id
+            self._conn.execute(f"INSERT INTO runs VALUES ({', '.join('?' * len(run))})", run)
+            self._conn.executemany(
+                f"INSERT INTO results (run_id, model, adapter, prompt_set, prompt, response, "
+                f"{', '.join(METRICS)}, extra) VALUES ({placeholders})",
+                rows
+            )
+        return run_id
+
+    def has_run(self, run_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM runs WHERE run_id = ?", (run_id,)).fetchone() is not None
+
+    def summarize(self, group_by=("model",), prompt_set=None, model=None, latest_only=False):
+        """
+        Aggregate runs with SQL (weighted by prompt count) into a DataFrame
+        """
+        import pandas as pd
+
+        group_by = list(group_by)
+        unknown = set(group_by) - GROUP_COLUMNS
+        if unknown:
+            raise ValueError(f"Cannot group by {sorted(unknown)}")
+        where, args = [], []
+        if prompt_set is not None:
+            where.append("prompt_set = ?")
+            args.append(prompt_set)
+        if model is not None:
+            where.append("model = ?")
+            args.append(model)
+        if latest_only:
+            # Only the newest run per (model, adapter, prompt_set)
+            where.append("created = (SELECT MAX(created) FROM runs r2 WHERE r2.model = runs.model"
+                         " AND r2.adapter IS runs.adapter AND r2.prompt_set IS runs.prompt_set)")
+        columns = ", ".join(group_by)
+
+        def weighted(column):
+            return (f"SUM({column} * prompt_count) / NULLIF(SUM(CASE WHEN {column} IS NOT NULL"
+                    f" THEN prompt_count END), 0) AS {column}")
+
+        query = (
+            f"SELECT {columns}, {weighted('avg_time_sec')}, SUM(prompt_count) AS prompt_count,"
+            f" COUNT(*) AS runs, {weighted('avg_ttft_sec')}, {weighted('avg_latency_sec')},"
+            f" {weighted('avg_decode_tokens_per_sec')}, MAX(peak_memory_mb) AS peak_memory_mb"
+            f" FROM runs {'WHERE ' + ' AND '.join(where) if where else ''}"
+            f" GROUP BY {columns} ORDER BY avg_time_sec"
+        )
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=args)
+
+    def results(self, run_id=None, model=None, prompt_set=None):
+        """
+        Per-prompt rows as a DataFrame
+        """
+        import pandas as pd
+
+        where, args = [], []
+        for column, value in (("run_id", run_id), ("model", model), ("prompt_set", prompt_set)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        query = f"SELECT * FROM results {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id"
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=args)
+
+    def import_file(self, path, prompt_set=None):
+        """
+        Import a legacy JSON (list of result rows) or CSV result file as one run.
+        The run id is derived from the file path, size and mtime, so re-importing
+        an unchanged file is a no-op.
+        """
+        path = Path(path)
+        stat = path.stat()
+        run_id = "import-" + hashlib.sha256(
+            f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")
+        ).hexdigest()[:24]
+        if self.has_run(run_id):
+            return None
+
+        if path.suffix == ".csv":
+            import pandas as pd
+            df = pd.read_csv(path)
+            results = df.astype(object).where(df.notna(), None).to_dict("records")
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        if not isinstance(results, list) or not results:
+            return None
+        return self.add_run(results, prompt_set=prompt_set or path.parent.name, run_id=run_id, source=str(path))
+
+    def import_directory(self, result_dir, prompt_set=None, pattern="*.json"):
+        """
+        Import every result file in a directory (summaries skipped); returns the new run ids
+        """
+        imported = []
+        for path in sorted(Path(result_dir).glob(pattern)):
+            if path.stem.endswith("_summary") or path.stem == "summary":
+                continue
+            run_id = self.import_file(path, prompt_set=prompt_set)
+            if run_id:
+                imported.append(run_id)
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_results_store(result_dir=RESULTS_PATH):
+    return ResultsStore(Path(result_dir) / RESULTS_DB)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation results store")
+    parser.add_argument("--dir", default=str(RESULTS_PATH), help="Directory holding results.sqlite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import legacy JSON/CSV result files")
+    imp.add_argument("path", help="Result file or directory")
+    imp.add_argument("--prompt-set", default=None)
+    imp.add_argument("--csv", action="store_true", help="Import *.csv instead of *.json from a directory")
+    summary = sub.add_parser("summary", help="Aggregate runs")
+    summary.add_argument("--group-by", nargs="+", default=["model"])
+    summary.add_argument("--prompt-set", default=None)
+    summary.add_argument("--latest", action="store_true", help="Newest run per model/adapter/prompt set only")
+    args = parser.parse_args()
+
+    store = get_results_store(args.dir)
+    if args.command == "import":
+        path = Path(args.path)
+        if path.is_dir():
+            run_ids = store.import_directory(path, args.prompt_set, "*.csv" if args.csv else "*.json")
+        else:
+            run_ids = [r for r in [store.import_file(path, args.prompt_set)] if r]
+        print(f"✅ Imported {len(run_ids)} runs into {store.path}")
+    else:
+        start = time.perf_counter()
+        table = store.summarize(args.group_by, prompt_set=args.prompt_set, latest_only=args.latest)
+        print(table.to_string(index=False))
+        print(f"⏱ {time.perf_counter() - start:.3f}s")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# tokenization.py
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from config import DATA_PATH
+from utils.chat_template import TEMPLATE_NAME, get_chat_template
+
+TOKENIZED_CACHE_DIR = DATA_PATH / "cache" / "tokenized"
+
+
+def file_fingerprint(path):
+    """
+    SHA-256 of a dataset file (or of every file in an Arrow shard directory)
+    """
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(file.name.encode("utf-8"))
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    Identity of a tokenizer: name, class, vocabulary size and special tokens
+    """
+    payload = {
+        "name": tokenizer.name_or_path,
+        "class": type(tokenizer).__name__,
+        "vocab_size": len(tokenizer),
+        "special_tokens": tokenizer.special_tokens_map
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def tokenization_cache_key(source_path, tokenizer, max_length):
+    payload = {
+        "source": file_fingerprint(source_path),
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "template": TEMPLATE_NAME,
+        "max_length": max_length
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def tokenize_records(batch, tokenizer, max_length):
+    """
+    Batched map function: chat messages (or system/instruction/response) -> input_ids
+    """
+    if "messages" in batch:
+        conversations = batch["messages"]
+    else:
+        conversations = [
+            [
+                {"role": "system", "content": system},
+                {"role": "user", "content": instruction},
+                {"role": "assistant", "content": response}
+            ]
+            for system, instruction, response in zip(batch["system"], batch["instruction"], batch["response"])
+        ]
+    template = get_chat_template(tokenizer)
+    input_ids = template.encode_batch(conversations, add_generation_prompt=None, max_length=max_length)
+    return {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+
+
+def tokenize_dataset(source_path, tokenizer, max_length=1024, num_proc=None, batch_size=256,
+                     cache_dir=TOKENIZED_CACHE_DIR):
+    """
+    Tokenize a JSONL file (or Arrow shard directory) for training, batched and in
+    parallel, and persist the result under a key of (source file hash, tokenizer,
+    template, max_length). Later calls with the same key load it memory-mapped.
+    """
+    from datasets import load_from_disk
+    from utils.dataset_storage import load_training_dataset
+
+    start = time.perf_counter()
+    key = tokenization_cache_key(source_path, tokenizer, max_length)
+    cached_path = Path(cache_dir) / key
+    if cached_path.exists():
+        dataset = load_from_disk(str(cached_path))
+        print(f"⚡ Loaded tokenized dataset from cache ({len(dataset)} rows) in {time.perf_counter() - start:.2f}s")
+        return dataset
+
+    num_proc = num_proc or max(1, min(8, (os.cpu_count() or 1) // 2))
+    # Worker processes tokenize in parallel already, the Rust thread pool would oversubscribe
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    dataset = load_training_dataset(source_path)
+    load_time = time.perf_counter() - start
+    # Below one batch per worker, starting the pool costs more than it saves
+    if len(dataset) < num_proc * batch_size:
+        num_proc = 1
+    tokenized = dataset.map(
+        tokenize_records,
+        batched=True,
+        batch_size=batch_size,
+        num_proc=num_proc if num_proc > 1 else None,
+        fn_kwargs={"tokenizer": tokenizer, "max_length": max_length},
+        remove_columns=dataset.column_names,
+        new_fingerprint=key,
+        desc="Tokenizing"
+    )
+    tokenize_time = time.perf_counter() - start - load_time
+
+    tmp_path = cached_path.with_name(key + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tokenized.save_to_disk(str(tmp_path))
+    tmp_path.replace(cached_path)
+
+    tokens = sum(len(ids) for ids in tokenized["input_ids"])
+    print(f"✂️ Tokenized {len(tokenized)} rows ({tokens} tokens) in {tokenize_time:.2f}s "
+          f"with {num_proc} process{'es' if num_proc > 1 else ''} ({tokens / max(tokenize_time, 1e-9):,.0f} tokens/s), "
+          f"cached at {cached_path}")
+    return load_from_disk(str(cached_path))
@@ -0,0 +1,276 @@
+# training_profiler.py
+
+import json
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+from transformers import TrainerCallback
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import TRAINING_PROFILER
+
+
+_excluded_seconds = 0.0
+
+
+@contextmanager
+def excluded_from_step_time():
+    """
+    Mark work done from a callback between or inside training steps (e.g. held-out
+    evaluation) so ThroughputProfilerCallback and StepIntervalTimer leave it out of
+    step time, data wait and step intervals
+    """
+    global _excluded_seconds
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _excluded_seconds += time.perf_counter() - start
+
+
+def excluded_time():
+    """
+    Total seconds spent in excluded_from_step_time() blocks so far
+    """
+    return _excluded_seconds
+
+
+def tensorboard_dir(args):
+    """
+    TensorBoard directory of a run: TrainingArguments.logging_dir where it exists
+    (transformers 4.x), otherwise what transformers 5 uses (TENSORBOARD_LOGGING_DIR
+    or <output_dir>/runs)
+    """
+    logging_dir = getattr(args, "logging_dir", None) or os.getenv("TENSORBOARD_LOGGING_DIR")
+    return os.path.expanduser(logging_dir) if logging_dir else os.path.join(args.output_dir, "runs")
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def count_real_tokens(kwargs):
+    """
+    Non-padding tokens in a forward call: attention_mask sum for 2D masks; for the
+    4D block-diagonal masks of packed rows (PackedCollator mode="mask", filled with
+    finfo.min) the positions that attend to or are attended by another position,
+    since padding only attends to itself; every position otherwise (flattened rows)
+    """
+    input_ids = kwargs.get("input_ids")
+    if input_ids is None:
+        return 0
+    attention_mask = kwargs.get("attention_mask")
+    if attention_mask is not None and attention_mask.dim() == 2:
+        return int(attention_mask.sum())
+    if attention_mask is not None and attention_mask.dim() == 4:
+        allowed = attention_mask[:, 0] == 0
+        return int(((allowed.sum(dim=-1) > 1) | (allowed.sum(dim=-2) > 1)).sum())
+    return input_ids.numel()
+
+
+class ThroughputProfilerCallback(TrainerCallback):
+    """
+    Per-step training profile written to TensorBoard (under profile/) and to a JSON summary.
+
+    For every optimizer step it records wall time, the forward / backward / optimizer
+    split, data-loader wait (gap between the end of one step and the start of the next,
+    which is where the Trainer fetches the batches of the next step), non-padding tokens/sec
+    and memory high-water marks. `profile_steps=(start, end)` additionally captures a
+    torch.profiler trace for those steps into <logging dir>/profiler.
+    The optimizer split needs transformers>=4.41 (on_pre_optimizer_step); with older
+    versions it is counted in backward_other.
+    """
+
+    def __init__(self, summary_path=None, profile_steps=TRAINING_PROFILER["profile_steps"],
+                 warmup_steps=TRAINING_PROFILER["warmup_steps"], sync_cuda=TRAINING_PROFILER["sync_cuda"]):
+        self.summary_path = summary_path
+        self.profile_steps = profile_steps
+        self.warmup_steps = warmup_steps
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.records = []
+        self.writer = None
+        self.profiler = None
+        self._hooks = []
+        self._reset_step()
+        self._last_step_end = None
+        self._excluded_at_step_end = 0.0
+
+    def _now(self):
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _reset_step(self):
+        self._step_start = None
+        self._excluded_at_step_start = 0.0
+        self._data_wait = 0.0
+        self._forward = 0.0
+        self._forward_start = None
+        self._optimizer_start = None
+        self._optimizer = 0.0
+        self._tokens = 0
+
+    # Forward hooks on the model measure forward time and count the tokens it sees
+
+    def _forward_pre_hook(self, module, args, kwargs):
+        if module.training and self._step_start is not None:
+            self._forward_start = self._now()
+            self._tokens += count_real_tokens(kwargs)
+
+    def _forward_hook(self, module, args, kwargs, output):
+        if self._forward_start is not None:
+            self._forward += self._now() - self._forward_start
+            self._forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        self.records = []
+        self._last_step_end = None
+        if model is not None:
+            self._hooks = [
+                model.register_forward_pre_hook(self._forward_pre_hook, with_kwargs=True),
+                model.register_forward_hook(self._forward_hook, with_kwargs=True)
+            ]
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        if state.is_world_process_zero:
+            from torch.utils.tensorboard import SummaryWriter
+            self.writer = SummaryWriter(log_dir=tensorboard_dir(args))
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self._step_start is not None:
+            # Gradient accumulation: later micro-batches of the same optimizer step
+            return
+        self._step_start = self._now()
+        self._excluded_at_step_start = excluded_time()
+        if self._last_step_end is not None:
+            excluded = self._excluded_at_step_start - self._excluded_at_step_end
+            self._data_wait = max(0.0, self._step_start - self._last_step_end - excluded)
+
+        if self.profile_steps and state.global_step == self.profile_steps[0] and state.is_world_process_zero:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(
+                activities=activities,
+                record_shapes=True,
+                profile_memory=True,
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(str(Path(tensorboard_dir(args)) / "profiler"))
+            )
+            self.profiler.start()
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self._optimizer_start = self._now()
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        if self._optimizer_start is not None:
+            self._optimizer += self._now() - self._optimizer_start
+            self._optimizer_start = None
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._step_start is None:
+            return
+        end = self._now()
+        # Evaluation run by another callback before this one is not training time
+        step_time = max(0.0, end - self._step_start - (excluded_time() - self._excluded_at_step_start))
+        record = {
+            "step": state.global_step,
+            "step_time": step_time,
+            "data_wait": self._data_wait,
+            "forward": self._forward,
+            "optimizer": self._optimizer,
+            "backward_other": max(0.0, step_time - self._forward - self._optimizer),
+            "tokens": self._tokens,
+            "tokens_per_sec": self._tokens / step_time if step_time > 0 else 0.0,
+            "peak_rss_mb": _peak_rss_mb()
+        }
+        if torch.cuda.is_available():
+            record["peak_gpu_allocated_mb"] = torch.cuda.max_memory_allocated() / 1024 ** 2
+            record["peak_gpu_reserved_mb"] = torch.cuda.max_memory_reserved() / 1024 ** 2
+        self.records.append(record)
+
+        if self.writer is not None:
+            for name, value in record.items():
+                if name != "step":
+                    self.writer.add_scalar(f"profile/{name}", value, state.global_step)
+
+        if self.profiler is not None and state.global_step >= self.profile_steps[1]:
+            self.profiler.stop()
+            self.profiler = None
+            print(f"🔬 torch.profiler trace saved to {Path(tensorboard_dir(args)) / 'profiler'}")
+
+        self._reset_step()
+        # Time from here to the next on_step_begin is spent fetching batches
+        self._last_step_end = time.perf_counter()
+        self._excluded_at_step_end = excluded_time()
+
+    def summary(self):
+        """
+        Aggregates over the recorded steps, excluding the first `warmup_steps`
+        """
+        records = self.records[self.warmup_steps:] or self.records
+        if not records:
+            return {}
+        total_time = sum(r["step_time"] + r["data_wait"] for r in records)
+        step_times = [r["step_time"] for r in records]
+        result = {
+            "steps": len(records),
+            "warmup_steps_skipped": len(self.records) - len(records),
+            "step_time_mean": statistics.mean(step_times),
+            "step_time_p50": _percentile(step_times, 50),
+            "step_time_p95": _percentile(step_times, 95),
+            "tokens_per_sec": sum(r["tokens"] for r in records) / total_time if total_time else 0.0,
+            "data_wait_share": sum(r["data_wait"] for r in records) / total_time if total_time else 0.0,
+            "forward_mean": statistics.mean(r["forward"] for r in records),
+            "backward_other_mean": statistics.mean(r["backward_other"] for r in records),
+            "optimizer_mean": statistics.mean(r["optimizer"] for r in records),
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in self.records)
+        }
+        if torch.cuda.is_available():
+            result["peak_gpu_allocated_mb"] = max(r["peak_gpu_allocated_mb"] for r in self.records)
+            result["peak_gpu_reserved_mb"] = max(r["peak_gpu_reserved_mb"] for r in self.records)
+        return result
+
+    def on_train_end(self, args, state, control, **kwargs):
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        if not state.is_world_process_zero:
+            return
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        summary = self.summary()
+        summary_path = Path(self.summary_path or Path(args.output_dir) / "profile_summary.json")
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "steps": self.records}, f, indent=2)
+
+        if summary:
+            print(f"⏱ {summary['steps']} steps: {summary['step_time_mean'] * 1e3:.0f} ms/step "
+                  f"(p95 {summary['step_time_p95'] * 1e3:.0f} ms), {summary['tokens_per_sec']:,.0f} tokens/s, "
+                  f"data wait {summary['data_wait_share']:.1%}, peak RSS {summary['peak_rss_mb']:.0f} MB")
+        print(f"💾 Profile summary saved to {summary_path}")
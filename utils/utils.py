@@ -3,10 +3,11 @@ from huggingface_hub import login
 from dotenv import load_dotenv
 
 from transformers import BitsAndBytesConfig
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 from transformers import pipeline
 
-from config import MAX_MEMORY, MODEL_ID, TRUST_REMOTE_CODE, DO_SAMPLE
+from config import MAX_MEMORY, MODEL_ID, TRUST_REMOTE_CODE, DO_SAMPLE, MODEL_CACHE_PATH, USE_MODEL_CACHE
+from utils.model_cache import load_cached_model
 
 import torch, platform
 
@@ -26,7 +27,8 @@ def login_huggingface():
 def load_tokenizer(model_id: str = MODEL_ID, trust_remote_code=TRUST_REMOTE_CODE):
     return AutoTokenizer.from_pretrained(model_id, trust_remote_code=trust_remote_code)
 
-def load_model(model_id: str = MODEL_ID, load_4bit=True, trust_remote_code=True, max_memory=MAX_MEMORY):
+def load_model(model_id: str = MODEL_ID, load_4bit=True, trust_remote_code=True, max_memory=MAX_MEMORY,
+               use_cache=USE_MODEL_CACHE, cache_dir=MODEL_CACHE_PATH):
 
     print(f"🔄 Loading model: {model_id}")
     tokenizer = load_tokenizer(model_id, trust_remote_code)
@@ -41,25 +43,18 @@ def load_model(model_id: str = MODEL_ID, load_4bit=True, trust_remote_code=True,
     else:
         bnb_config = None
 
+    load_kwargs = {
+        "device_map": "auto",
+        "torch_dtype": "auto",
+        "low_cpu_mem_usage": True,
+        "max_memory": max_memory,
+        "trust_remote_code": trust_remote_code
+    }
     if bnb_config:
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id,
-            device_map="auto",
-            torch_dtype="auto",
-            quantization_config=bnb_config,
-            low_cpu_mem_usage=True,
-            max_memory=max_memory,
-            trust_remote_code=trust_remote_code
-        )
-    else:
-        model = AutoModelForCausalLM.from_pretrained(
-            model_id,
-            device_map="auto",
-            torch_dtype="auto",
-            low_cpu_mem_usage=True,
-            max_memory=max_memory,
-            trust_remote_code=trust_remote_code
-        )
+        load_kwargs["quantization_config"] = bnb_config
+
+    # Quantized once, then memory-mapped from the artifact cache; reused while loaded
+    model = load_cached_model(model_id, cache_dir, use_cache=use_cache, **load_kwargs)
 
     print(f"✅ Model loaded successfully")
 